@@ -42,9 +42,43 @@ def create_app(config_class=Config):
     init_admin(app, db)
     
     # 注册模板过滤器
-    from app.utils import register_template_filters
+    from app.utils import register_template_filters, VisitorTracker, TrafficClassifier, PostCounters, create_counter_backend, init_search_index, init_suggest_index, init_related_posts, init_tag_cloud
     register_template_filters(app)
     
+    # 访客记录队列（请求只入队，后台线程批量写库）
+    VisitorTracker(
+        app,
+        maxsize=app.config.get('VISITOR_QUEUE_SIZE', 10000),
+        batch_size=app.config.get('VISITOR_BATCH_SIZE', 200),
+        flush_interval=app.config.get('VISITOR_FLUSH_INTERVAL', 1.0),
+        rollup_hourly_days=app.config.get('VISITOR_ROLLUP_HOURLY_DAYS', 14),
+        hll_precision=app.config.get('HLL_PRECISION', 12),
+        sketch_flush_interval=app.config.get('SKETCH_FLUSH_INTERVAL', 10.0)
+    )
+    
+    # 爬虫/探活/预取请求过滤（在访客记录之前，不访问数据库）
+    app.extensions['traffic_classifier'] = TrafficClassifier(
+        skip_endpoints=app.config.get('TRACKING_SKIP_ENDPOINTS', []),
+        extra_bot_patterns=app.config.get('TRACKING_BOT_PATTERNS', []),
+        skip_prefetch=app.config.get('TRACKING_SKIP_PREFETCH', True),
+        skip_empty_user_agent=app.config.get('TRACKING_SKIP_EMPTY_UA', True)
+    )
+    
+    # 浏览量计数（进程内/共享内存/Redis，后台线程定期批量写库）
+    PostCounters(app, create_counter_backend(app), flush_interval=app.config.get('COUNTER_FLUSH_INTERVAL', 5.0))
+    
+    # 全文索引（SQLite用FTS5，MySQL用ngram全文索引，其余用进程内索引；保存文章时增量更新）
+    init_search_index(app)
+    
+    # 搜索联想的内存前缀索引
+    init_suggest_index(app)
+    
+    # 相关文章（TF-IDF近邻，文章增删改后增量重算）
+    init_related_posts(app)
+    
+    # 标签云（一次GROUP BY统计文章数，结果缓存到标签或文章发布状态变化）
+    init_tag_cloud(app)
+    
     return app
 
 from app import models
@@ -47,6 +47,7 @@ class PostModelView(AdminAuthMixin, ModelView):
             from app.utils import create_slug
             model.slug = create_slug(model.title)
             model.user_id = current_user.id
+        model.refresh_render()
 
 class CategoryModelView(AdminAuthMixin, ModelView):
     """分类管理视图"""
@@ -22,6 +22,11 @@ class SimpleModelView(AdminAuthMixin, ModelView):
     """简化的模型视图"""
     pass
 
+class PostModelView(SimpleModelView):
+    """文章视图，保存时生成渲染缓存"""
+    def on_model_change(self, form, model, is_created):
+        model.refresh_render()
+
 def init_admin(app, db):
     """初始化Flask-Admin（简化版）"""
     admin = Admin(
@@ -34,7 +39,7 @@ def init_admin(app, db):
     
     # 添加简化的模型视图
     admin.add_view(SimpleModelView(User, db.session, name='用户管理'))
-    admin.add_view(SimpleModelView(Post, db.session, name='文章管理'))
+    admin.add_view(PostModelView(Post, db.session, name='文章管理'))
     admin.add_view(SimpleModelView(Category, db.session, name='分类管理'))
     admin.add_view(SimpleModelView(Tag, db.session, name='标签管理'))
     admin.add_view(SimpleModelView(Comment, db.session, name='评论管理'))
@@ -3,12 +3,14 @@ from flask_sqlalchemy import SQLAlchemy
 from flask_login import UserMixin
 from werkzeug.security import generate_password_hash, check_password_hash
 from app import db, login
-import markdown
+from app.utils import compute_content_hash, render_markdown_bundle
 
 # 关联表
 post_tags = db.Table('post_tags',
     db.Column('post_id', db.Integer, db.ForeignKey('post.id'), primary_key=True),
-    db.Column('tag_id', db.Integer, db.ForeignKey('tag.id'), primary_key=True)
+    db.Column('tag_id', db.Integer, db.ForeignKey('tag.id'), primary_key=True),
+    # 主键以post_id开头，按标签筛选文章需要另建以tag_id开头的索引
+    db.Index('ix_post_tags_tag_post', 'tag_id', 'post_id')
 )
 
 class User(UserMixin, db.Model):
@@ -70,17 +72,79 @@ class Post(db.Model):
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     category_id = db.Column(db.Integer, db.ForeignKey('category.id'))
     
+    # 列表/首页按发布状态筛选后按时间或浏览量排序，分类页再加分类条件
+    __table_args__ = (
+        db.Index('ix_post_published_created', 'is_published', 'created_at'),
+        db.Index('ix_post_published_views', 'is_published', 'view_count'),
+        db.Index('ix_post_category_published_created', 'category_id', 'is_published', 'created_at'),
+    )
+    
     tags = db.relationship('Tag', secondary=post_tags, lazy='subquery',
                           backref=db.backref('posts', lazy=True))
     comments = db.relationship('Comment', backref='post', lazy='dynamic', cascade='all, delete-orphan')
+    render = db.relationship('PostRender', uselist=False, cascade='all, delete-orphan')
     
+    def refresh_render(self, force=False):
+        """内容变化时重新渲染，随文章一起提交；返回是否重新渲染"""
+        if not force and self.render and self.render.content_hash == compute_content_hash(self.content):
+            return False
+        bundle = render_markdown_bundle(self.content)
+        if self.render:
+            for field, value in bundle.items():
+                setattr(self.render, field, value)
+        else:
+            self.render = PostRender(**bundle)
+        return True
+
+    def get_render(self):
+        """获取与当前内容匹配的渲染结果，内容已变化时临时渲染（不落库）"""
+        content_hash = compute_content_hash(self.content)
+        if self.render and self.render.content_hash == content_hash:
+            return self.render
+        fallback = getattr(self, '_fallback_render', None)
+        if fallback is None or fallback.content_hash != content_hash:
+            fallback = self._fallback_render = PostRender(**render_markdown_bundle(self.content))
+        return fallback
+
     def get_html_content(self):
-        """将Markdown转换为HTML"""
-        return markdown.markdown(self.content, extensions=['fenced_code', 'tables', 'toc'])
+        """将Markdown转换为HTML（优先使用保存时的渲染结果）"""
+        return self.get_render().html
+
+    def get_toc(self):
+        return self.get_render().toc
+
+    def get_excerpt(self):
+        return self.summary or self.get_render().excerpt
+
+    def get_reading_time(self):
+        return self.get_render().reading_time
     
     def __repr__(self):
         return f'<Post {self.title}>'
 
+class PostRender(db.Model):
+    """文章渲染结果（保存文章时生成，按内容哈希校验是否过期）"""
+    post_id = db.Column(db.Integer, db.ForeignKey('post.id'), primary_key=True)
+    content_hash = db.Column(db.String(64), nullable=False)
+    html = db.Column(db.Text(16777215), nullable=False)
+    toc = db.Column(db.Text)
+    excerpt = db.Column(db.Text)
+    reading_time = db.Column(db.Integer, default=1)  # 分钟
+    rendered_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<PostRender {self.post_id}>'
+
+class PostNeighbor(db.Model):
+    """预计算的相关文章（按TF-IDF余弦相似度排名，由RelatedPostsEngine维护）"""
+    post_id = db.Column(db.Integer, db.ForeignKey('post.id', ondelete='CASCADE'), primary_key=True)
+    rank = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    neighbor_id = db.Column(db.Integer, db.ForeignKey('post.id', ondelete='CASCADE'), nullable=False, index=True)
+    score = db.Column(db.Float, nullable=False)
+
+    def __repr__(self):
+        return f'<PostNeighbor {self.post_id}#{self.rank} -> {self.neighbor_id}>'
+
 class Comment(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     content = db.Column(db.Text, nullable=False)
@@ -93,6 +157,10 @@ class Comment(db.Model):
     post_id = db.Column(db.Integer, db.ForeignKey('post.id'), nullable=False)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'))
 
+    __table_args__ = (
+        db.Index('ix_comment_post_approved_created', 'post_id', 'is_approved', 'created_at'),
+    )
+
     def __repr__(self):
         return f'<Comment by {self.author_name}>'
 
@@ -107,6 +175,10 @@ class Link(db.Model):
     sort_order = db.Column(db.Integer, default=0)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
+    __table_args__ = (
+        db.Index('ix_link_active_sort', 'is_active', 'sort_order'),
+    )
+
     def __repr__(self):
         return f'<Link {self.name}>'
 
@@ -181,5 +253,40 @@ class Visitor(db.Model):
     first_visit = db.Column(db.DateTime, default=datetime.utcnow)
     last_visit = db.Column(db.DateTime, default=datetime.utcnow)
 
+    # 每个IP一行（访问记录用upsert累加）；统计页按最近访问时间筛选
+    __table_args__ = (
+        db.Index('uq_visitor_ip_address', 'ip_address', unique=True),
+        db.Index('ix_visitor_last_visit', 'last_visit'),
+    )
+
     def __repr__(self):
         return f'<Visitor {self.ip_address}>'
+
+class VisitorRollup(db.Model):
+    """
+    访客按时段、国家、城市的汇总（VisitorTracker写库时增量累加，flask rebuild-visitor-rollups 重建）
+    period为hour/day/total，bucket为时段起点（UTC），total只有一个时段ROLLUP_TOTAL_BUCKET
+    """
+    period = db.Column(db.String(8), primary_key=True)
+    bucket = db.Column(db.DateTime, primary_key=True)
+    country = db.Column(db.String(100), primary_key=True)
+    city = db.Column(db.String(100), primary_key=True)
+    hits = db.Column(db.Integer, nullable=False, default=0)
+    visitors = db.Column(db.Integer, nullable=False, default=0)  # 时段内的不同访客
+    new_visitors = db.Column(db.Integer, nullable=False, default=0)  # 时段内首次访问的访客
+
+    def __repr__(self):
+        return f'<VisitorRollup {self.period} {self.bucket} {self.country}/{self.city}>'
+
+class VisitorSketch(db.Model):
+    """
+    访客去重的HyperLogLog草图（VisitorTracker在内存中累积，定期合并写入）
+    scope为site（scope_id=0，每个UTC日一行）或post（scope_id为文章id，day固定为SKETCH_TOTAL_DAY）
+    """
+    scope = db.Column(db.String(8), primary_key=True)
+    scope_id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    day = db.Column(db.Date, primary_key=True)
+    registers = db.Column(db.LargeBinary, nullable=False)  # HyperLogLog.to_bytes()
+
+    def __repr__(self):
+        return f'<VisitorSketch {self.scope} {self.scope_id} {self.day}>'
@@ -3,7 +3,7 @@ from flask_login import login_user, logout_user, login_required, current_user
 from werkzeug.utils import secure_filename
 from app import db
 from app.models import User, Post, Category, Tag, Comment, Link, Project, Timeline, SiteConfig
-from app.utils import create_slug, allowed_file
+from app.utils import create_slug, allowed_file, count_post_readers
 import os
 from datetime import datetime
 
@@ -85,8 +85,10 @@ def posts():
     page = request.args.get('page', 1, type=int)
     posts = Post.query.order_by(Post.created_at.desc()).paginate(
         page=page, per_page=20, error_out=False)
+    # 本页文章的独立读者（HyperLogLog估计值，一条查询）
+    readers = count_post_readers(post.id for post in posts.items)
     
-    return render_template('admin/posts.html', posts=posts)
+    return render_template('admin/posts.html', posts=posts, readers=readers)
 
 @bp.route('/posts/new', methods=['GET', 'POST'])
 @login_required
@@ -125,6 +127,7 @@ def new_post():
         if tag_ids:
             tags = Tag.query.filter(Tag.id.in_(tag_ids)).all()
             post.tags = tags
+        post.refresh_render()
         
         db.session.add(post)
         db.session.commit()
@@ -163,6 +166,7 @@ def edit_post(id):
         post.is_published = 'is_published' in request.form
         post.is_featured = 'is_featured' in request.form
         post.updated_at = datetime.utcnow()
+        post.refresh_render()
 
         db.session.commit()
         
@@ -1,7 +1,7 @@
 from flask import Blueprint, request, jsonify, current_app
 from app import db
-from app.models import Post, Comment, Visitor, SiteConfig
-from app.utils import get_weather_info, get_visitor_info
+from app.models import Post, Comment, Visitor, VisitorRollup, SiteConfig
+from app.utils import get_weather_info, get_visitor_info, keyset_paginate, encode_rank_cursor, decode_rank_cursor, ranked_page, search_posts, search_terms, highlight_text, search_snippet, get_visitor_summary, count_unique_visitors
 from datetime import datetime, timedelta
 import json
 
@@ -54,6 +54,16 @@ def visitor_info():
             'message': '访客信息不可用'
         })
 
+@bp.route('/visitor-stats')
+def visitor_stats():
+    """访客统计API（今日/近7天/近30天独立访客、24小时走势、国家分布，只读草图表和汇总表）"""
+    summary = get_visitor_summary()
+    summary['total_visitors'] = int(db.session.query(db.func.sum(VisitorRollup.new_visitors)).filter(
+        VisitorRollup.period == 'total').scalar() or 0)
+    response = jsonify({'success': True, 'data': summary})
+    response.headers['Cache-Control'] = 'public, max-age=60'
+    return response
+
 @bp.route('/stats')
 def stats():
     """获取网站统计信息"""
@@ -63,9 +73,8 @@ def stats():
     total_views = db.session.query(db.func.sum(Post.view_count)).scalar() or 0
     total_comments = Comment.query.filter_by(is_approved=True).count()
     
-    # 最近7天的访客统计
-    seven_days_ago = datetime.utcnow() - timedelta(days=7)
-    recent_visitors = Visitor.query.filter(Visitor.last_visit >= seven_days_ago).count()
+    # 最近7天的独立访客（合并每日草图的估计值）
+    recent_visitors = count_unique_visitors(7)
     
     # 最受欢迎的文章
     popular_posts = Post.query.filter_by(is_published=True).order_by(Post.view_count.desc()).limit(5).all()
@@ -78,6 +87,8 @@ def stats():
             'total_views': total_views,
             'total_comments': total_comments,
             'recent_visitors': recent_visitors,
+            'traffic': current_app.extensions['traffic_classifier'].stats(),
+            'geo_cache': current_app.extensions['geo_cache'].stats() if 'geo_cache' in current_app.extensions else None,
             'popular_posts': [
                 {
                     'title': post.title,
@@ -147,18 +158,58 @@ def search():
             'message': '搜索关键词不能为空'
         }), 400
     
-    # 搜索文章
-    posts = Post.query.filter(
-        Post.is_published == True,
-        db.or_(
-            Post.title.contains(query),
-            Post.content.contains(query),
-            Post.summary.contains(query)
+    # 全文索引检索（按相关度排序，结果数上限为SEARCH_MAX_RESULTS）
+    ranked_ids = search_posts(query)
+    search_query = Post.query.filter(Post.is_published == True, Post.id.in_(ranked_ids))
+    
+    # 按相关度、页码分页；页码分页返回的next_cursor可继续按相关度翻页，
+    # 其他cursor参数按发布时间游标分页
+    cursor = request.args.get('cursor')
+    rank_cursor = decode_rank_cursor(cursor) if cursor else None
+    if rank_cursor is not None:
+        page_ids, next_cursor, prev_cursor = ranked_page(ranked_ids, rank_cursor, per_page)
+        posts_by_id = {post.id: post for post in search_query.filter(Post.id.in_(page_ids))}
+        items = [posts_by_id[post_id] for post_id in page_ids if post_id in posts_by_id]
+        pagination = {
+            'per_page': per_page,
+            'next_cursor': next_cursor,
+            'prev_cursor': prev_cursor,
+            'has_next': next_cursor is not None,
+            'has_prev': prev_cursor is not None,
+            # 结果数有上限，总数就是检索结果数
+            'total': len(ranked_ids) if request.args.get('include_total') else None
+        }
+    elif cursor is not None:
+        items, next_cursor, prev_cursor = keyset_paginate(search_query, cursor, per_page)
+        pagination = {
+            'per_page': per_page,
+            'next_cursor': next_cursor,
+            'prev_cursor': prev_cursor,
+            'has_next': next_cursor is not None,
+            'has_prev': prev_cursor is not None,
+            # 总数需要额外COUNT，按需返回
+            'total': search_query.count() if request.args.get('include_total') else None
+        }
+    else:
+        if ranked_ids:
+            search_query = search_query.order_by(
+                db.case({post_id: rank for rank, post_id in enumerate(ranked_ids)}, value=Post.id))
+        posts = search_query.paginate(
+            page=page, per_page=per_page, error_out=False
         )
-    ).order_by(Post.created_at.desc()).paginate(
-        page=page, per_page=per_page, error_out=False
-    )
+        items = posts.items
+        pagination = {
+            'page': posts.page,
+            'pages': posts.pages,
+            'per_page': posts.per_page,
+            'total': posts.total,
+            'has_next': posts.has_next,
+            'has_prev': posts.has_prev,
+            # 从下一页开始可改用游标（按相关度继续）
+            'next_cursor': encode_rank_cursor(items[-1].id, 'next') if posts.has_next and items else None
+        }
     
+    terms = search_terms(query)
     return jsonify({
         'success': True,
         'data': {
@@ -170,19 +221,34 @@ def search():
                     'summary': post.summary or post.content[:200] + '...',
                     'created_at': post.created_at.isoformat(),
                     'category': post.category.name if post.category else None,
-                    'view_count': post.view_count
-                } for post in posts.items
+                    'view_count': post.view_count,
+                    # 命中词用<mark>标出的HTML
+                    'highlight': {
+                        'title': str(highlight_text(post.title, terms)),
+                        'snippet': str(search_snippet(post.content, terms))
+                    }
+                } for post in items
             ],
-            'pagination': {
-                'page': posts.page,
-                'pages': posts.pages,
-                'per_page': posts.per_page,
-                'total': posts.total,
-                'has_next': posts.has_next,
-                'has_prev': posts.has_prev
-            }
+            'pagination': pagination
+        }
+    })
+
+@bp.route('/search/suggest')
+def search_suggest():
+    """搜索框联想：按前缀返回文章标题、标签、分类（内存索引，不查数据库）"""
+    query = request.args.get('q', '').strip()[:50]
+    limit = max(1, min(request.args.get('limit', 8, type=int), 20))
+    suggestions = current_app.extensions['suggest_index'].suggest(query, limit) if query else []
+    response = jsonify({
+        'success': True,
+        'data': {
+            'query': query,
+            'suggestions': [{'type': item['type'], 'text': item['text'], 'url': item['url']} for item in suggestions]
         }
     })
+    response.cache_control.public = True
+    response.cache_control.max_age = 60
+    return response
 
 @bp.route('/calendar')
 def calendar():
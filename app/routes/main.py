@@ -1,8 +1,8 @@
-from flask import Blueprint, render_template, request, jsonify, redirect, url_for, flash, current_app
+from flask import Blueprint, render_template, request, jsonify, redirect, url_for, flash, current_app, g
 from flask_login import login_user, logout_user, login_required, current_user
 from app import db
 from app.models import Post, Category, Tag, User, Comment, Link, Project, Timeline, SiteConfig, Visitor
-from app.utils import get_visitor_info, calculate_distance
+from app.utils import search_posts, search_terms, highlight_text, search_snippet, get_related_posts
 from datetime import datetime
 import requests
 
@@ -10,28 +10,13 @@ bp = Blueprint('main', __name__)
 
 @bp.before_request
 def track_visitor():
-    """跟踪访客信息"""
+    """跟踪访客信息（先过滤爬虫/探活/预取，读者只入队，由后台线程批量写库）"""
     if request.endpoint and not request.endpoint.startswith('static'):
         ip = request.environ.get('HTTP_X_FORWARDED_FOR', request.remote_addr)
-        if ip:
-            visitor = Visitor.query.filter_by(ip_address=ip).first()
-            if visitor:
-                visitor.visit_count += 1
-                visitor.last_visit = datetime.utcnow()
-            else:
-                # 获取访客地理信息
-                visitor_info = get_visitor_info(ip)
-                visitor = Visitor(
-                    ip_address=ip,
-                    user_agent=request.user_agent.string,
-                    country=visitor_info.get('country'),
-                    city=visitor_info.get('city'),
-                    latitude=visitor_info.get('latitude'),
-                    longitude=visitor_info.get('longitude'),
-                    distance=visitor_info.get('distance')
-                )
-                db.session.add(visitor)
-            db.session.commit()
+        if ip and current_app.extensions['traffic_classifier'].check(request.endpoint, request.user_agent.string,
+                                                                     request.headers):
+            g.visitor_ip = ip
+            current_app.extensions['visitor_tracker'].record(ip, request.user_agent.string)
 
 @bp.route('/')
 def index():
@@ -43,7 +28,7 @@ def index():
     featured_posts = Post.query.filter_by(is_published=True, is_featured=True).limit(3).all()
     recent_posts = Post.query.filter_by(is_published=True).order_by(Post.created_at.desc()).limit(5).all()
     categories = Category.query.all()
-    tags = Tag.query.all()
+    tags = current_app.extensions['tag_cloud'].top(15)
     
     # 获取网站配置
     site_config = SiteConfig.query.first()
@@ -81,14 +66,28 @@ def blog():
     if tag_id:
         query = query.filter(Post.tags.any(Tag.id == tag_id))
     
+    search_highlights = None
     if search:
-        query = query.filter(Post.title.contains(search) | Post.content.contains(search))
-    
-    posts = query.order_by(Post.created_at.desc()).paginate(
+        # 全文索引按相关度排序
+        ranked_ids = search_posts(search)
+        query = query.filter(Post.id.in_(ranked_ids))
+        if ranked_ids:
+            query = query.order_by(db.case({post_id: rank for rank, post_id in enumerate(ranked_ids)}, value=Post.id))
+    else:
+        query = query.order_by(Post.created_at.desc())
+    
+    posts = query.paginate(
         page=page, per_page=current_app.config['POSTS_PER_PAGE'], error_out=False)
     
+    if search:
+        terms = search_terms(search)
+        search_highlights = {
+            post.id: {'title': highlight_text(post.title, terms), 'snippet': search_snippet(post.content, terms)}
+            for post in posts.items
+        }
+    
     categories = Category.query.all()
-    tags = Tag.query.all()
+    tags = current_app.extensions['tag_cloud'].get()
     
     return render_template('blog.html', 
                          posts=posts, 
@@ -96,25 +95,22 @@ def blog():
                          tags=tags,
                          current_category=category_id,
                          current_tag=tag_id,
-                         search_query=search)
+                         search_query=search,
+                         search_highlights=search_highlights)
 
 @bp.route('/post/<slug>')
 def post(slug):
     """文章详情页"""
     post = Post.query.filter_by(slug=slug, is_published=True).first_or_404()
     
-    # 增加浏览量
-    post.view_count += 1
-    db.session.commit()
-    
-    # 获取相关文章
-    related_posts = []
-    if post.category_id:
-        related_posts = Post.query.filter(
-            Post.id != post.id,
-            Post.is_published == True,
-            Post.category_id == post.category_id
-        ).limit(3).all()
+    # 增加浏览量（先缓冲，由后台线程批量写库）
+    current_app.extensions['post_counters'].increment(post.id)
+    # 文章读者草图（track_visitor已过滤掉爬虫等请求）
+    if g.get('visitor_ip'):
+        current_app.extensions['visitor_tracker'].record_read(post.id, g.visitor_ip)
+    
+    # 获取相关文章（预计算的TF-IDF近邻）
+    related_posts = get_related_posts(post, current_app.config.get('RELATED_POSTS_COUNT', 3))
     
     # 获取评论
     comments = Comment.query.filter_by(post_id=post.id, is_approved=True).order_by(Comment.created_at.asc()).all()
@@ -1,11 +1,68 @@
+import os
+import time
+import atexit
+import threading
 import requests
 import math
+import hashlib
+import markdown
 from flask import current_app
-from datetime import datetime
 import re
 
+# 与rich_blog_app.py共用的基础设施；路由、run.py和app/__init__.py也从这里导入其中一部分
+from blog_core import pagination, search, visitors
+from blog_core.counters import PostCounters as BasePostCounters, create_counter_backend
+from blog_core.geo import GeoIPResolver, GeoCache, calculate_distance, haversine_distances
+from blog_core.pagination import encode_rank_cursor, decode_rank_cursor, ranked_page
+from blog_core.related import RelatedPostsEngine
+from blog_core.search import create_search_index, search_terms, highlight_text, search_snippet
+from blog_core.suggest import SuggestIndex, suggest_entry
+from blog_core.traffic import TrafficClassifier
+from blog_core.versions import file_version, bump_file_version
+from blog_core.visitors import VisitorTracker as BaseVisitorTracker
+
+MARKDOWN_EXTENSIONS = ['fenced_code', 'tables', 'toc']
+EXCERPT_LENGTH = 200
+CJK_CHARS_PER_MINUTE = 400
+WORDS_PER_MINUTE = 200
+
+def get_geoip_resolver():
+    """当前应用的本地IP地理库（首次使用时加载）"""
+    resolver = current_app.extensions.get('geoip_resolver')
+    if resolver is None:
+        resolver = current_app.extensions['geoip_resolver'] = GeoIPResolver(current_app.config.get('GEOIP_DB_PATH', ''))
+    return resolver
+
+def get_geo_cache():
+    """当前应用的地理位置查询缓存"""
+    cache = current_app.extensions.get('geo_cache')
+    if cache is None:
+        config = current_app.config
+        cache = current_app.extensions['geo_cache'] = GeoCache(
+            config.get('GEO_CACHE_SIZE', 50000), config.get('GEO_CACHE_TTL', 7 * 24 * 3600),
+            config.get('GEO_CACHE_NEGATIVE_TTL', 600), config.get('GEO_CACHE_PREFIX', True))
+    return cache
+
 def get_visitor_info(ip_address):
-    """获取访客地理信息"""
+    """获取访客地理信息（带缓存），查不到返回空字典"""
+    return get_geo_cache().get_or_resolve(ip_address, resolve_visitor_info) or {}
+
+def resolve_visitor_info(ip_address):
+    """先查本地IP库，查不到再按配置调用ipinfo.io；都查不到返回None"""
+    geo_info = get_geoip_resolver().lookup(ip_address)
+    if geo_info:
+        distance = None
+        author_lat = current_app.config.get('AUTHOR_LATITUDE')
+        author_lng = current_app.config.get('AUTHOR_LONGITUDE')
+        if geo_info['latitude'] and geo_info['longitude'] and author_lat and author_lng:
+            distance = calculate_distance(geo_info['latitude'], geo_info['longitude'], author_lat, author_lng)
+        return dict(geo_info, distance=distance)
+    if not current_app.config.get('GEOIP_REMOTE_FALLBACK', True):
+        return None
+    return get_remote_visitor_info(ip_address)
+
+def get_remote_visitor_info(ip_address):
+    """通过ipinfo.io获取访客地理信息"""
     try:
         # 使用ipinfo.io获取地理信息
         token = current_app.config.get('IPINFO_TOKEN')
@@ -41,29 +98,70 @@ def get_visitor_info(ip_address):
     except Exception as e:
         print(f"Error getting visitor info: {e}")
     
-    return {}
+    return None
 
-def calculate_distance(lat1, lon1, lat2, lon2):
-    """计算两点间的距离（公里）"""
-    try:
-        # 使用Haversine公式计算距离
-        R = 6371  # 地球半径（公里）
-        
-        lat1_rad = math.radians(lat1)
-        lon1_rad = math.radians(lon1)
-        lat2_rad = math.radians(lat2)
-        lon2_rad = math.radians(lon2)
-        
-        dlat = lat2_rad - lat1_rad
-        dlon = lon2_rad - lon1_rad
-        
-        a = math.sin(dlat/2)**2 + math.cos(lat1_rad) * math.cos(lat2_rad) * math.sin(dlon/2)**2
-        c = 2 * math.atan2(math.sqrt(a), math.sqrt(1-a))
-        
-        distance = R * c
-        return round(distance, 2)
-    except:
-        return None
+def rebuild_visitor_rollups(hourly_days, chunk_size=5000):
+    """从访客表重建按小时/天/总计的汇总（近似值），返回写入的行数"""
+    from app import db
+    from app.models import Visitor, VisitorRollup
+
+    return visitors.rebuild_visitor_rollups(db.session, Visitor.__table__, VisitorRollup.__table__,
+                                            hourly_days, chunk_size)
+
+def count_unique_visitors(days=1):
+    """最近days天（UTC，含今天）的独立访客数（合并每日草图的估计值，跨天去重）"""
+    from app import db
+    from app.models import VisitorSketch
+
+    return visitors.count_unique_visitors(db.session, VisitorSketch.__table__, days)
+
+def count_post_readers(post_ids):
+    """各文章的独立读者数估计 {post_id: 人数}，没有读者的文章不在结果中"""
+    from app import db
+    from app.models import VisitorSketch
+
+    return visitors.count_post_readers(db.session, VisitorSketch.__table__, post_ids)
+
+def get_visitor_summary(days=7, hours=24, countries=10, month_days=30):
+    """访客统计：今日/近days天/近month_days天独立访客、近hours小时走势、访客最多的国家"""
+    from app import db
+    from app.models import VisitorRollup, VisitorSketch
+
+    return visitors.get_visitor_summary(db.session, VisitorSketch.__table__, VisitorRollup.__table__,
+                                        days, hours, countries, month_days)
+
+class VisitorTracker(BaseVisitorTracker):
+    """访客记录的异步批量写入（写入本应用的访客表），进程退出时写完队列"""
+
+    def __init__(self, app, **kwargs):
+        from app import db
+        from app.models import Visitor, VisitorRollup, VisitorSketch
+
+        super().__init__(app, db.session, Visitor.__table__, VisitorRollup.__table__, VisitorSketch.__table__,
+                         **kwargs)
+        app.extensions['visitor_tracker'] = self
+        atexit.register(self.drain)
+
+    def geo_fields(self, ip):
+        visitor_info = get_visitor_info(ip)
+        return {
+            'country': visitor_info.get('country'),
+            'city': visitor_info.get('city'),
+            'latitude': visitor_info.get('latitude'),
+            'longitude': visitor_info.get('longitude'),
+            'distance': visitor_info.get('distance')
+        }
+
+class PostCounters(BasePostCounters):
+    """文章浏览量的缓冲计数（写入本应用的文章表），进程退出时写完剩余增量"""
+
+    def __init__(self, app, backend, flush_interval=5.0):
+        from app import db
+        from app.models import Post
+
+        super().__init__(app, db.session, Post.__table__, backend, flush_interval)
+        app.extensions['post_counters'] = self
+        atexit.register(self.flush)
 
 def get_weather_info(city='Beijing'):
     """获取天气信息"""
@@ -98,6 +196,374 @@ def create_slug(title):
     slug = re.sub(r'[-\s]+', '-', slug)
     return slug.lower()
 
+def compute_content_hash(content):
+    """计算文章内容哈希"""
+    return hashlib.sha256((content or '').encode('utf-8')).hexdigest()
+
+def html_to_text(html):
+    """去除HTML标签，得到纯文本"""
+    text = re.sub(r'<(script|style)[^>]*>.*?</\1>', ' ', html or '', flags=re.S | re.I)
+    text = re.sub(r'<[^>]+>', ' ', text)
+    text = text.replace('&nbsp;', ' ').replace('&lt;', '<').replace('&gt;', '>').replace('&amp;', '&')
+    return re.sub(r'\s+', ' ', text).strip()
+
+def estimate_reading_time(text):
+    """估算阅读时间（分钟），中文按字数、英文按单词数计算"""
+    cjk_count = len(re.findall(r'[\u4e00-\u9fff]', text))
+    word_count = len(re.findall(r'[A-Za-z0-9_]+', text))
+    minutes = cjk_count / CJK_CHARS_PER_MINUTE + word_count / WORDS_PER_MINUTE
+    return max(1, int(round(minutes)))
+
+def render_markdown_bundle(content):
+    """渲染Markdown，返回HTML、目录、摘要、阅读时间和内容哈希"""
+    md = markdown.Markdown(extensions=MARKDOWN_EXTENSIONS)
+    html = md.convert(content or '')
+    text = html_to_text(html)
+    return {
+        'content_hash': compute_content_hash(content),
+        'html': html,
+        'toc': md.toc,
+        'excerpt': text[:EXCERPT_LENGTH] + ('...' if len(text) > EXCERPT_LENGTH else ''),
+        'reading_time': estimate_reading_time(text)
+    }
+
+def keyset_paginate(query, cursor, per_page):
+    """
+    按 (created_at, id) 倒序做游标分页，只取 per_page+1 行，不做COUNT和OFFSET
+    返回 (文章列表, next_cursor, prev_cursor)；游标无效时从第一页开始
+    """
+    from app.models import Post
+
+    return pagination.keyset_paginate(query, Post, cursor, per_page)
+
+# 保存文章时需要更新全文索引、相关文章的字段
+SEARCH_INDEXED_FIELDS = ('title', 'summary', 'content', 'is_published', 'tags')
+
+def load_search_documents(connection, post_ids=None):
+    """读取已发布文章的索引文档 {post_id: {title, summary, content, tags}}；post_ids为None时读取全部"""
+    from app.models import Post, Tag, post_tags
+
+    return search.load_search_documents(connection, Post.__table__, Tag.__table__, post_tags, post_ids)
+
+def _collect_search_tag_changes(session, flush_context, instances):
+    """标签改名或删除时重建相关文章的索引；删除后关联行就查不到了，所以在flush前记下"""
+    from app import db
+    from app.models import Tag, post_tags
+
+    tag_ids = [tag.id for tag in session.deleted if isinstance(tag, Tag)] + [
+        tag.id for tag in session.dirty
+        if isinstance(tag, Tag) and db.inspect(tag).attrs.name.history.has_changes()]
+    if tag_ids:
+        rows = session.connection().execute(
+            db.select(post_tags.c.post_id).where(post_tags.c.tag_id.in_(tag_ids)))
+        session.info.setdefault('search_post_ids', set()).update(post_id for post_id, in rows)
+
+def _update_search_index(session, flush_context):
+    from app import db
+    from app.models import Post
+
+    post_ids = session.info.pop('search_post_ids', set())
+    post_ids.update(obj.id for obj in session.new if isinstance(obj, Post))
+    post_ids.update(obj.id for obj in session.dirty if isinstance(obj, Post) and any(
+        db.inspect(obj).attrs[field].history.has_changes() for field in SEARCH_INDEXED_FIELDS))
+    removed_ids = {obj.id for obj in session.deleted if isinstance(obj, Post)}
+    post_ids -= removed_ids
+    if not post_ids and not removed_ids:
+        return
+    search_index = current_app.extensions['search_index']
+    connection = session.connection()
+    documents = load_search_documents(connection, post_ids)
+    # 未发布（或已撤回）的文章从索引中删除
+    removed_ids |= post_ids - documents.keys()
+    if search_index.transactional:
+        search_index.apply(connection, documents, removed_ids)
+        return
+    pending_documents, pending_removed = session.info.setdefault('search_pending', ({}, set()))
+    for post_id in removed_ids:
+        pending_documents.pop(post_id, None)
+    pending_documents.update(documents)
+    pending_removed.update(removed_ids)
+    pending_removed.difference_update(documents)
+
+def _apply_search_index_changes(session):
+    pending = session.info.pop('search_pending', None)
+    if pending:
+        current_app.extensions['search_index'].apply(None, *pending)
+
+def _discard_search_index_changes(session):
+    session.info.pop('search_post_ids', None)
+    session.info.pop('search_pending', None)
+
+def _setup_search_index(target, connection, **kw):
+    # create_all新建文章表后，在同一连接上创建索引表（新库没有文章，无需构建）
+    current_app.extensions['search_index'].setup(connection)
+
+def init_search_index(app):
+    """创建全文索引，注册保存文章时的增量更新；索引表为空时从文章表构建"""
+    from app import db
+    from app.models import Post
+
+    os.makedirs(app.instance_path, exist_ok=True)
+    search_index = create_search_index(app, db.session, load_search_documents,
+                                       os.path.join(app.instance_path, 'search_index.version'))
+    app.extensions['search_index'] = search_index
+    for event, listener in (('before_flush', _collect_search_tag_changes),
+                            ('after_flush', _update_search_index),
+                            ('after_commit', _apply_search_index_changes),
+                            ('after_rollback', _discard_search_index_changes)):
+        if not db.event.contains(db.session, event, listener):
+            db.event.listen(db.session, event, listener)
+    if not db.event.contains(Post.__table__, 'after_create', _setup_search_index):
+        db.event.listen(Post.__table__, 'after_create', _setup_search_index)
+    with app.app_context():
+        try:
+            # 新库还没有文章表时，由create_all之后的after_create事件创建
+            if db.inspect(db.engine).has_table(Post.__table__.name):
+                with db.engine.begin() as connection:
+                    search_index.setup(connection)
+                if search_index.is_empty():
+                    search_index.rebuild()
+        except Exception as e:
+            print(f"Error setting up search index: {e}")
+    return search_index
+
+def load_suggest_entries(connection, post_ids=None, tag_ids=None, category_ids=None):
+    """读取联想条目；参数都为None时读取全部，否则只读取给定id（未发布、已删除的不返回）"""
+    from app import db
+    from app.models import Post, Tag, Category, post_tags
+
+    load_all = post_ids is None and tag_ids is None and category_ids is None
+    entries = []
+    if load_all or post_ids:
+        statement = db.select(Post.id, Post.title, Post.slug, Post.view_count).where(Post.is_published == True)
+        if not load_all:
+            statement = statement.where(Post.id.in_(post_ids))
+        entries.extend(suggest_entry('post', post_id, title, f'/post/{slug}', view_count)
+                       for post_id, title, slug, view_count in connection.execute(statement))
+    # 权重为已发布文章数
+    published = db.select(Post.id).where(Post.is_published == True)
+    for kind, model, ids, count_statement in (
+            ('tag', Tag, tag_ids, db.select(post_tags.c.tag_id, db.func.count()).where(
+                post_tags.c.post_id.in_(published)).group_by(post_tags.c.tag_id)),
+            ('category', Category, category_ids, db.select(Post.category_id, db.func.count()).where(
+                Post.is_published == True).group_by(Post.category_id))):
+        if not (load_all or ids):
+            continue
+        statement = db.select(model.id, model.name)
+        if not load_all:
+            statement = statement.where(model.id.in_(ids))
+        counts = dict(connection.execute(count_statement).all())
+        entries.extend(suggest_entry(kind, entity_id, name, f'/blog?{kind}={entity_id}', counts.get(entity_id))
+                       for entity_id, name in connection.execute(statement))
+    return entries
+
+SUGGEST_FIELDS = {'post': ('title', 'slug', 'is_published'), 'tag': ('name',), 'category': ('name',)}
+
+def _suggest_kind(obj):
+    from app.models import Post, Tag, Category
+
+    return {Post: 'post', Tag: 'tag', Category: 'category'}.get(type(obj))
+
+def _track_suggest_changes(session, flush_context):
+    from app import db
+
+    changed = {'post': set(), 'tag': set(), 'category': set()}
+    for obj in list(session.new) + list(session.deleted) + list(session.dirty):
+        kind = _suggest_kind(obj)
+        if kind and (obj not in session.dirty or any(
+                db.inspect(obj).attrs[field].history.has_changes() for field in SUGGEST_FIELDS[kind])):
+            changed[kind].add(obj.id)
+    if not any(changed.values()):
+        return
+    # 提交后会话不能再查询，条目在flush时读出
+    entries = load_suggest_entries(session.connection(), changed['post'], changed['tag'], changed['category'])
+    pending_entries, pending_removed = session.info.setdefault('suggest_pending', ({}, set()))
+    pending_removed.update((kind, entity_id) for kind, ids in changed.items() for entity_id in ids)
+    for entity_id in [entity_id for entity_id in pending_entries if entity_id in pending_removed]:
+        del pending_entries[entity_id]
+    pending_entries.update({(entry['type'], entry['id']): entry for entry in entries})
+
+def _apply_suggest_changes(session):
+    pending = session.info.pop('suggest_pending', None)
+    if pending:
+        current_app.extensions['suggest_index'].apply(list(pending[0].values()), pending[1])
+
+def _discard_suggest_changes(session):
+    session.info.pop('suggest_pending', None)
+
+def init_suggest_index(app):
+    """创建搜索联想索引（首次联想时构建），注册后台修改后的增量更新"""
+    from app import db
+
+    os.makedirs(app.instance_path, exist_ok=True)
+    suggest_index = SuggestIndex(db.session, load_suggest_entries, os.path.join(app.instance_path, 'suggest_index.version'),
+                                 app.config.get('SUGGEST_MAX_KEYS', 200000), app.config.get('SUGGEST_TTL', 600))
+    app.extensions['suggest_index'] = suggest_index
+    for event, listener in (('after_flush', _track_suggest_changes),
+                            ('after_commit', _apply_suggest_changes),
+                            ('after_rollback', _discard_suggest_changes)):
+        if not db.event.contains(db.session, event, listener):
+            db.event.listen(db.session, event, listener)
+    return suggest_index
+
+def get_related_posts(post, limit):
+    """读取预计算的相关文章（按相似度排序）"""
+    from app.models import Post, PostNeighbor
+
+    return Post.query.join(
+        PostNeighbor, PostNeighbor.neighbor_id == Post.id
+    ).filter(
+        PostNeighbor.post_id == post.id,
+        Post.is_published == True
+    ).order_by(PostNeighbor.rank).limit(limit).all()
+
+def _track_related_changes(session, flush_context):
+    from app import db
+    from app.models import Post
+
+    changed = {obj.id for obj in list(session.new) + list(session.deleted) if isinstance(obj, Post)}
+    changed.update(obj.id for obj in session.dirty if isinstance(obj, Post) and any(
+        db.inspect(obj).attrs[field].history.has_changes() for field in SEARCH_INDEXED_FIELDS))
+    if changed:
+        session.info.setdefault('related_post_ids', set()).update(changed)
+
+def _update_related_posts(session):
+    changed = session.info.pop('related_post_ids', None)
+    if changed:
+        # 不在请求线程里重算，只交给后台线程
+        current_app.extensions['related_posts'].schedule(changed)
+
+def _discard_related_changes(session):
+    session.info.pop('related_post_ids', None)
+
+def init_related_posts(app):
+    """创建相关文章引擎，注册文章增删改后的增量重算（后台线程）"""
+    from app import db
+    from app.models import Post, PostNeighbor
+
+    engine = RelatedPostsEngine(app, db.session, Post.__table__, PostNeighbor.__table__, load_search_documents,
+                                app.config.get('RELATED_POSTS_COUNT', 3), app.config.get('RELATED_REFIT_RATIO', 0.2))
+    app.extensions['related_posts'] = engine
+    atexit.register(engine.drain)
+    for event, listener in (('after_flush', _track_related_changes),
+                            ('after_commit', _update_related_posts),
+                            ('after_rollback', _discard_related_changes)):
+        if not db.event.contains(db.session, event, listener):
+            db.event.listen(db.session, event, listener)
+    return engine
+
+# 标签云的热度分级数
+TAG_CLOUD_LEVELS = 5
+
+class TagCloud:
+    """
+    标签云：每个标签的已发布文章数（一次GROUP BY），按热度分为1~TAG_CLOUD_LEVELS级
+    结果缓存在进程内，标签或文章发布状态变化后通过版本文件的mtime通知所有worker重新查询
+    """
+
+    def __init__(self, version_path, ttl):
+        self.version_path = version_path
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._snapshot = None
+        self._lock = threading.Lock()
+
+    def _current_version(self):
+        return file_version(self.version_path)
+
+    def _bump_version(self):
+        try:
+            bump_file_version(self.version_path)
+        except OSError as e:
+            print(f"Error updating tag cloud version: {e}")
+
+    def _fresh(self, version):
+        snapshot = self._snapshot
+        return snapshot and snapshot['version'] == version and time.time() - snapshot['created'] < self.ttl
+
+    def get(self):
+        version = self._current_version()
+        if self._fresh(version):
+            self.hits += 1
+            return self._snapshot['data']
+        with self._lock:
+            if self._fresh(version):
+                self.hits += 1
+                return self._snapshot['data']
+            self.misses += 1
+            self._snapshot = {'version': version, 'created': time.time(), 'data': self._build()}
+            return self._snapshot['data']
+
+    def _build(self):
+        from app import db
+        from app.models import Post, Tag, post_tags
+
+        post_count = db.func.count(Post.id)
+        rows = db.session.query(Tag.id, Tag.name, post_count).outerjoin(
+            post_tags, post_tags.c.tag_id == Tag.id
+        ).outerjoin(
+            Post, db.and_(Post.id == post_tags.c.post_id, Post.is_published == True)
+        ).group_by(Tag.id, Tag.name).order_by(post_count.desc(), Tag.name).all()
+        counts = [count for *_, count in rows if count]
+        low, high = (math.log(min(counts)), math.log(max(counts))) if counts else (0, 0)
+        cloud = []
+        for tag_id, name, count in rows:
+            if not count:
+                continue
+            # 对数刻度：少数热门标签不会把其余标签都压到最小一级
+            level = 1 + round((TAG_CLOUD_LEVELS - 1) * (math.log(count) - low) / (high - low)) if high > low else 1
+            cloud.append({'id': tag_id, 'name': name, 'count': count, 'level': level})
+        return cloud
+
+    def top(self, limit):
+        """最热门的limit个标签，按名称排列"""
+        return sorted(self.get()[:limit], key=lambda tag: tag['name'])
+
+    def invalidate(self):
+        self._snapshot = None
+        self._bump_version()
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses, 'tags': len(self._snapshot['data']) if self._snapshot else None}
+
+def _track_tag_cloud_changes(session, flush_context):
+    from app import db
+    from app.models import Post, Tag
+
+    if any(isinstance(obj, (Post, Tag)) for obj in list(session.new) + list(session.deleted)) or any(
+            isinstance(obj, Tag) or isinstance(obj, Post) and (
+                db.inspect(obj).attrs.is_published.history.has_changes()
+                or db.inspect(obj).attrs.tags.history.has_changes())
+            for obj in session.dirty):
+        session.info['tag_cloud_changed'] = True
+
+def _invalidate_tag_cloud(session):
+    if session.info.pop('tag_cloud_changed', None):
+        current_app.extensions['tag_cloud'].invalidate()
+
+def _discard_tag_cloud_changes(session):
+    session.info.pop('tag_cloud_changed', None)
+
+def init_tag_cloud(app):
+    """创建标签云缓存，注册标签/文章修改后的失效"""
+    from app import db
+
+    os.makedirs(app.instance_path, exist_ok=True)
+    tag_cloud = TagCloud(os.path.join(app.instance_path, 'tag_cloud.version'), app.config.get('TAG_CLOUD_TTL', 60))
+    app.extensions['tag_cloud'] = tag_cloud
+    for event, listener in (('after_flush', _track_tag_cloud_changes),
+                            ('after_commit', _invalidate_tag_cloud),
+                            ('after_rollback', _discard_tag_cloud_changes)):
+        if not db.event.contains(db.session, event, listener):
+            db.event.listen(db.session, event, listener)
+    return tag_cloud
+
+def search_posts(query, limit=None):
+    """全文检索已发布文章，返回按相关度排序的id"""
+    limit = limit or current_app.config.get('SEARCH_MAX_RESULTS', 200)
+    return [post_id for post_id, _ in current_app.extensions['search_index'].search(query, limit)]
+
 def truncate_text(text, length=150):
     """截断文本"""
     if len(text) <= length:
@@ -0,0 +1,201 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+索引性能测试
+灌入大量数据后，分别在去掉模型声明的二级索引、补建索引两种情况下请求各路由，
+对比平均耗时，并对请求中执行的每条SELECT记录EXPLAIN输出
+
+用法: python benchmark_indexes.py [文章数] [输出目录]
+默认使用临时SQLite库；设置DATABASE_URL可测MySQL/PostgreSQL（必须是可随意写入的测试库）
+"""
+
+import os
+import sys
+import random
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+_work_dir = tempfile.mkdtemp(prefix='index_benchmark_')
+os.environ.setdefault('DATABASE_URL', 'sqlite:///' + os.path.join(_work_dir, 'blog.db'))
+os.environ['PAGE_CACHE_ENABLED'] = 'false'
+os.environ['PAGE_CACHE_DIR'] = os.path.join(_work_dir, 'page_cache')
+os.environ['TEMPLATE_CACHE_DIR'] = os.path.join(_work_dir, 'jinja_cache')
+
+from rich_blog_app import (app, db, init_database, ensure_indexes, rebuild_visitor_rollups, post_tags,
+                           Post, Tag, Category, Comment, Link, Visitor)
+
+ROUTES = ['/', '/blog', '/blog?category={category_id}', '/blog?tag={tag_id}', '/post/{slug}',
+          '/links', '/api/visitor-stats']
+# 不经过路由的热点查询：按IP批量查找访客（MySQL上upsert后确认新访客；ip_address为唯一索引，不会被删掉）
+VISITOR_LOOKUP = 'Visitor.ip_address IN (...)'
+
+def seed(post_count):
+    """用Core批量插入文章、标签关联、评论、访客和友情链接（不触发ORM事件）"""
+    rng = random.Random(42)
+    now = datetime.utcnow()
+    with app.app_context():
+        category_ids = [c.id for c in Category.query.all()]
+        tag_ids = [t.id for t in Tag.query.all()]
+        start = (db.session.query(db.func.max(Post.id)).scalar() or 0) + 1
+        posts, links, comments = [], [], []
+        for post_id in range(start, start + post_count):
+            posts.append({
+                'id': post_id, 'title': f'测试文章{post_id}', 'slug': f'benchmark-post-{post_id}',
+                'content': f'# 测试文章{post_id}\n\n' + '正文内容。' * 20, 'summary': f'摘要{post_id}',
+                'is_published': rng.random() < 0.9, 'is_featured': rng.random() < 0.02,
+                'view_count': rng.randint(0, 5000), 'like_count': 0, 'user_id': 1,
+                'category_id': rng.choice(category_ids),
+                'created_at': now - timedelta(minutes=rng.randint(0, 525600)), 'updated_at': now})
+            links.extend({'post_id': post_id, 'tag_id': tag_id} for tag_id in rng.sample(tag_ids, 3))
+            comments.extend({
+                'post_id': post_id, 'content': '评论内容', 'author_name': '读者',
+                'author_email': 'reader@example.com', 'is_approved': rng.random() < 0.8,
+                'created_at': now - timedelta(minutes=rng.randint(0, 525600))} for _ in range(5))
+        visitors = [{
+            'ip_address': f'10.{i >> 16 & 255}.{i >> 8 & 255}.{i & 255}', 'user_agent': 'benchmark',
+            'country': rng.choice(['中国', '美国', '日本', '德国']), 'city': '', 'latitude': 0, 'longitude': 0,
+            'distance_km': 0, 'visit_count': rng.randint(1, 20),
+            'first_visit': now - timedelta(days=30), 'last_visit': now - timedelta(minutes=rng.randint(0, 43200))
+        } for i in range(post_count * 10)]
+        friend_links = [{
+            'name': f'链接{i}', 'url': f'https://example.com/{i}', 'category': rng.choice(['friend', 'recommend', 'tool']),
+            'is_active': rng.random() < 0.7, 'sort_order': rng.randint(0, 100)} for i in range(post_count // 10)]
+
+        for table, rows in ((Post.__table__, posts), (post_tags, links), (Comment.__table__, comments),
+                            (Visitor.__table__, visitors), (Link.__table__, friend_links)):
+            for offset in range(0, len(rows), 5000):
+                db.session.execute(table.insert(), rows[offset:offset + 5000])
+        db.session.commit()
+        rebuild_visitor_rollups(app.config['VISITOR_ROLLUP_HOURLY_DAYS'])
+
+def declared_indexes():
+    return [index for table in db.metadata.sorted_tables for index in table.indexes if not index.unique]
+
+def drop_indexes():
+    inspector = db.inspect(db.engine)
+    for index in declared_indexes():
+        if index.name in {i['name'] for i in inspector.get_indexes(index.table.name)}:
+            index.drop(bind=db.engine)
+
+def analyze():
+    """刷新优化器统计信息，否则新建的索引可能不被选用"""
+    with db.engine.begin() as connection:
+        if db.engine.dialect.name in ('sqlite', 'postgresql'):
+            connection.exec_driver_sql('ANALYZE')
+        elif db.engine.dialect.name == 'mysql':
+            names = ', '.join(f'`{table.name}`' for table in db.metadata.sorted_tables)
+            connection.exec_driver_sql(f'ANALYZE TABLE {names}')
+
+def capture_statements(run):
+    """执行run()，返回期间执行的SELECT语句 [(语句, 参数)]"""
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        if not executemany and statement.lstrip().upper().startswith('SELECT'):
+            statements.append((statement, parameters))
+
+    db.event.listen(db.engine, 'before_cursor_execute', record)
+    try:
+        run()
+    finally:
+        db.event.remove(db.engine, 'before_cursor_execute', record)
+    return statements
+
+def explain(statement, parameters):
+    """返回执行计划的文本行"""
+    prefix = 'EXPLAIN QUERY PLAN ' if db.engine.dialect.name == 'sqlite' else 'EXPLAIN '
+    with db.engine.connect() as connection:
+        rows = connection.exec_driver_sql(prefix + statement, parameters).all()
+    return [' | '.join('' if value is None else str(value) for value in row) for row in rows]
+
+def is_full_scan(line):
+    """执行计划中是否有全表扫描（SQLite: 不带索引的SCAN；PostgreSQL: Seq Scan；MySQL: type=ALL）"""
+    dialect = db.engine.dialect.name
+    if dialect == 'sqlite':
+        detail = line.rsplit(' | ', 1)[-1]
+        return detail.startswith('SCAN ') and 'USING' not in detail
+    if dialect == 'postgresql':
+        return 'Seq Scan' in line
+    return ' | ALL | ' in line
+
+def run_suite(paths, rounds):
+    """返回 {路由: (平均耗时ms, [(语句, 执行计划)])}，需在应用上下文中调用"""
+    client = app.test_client()
+    results = {}
+    for route, path in paths.items():
+        client.get(path)  # 预热统计快照等进程内缓存
+        statements = capture_statements(lambda: client.get(path))
+        start = time.perf_counter()
+        for _ in range(rounds):
+            response = client.get(path)
+        elapsed = (time.perf_counter() - start) * 1000 / rounds
+        assert response.status_code == 200, f'{path} 返回 {response.status_code}'
+        results[route] = (elapsed, [(s, explain(s, p)) for s, p in statements])
+
+    ips = [ip for ip, in db.session.query(Visitor.ip_address).order_by(db.func.random()).limit(200)]
+
+    def lookup():
+        Visitor.query.filter(Visitor.ip_address.in_(ips)).all()
+        db.session.rollback()
+
+    statements = capture_statements(lookup)
+    start = time.perf_counter()
+    for _ in range(rounds):
+        lookup()
+    results[VISITOR_LOOKUP] = ((time.perf_counter() - start) * 1000 / rounds,
+                               [(s, explain(s, p)) for s, p in statements])
+    return results
+
+def write_plans(path, results):
+    with open(path, 'w', encoding='utf-8') as f:
+        for route, (elapsed, plans) in results.items():
+            f.write(f"{'=' * 80}\n{route}  ({elapsed:.2f} ms)\n{'=' * 80}\n")
+            for statement, plan in plans:
+                f.write(' '.join(statement.split()) + '\n')
+                f.writelines(f'    {line}\n' for line in plan)
+                f.write('\n')
+
+def main():
+    post_count = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    output_dir = sys.argv[2] if len(sys.argv) > 2 else _work_dir
+    rounds = 20
+    os.makedirs(output_dir, exist_ok=True)
+
+    init_database(app)
+    print(f"灌入 {post_count} 篇文章及评论、访客、友情链接...")
+    seed(post_count)
+
+    with app.app_context():
+        post = Post.query.filter_by(is_published=True).order_by(Post.created_at.desc()).first()
+        params = {'slug': post.slug, 'category_id': post.category_id, 'tag_id': post.tags[0].id}
+        paths = {route: route.format(**params) for route in ROUTES}
+
+        drop_indexes()
+        analyze()
+        before = run_suite(paths, rounds)
+
+        created = ensure_indexes()
+        analyze()
+        after = run_suite(paths, rounds)
+        dialect = db.engine.dialect.name
+        full_scans = {route: [sum(is_full_scan(line) for _, plan in results[route][1] for line in plan)
+                              for results in (before, after)] for route in before}
+
+    write_plans(os.path.join(output_dir, 'explain_before.txt'), before)
+    write_plans(os.path.join(output_dir, 'explain_after.txt'), after)
+
+    print("=" * 80)
+    print(f"数据库: {dialect}，建立索引: {', '.join(created)}")
+    print(f"{'路由':<32}{'无索引(ms)':>12}{'有索引(ms)':>12}{'加速':>8}{'全表扫描':>12}")
+    print("-" * 80)
+    for route in before:
+        before_ms, after_ms, scans = before[route][0], after[route][0], full_scans[route]
+        print(f"{route:<32}{before_ms:>12.2f}{after_ms:>12.2f}{before_ms / after_ms:>7.1f}x{scans[0]:>6} -> {scans[1]}")
+    print("-" * 80)
+    print(f"执行计划: {os.path.join(output_dir, 'explain_before.txt')}")
+    print(f"          {os.path.join(output_dir, 'explain_after.txt')}")
+    print("=" * 80)
+
+if __name__ == '__main__':
+    main()
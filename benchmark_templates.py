@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+模板渲染性能测试
+对比 render_template_string（每次请求重新编译）与预编译模板缓存的单次渲染耗时
+
+用法: python benchmark_templates.py [每个页面的渲染次数]
+"""
+
+import os
+import sys
+import time
+
+os.environ.setdefault('DATABASE_URL', 'sqlite:///benchmark_templates.db')
+
+from flask import template_rendered, render_template, render_template_string
+from rich_blog_app import app, init_database, PAGE_TEMPLATES, Post
+
+PUBLIC_PAGES = ['/', '/blog', '/projects', '/timeline', '/links', '/about']
+
+def capture_contexts(client, paths):
+    """请求各页面一次，记录模板名称和渲染上下文"""
+    captured = {}
+
+    def record(sender, template, context, **extra):
+        captured[template.name] = dict(context)
+
+    template_rendered.connect(record, app)
+    try:
+        for path in paths:
+            client.get(path)
+    finally:
+        template_rendered.disconnect(record, app)
+    return captured
+
+def time_render(render, rounds):
+    """返回平均单次渲染耗时（毫秒）"""
+    start = time.perf_counter()
+    for _ in range(rounds):
+        render()
+    return (time.perf_counter() - start) * 1000 / rounds
+
+def main():
+    rounds = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    init_database(app)
+
+    with app.app_context():
+        post = Post.query.filter_by(is_published=True).first()
+        paths = PUBLIC_PAGES + ([f'/post/{post.slug}'] if post else [])
+
+    client = app.test_client()
+    contexts = capture_contexts(client, paths)
+
+    print("=" * 64)
+    print(f"{'模板':<24}{'字符串编译(ms)':>14}{'预编译缓存(ms)':>14}{'加速':>8}")
+    print("-" * 64)
+    for name, context in contexts.items():
+        source = PAGE_TEMPLATES[name]
+        # 去掉上下文处理器注入的变量，渲染时会重新注入
+        params = {k: v for k, v in context.items() if k not in ('g', 'request', 'session', 'config')}
+        with app.test_request_context(paths[0]):
+            before = time_render(lambda: render_template_string(source, **params), rounds)
+            after = time_render(lambda: render_template(name, **params), rounds)
+        print(f"{name:<24}{before:>14.2f}{after:>14.2f}{before / after:>7.1f}x")
+
+    # 冷启动：清空内存缓存后，从字节码缓存加载与从源码编译的对比
+    env = app.jinja_env
+    start = time.perf_counter()
+    for source in PAGE_TEMPLATES.values():
+        env.from_string(source)
+    compile_ms = (time.perf_counter() - start) * 1000
+    env.cache.clear()
+    start = time.perf_counter()
+    for name in PAGE_TEMPLATES:
+        env.get_template(name)
+    load_ms = (time.perf_counter() - start) * 1000
+    print("-" * 64)
+    print(f"全部模板从源码编译: {compile_ms:.1f} ms")
+    print(f"全部模板从字节码缓存加载: {load_ms:.1f} ms")
+    print("=" * 64)
+
+if __name__ == '__main__':
+    main()
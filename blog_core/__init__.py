@@ -0,0 +1,6 @@
+# -*- coding: utf-8 -*-
+"""
+博客共用的基础设施，rich_blog_app.py 和 app 包都从这里导入：
+地理位置查询、访客统计、请求分类、浏览量计数、游标分页、全文检索、搜索联想、相关文章。
+这里不依赖任何一个应用的数据库实例和模型，会话、表由调用方作为参数传入
+"""
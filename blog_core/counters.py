@@ -0,0 +1,422 @@
+# -*- coding: utf-8 -*-
+"""
+文章计数（浏览量、点赞数）的缓冲：可插拔的计数后端（进程内、共享内存、Redis）和定期批量写库的PostCounters
+"""
+
+import mmap
+import os
+import struct
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+from sqlalchemy import bindparam, func
+
+# 可缓冲计数的Post字段（共享内存里按下标存储，只能在末尾追加）
+COUNTER_FIELDS = ('view_count', 'like_count')
+
+class MemoryCounterBackend:
+    """进程内计数（单worker或开发环境）"""
+
+    name = 'memory'
+    # 后端暂时不可用时抛出的异常（PostCounters捕获后改用进程内计数）
+    errors = ()
+
+    def __init__(self):
+        self._counts = {}
+        self._lock = threading.Lock()
+
+    def incr(self, field, post_id, n=1):
+        with self._lock:
+            key = (field, post_id)
+            self._counts[key] = self._counts.get(key, 0) + n
+
+    def get(self, field, post_id):
+        with self._lock:
+            return self._counts.get((field, post_id), 0)
+
+    def collect(self):
+        """取走全部待写入的增量：{(field, post_id): n}"""
+        with self._lock:
+            counts, self._counts = self._counts, {}
+        return counts
+
+    def restore(self, counts):
+        """写库失败时把增量放回"""
+        for (field, post_id), n in counts.items():
+            self.incr(field, post_id, n)
+
+    def pending(self):
+        with self._lock:
+            return sum(self._counts.values())
+
+    def after_fork(self):
+        # fork继承的增量属于父进程，不能重复写入
+        with self._lock:
+            self._counts = {}
+
+class SharedMemoryCounterBackend(MemoryCounterBackend):
+    """
+    单机多worker共享的计数（mmap文件 + 文件锁）
+    文件头为魔数、槽位数和待写入槽位数，之后每个槽位依次存 post_id、字段编号、增量（各8字节），
+    按 (post_id, 字段) 哈希后线性探测；最后是待写入槽位的偏移列表（增量从0变为非0时追加），
+    取走增量时只读这些槽位，不扫描整张表。任意worker都可以取走增量，每个增量只会被写库一次。
+    进程异常退出时未写库的增量保留在文件里，下次启动后照常写入。
+    每个进程各自打开文件：fork继承的是同一个打开的文件描述，flock在持有它的进程之间不互斥
+    """
+
+    name = 'mmap'
+    MAGIC = b'BLOGCNT2'
+    HEADER = struct.Struct('<8sqq')
+    SLOT = struct.Struct('<qqq')
+    PENDING = struct.Struct('<q')
+    # 没有待写入槽位列表的旧格式，打开时把其中未写库的增量转入进程内计数
+    OLD_MAGIC = b'BLOGCNT1'
+    OLD_HEADER = struct.Struct('<8sq')
+
+    def __init__(self, path, slots=65536):
+        import fcntl
+        self._fcntl = fcntl
+        self.path = path
+        self.slots = slots
+        self._file = self._map = None
+        self._lock = threading.Lock()
+        # 槽位表满时退回进程内计数
+        self._overflow = MemoryCounterBackend()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._open()
+        self._forked_pid = os.getpid()
+        # gunicorn preload_app时在master里创建，fork出的worker下次加锁时重新打开
+        os.register_at_fork(after_in_child=self.after_fork)
+
+    def _open(self):
+        """打开并映射计数文件，文件不存在或格式不对时初始化"""
+        if self._map is not None:
+            self._map.close()
+            self._file.close()
+        self._file = open(self.path, 'a+b')
+        if not self._read_header():
+            self._fcntl.flock(self._file, self._fcntl.LOCK_EX)
+            try:
+                if not self._read_header():
+                    self._carry_old_counts()
+                    self._file.truncate(0)
+                    self._file.write(self.HEADER.pack(self.MAGIC, self.slots, 0))
+                    self._file.write(bytes((self.SLOT.size + self.PENDING.size) * self.slots))
+                    self._file.flush()
+            finally:
+                self._fcntl.flock(self._file, self._fcntl.LOCK_UN)
+        self._map = mmap.mmap(self._file.fileno(),
+                              self.HEADER.size + (self.SLOT.size + self.PENDING.size) * self.slots)
+        self._pid = os.getpid()
+
+    def _read_header(self):
+        """文件头有效时沿用其中的槽位数（保留尚未写库的增量），返回是否有效"""
+        self._file.seek(0)
+        header = self._file.read(self.HEADER.size)
+        if len(header) == self.HEADER.size and header[:8] == self.MAGIC:
+            self.slots = self.HEADER.unpack(header)[1]
+            return True
+        return False
+
+    def _carry_old_counts(self):
+        """旧格式文件里尚未写库的增量转入进程内计数，由本进程下次刷写"""
+        self._file.seek(0)
+        data = self._file.read()
+        if data[:8] != self.OLD_MAGIC or len(data) < self.OLD_HEADER.size:
+            return
+        slots = self.OLD_HEADER.unpack_from(data)[1]
+        body = data[self.OLD_HEADER.size:self.OLD_HEADER.size + self.SLOT.size * slots]
+        for post_id, field_id, count in self.SLOT.iter_unpack(body[:len(body) - len(body) % self.SLOT.size]):
+            if post_id and count and field_id < len(COUNTER_FIELDS):
+                self._overflow.incr(COUNTER_FIELDS[field_id], post_id, count)
+
+    @contextmanager
+    def _locked(self):
+        with self._lock:
+            if self._pid != os.getpid():
+                self._open()
+            self._fcntl.flock(self._file, self._fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                self._fcntl.flock(self._file, self._fcntl.LOCK_UN)
+
+    def _offset(self, index):
+        return self.HEADER.size + self.SLOT.size * index
+
+    def _pending_offsets(self):
+        """待写入槽位的偏移（需持有锁）"""
+        count = self.HEADER.unpack_from(self._map)[2]
+        start = self._offset(self.slots)
+        return [offset for offset, in self.PENDING.iter_unpack(
+            self._map[start:start + self.PENDING.size * count])]
+
+    def _add_pending(self, offset):
+        """槽位的增量从0变为非0时记入待写入列表（增量只增不减，每个槽位在列表里最多一次）"""
+        count = self.HEADER.unpack_from(self._map)[2]
+        self.PENDING.pack_into(self._map, self._offset(self.slots) + self.PENDING.size * count, offset)
+        self.HEADER.pack_into(self._map, 0, self.MAGIC, self.slots, count + 1)
+
+    def _find(self, field_id, post_id, insert=False):
+        """返回槽位偏移，未找到（或表满）时返回None"""
+        start = (post_id * len(COUNTER_FIELDS) + field_id) % self.slots
+        for step in range(self.slots):
+            offset = self._offset((start + step) % self.slots)
+            slot_post_id, slot_field_id, _ = self.SLOT.unpack_from(self._map, offset)
+            if slot_post_id == post_id and slot_field_id == field_id:
+                return offset
+            if slot_post_id == 0:
+                if not insert:
+                    return None
+                self.SLOT.pack_into(self._map, offset, post_id, field_id, 0)
+                return offset
+        return None
+
+    def incr(self, field, post_id, n=1):
+        field_id = COUNTER_FIELDS.index(field)
+        with self._locked():
+            offset = self._find(field_id, post_id, insert=True)
+            if offset is not None:
+                count = self.SLOT.unpack_from(self._map, offset)[2]
+                if not count:
+                    # 先记入列表再写增量：进程在两步之间退出时，列表里只是多一个空槽位
+                    self._add_pending(offset)
+                self.SLOT.pack_into(self._map, offset, post_id, field_id, count + n)
+                return
+        self._overflow.incr(field, post_id, n)
+
+    def get(self, field, post_id):
+        field_id = COUNTER_FIELDS.index(field)
+        with self._locked():
+            offset = self._find(field_id, post_id)
+            count = self.SLOT.unpack_from(self._map, offset)[2] if offset is not None else 0
+        return count + self._overflow.get(field, post_id)
+
+    def collect(self):
+        counts = self._overflow.collect()
+        with self._locked():
+            for offset in self._pending_offsets():
+                post_id, field_id, count = self.SLOT.unpack_from(self._map, offset)
+                if post_id and count:
+                    key = (COUNTER_FIELDS[field_id], post_id)
+                    counts[key] = counts.get(key, 0) + count
+                    # 只清零增量，保留键以免打断线性探测链
+                    self.SLOT.pack_into(self._map, offset, post_id, field_id, 0)
+            self.HEADER.pack_into(self._map, 0, self.MAGIC, self.slots, 0)
+        return counts
+
+    def pending(self):
+        total = self._overflow.pending()
+        with self._locked():
+            for offset in self._pending_offsets():
+                total += self.SLOT.unpack_from(self._map, offset)[2]
+        return total
+
+    def after_fork(self):
+        # 共享内存本来就跨进程：子进程下次加锁时重新打开文件（得到自己的文件描述，flock才能互斥），
+        # fork时可能被其他线程持有的线程锁换成新的，丢弃进程内的溢出部分
+        if self._forked_pid != os.getpid():
+            self._forked_pid = os.getpid()
+            self._lock = threading.Lock()
+            self._overflow.after_fork()
+
+class RedisCounterBackend(MemoryCounterBackend):
+    """
+    多节点共享的计数（Redis哈希，HINCRBY累加）
+    取走增量时先把哈希RENAME为临时键再读取删除，多个进程同时取也不会重复写库。
+    临时键登记在一个集合里：进程在RENAME之后、读取之前退出时，下次任一进程取增量时一并取走。
+    连接和读写都有超时，Redis变慢时请求不会被拖住
+    """
+
+    name = 'redis'
+
+    def __init__(self, url, key='blog:post_counters', timeout=0.5):
+        import redis
+        super().__init__()
+        self._redis = redis.Redis.from_url(url, socket_timeout=timeout, socket_connect_timeout=timeout)
+        self._error = redis.ResponseError
+        self.errors = (redis.RedisError,)
+        self.key = key
+        self.flushing_set = f'{key}:flushing'
+        # 客户端是惰性连接的，先试一次，连不上时由create_counter_backend退回进程内计数
+        self._redis.ping()
+
+    def incr(self, field, post_id, n=1):
+        self._redis.hincrby(self.key, f'{field}:{post_id}', n)
+
+    def get(self, field, post_id):
+        return int(self._redis.hget(self.key, f'{field}:{post_id}') or 0)
+
+    def _take(self, flushing_key, counts):
+        """在一个事务里读取并删除临时键、注销登记，累加到counts（同一个键只有一个进程能取到内容）"""
+        pipe = self._redis.pipeline()
+        pipe.hgetall(flushing_key)
+        pipe.delete(flushing_key)
+        pipe.srem(self.flushing_set, flushing_key)
+        for raw_key, raw_count in pipe.execute()[0].items():
+            field, post_id = raw_key.decode().rsplit(':', 1)
+            key = (field, int(post_id))
+            counts[key] = counts.get(key, 0) + int(raw_count)
+
+    def collect(self):
+        counts = {}
+        # 之前RENAME后没来得及读取就退出的进程留下的临时键（正在取的进程的键也可能被先取走，不会重复）
+        for orphan_key in self._redis.smembers(self.flushing_set):
+            self._take(orphan_key, counts)
+        flushing_key = f'{self.key}:flushing:{uuid.uuid4().hex}'
+        pipe = self._redis.pipeline()
+        pipe.sadd(self.flushing_set, flushing_key)
+        pipe.rename(self.key, flushing_key)
+        try:
+            pipe.execute()
+        except self._error:
+            # 键不存在：没有新的增量
+            self._redis.srem(self.flushing_set, flushing_key)
+            return counts
+        self._take(flushing_key, counts)
+        return counts
+
+    def pending(self):
+        return sum(int(count) for count in self._redis.hvals(self.key))
+
+    def after_fork(self):
+        pass
+
+def create_counter_backend(app):
+    """按COUNTER_BACKEND配置创建计数后端，依赖不可用时退回进程内计数"""
+    backend = (app.config.get('COUNTER_BACKEND') or 'memory').lower()
+    try:
+        if backend == 'mmap':
+            path = app.config.get('COUNTER_MMAP_PATH') or os.path.join(app.instance_path, 'post_counters.bin')
+            return SharedMemoryCounterBackend(path, app.config.get('COUNTER_MMAP_SLOTS', 65536))
+        if backend == 'redis':
+            return RedisCounterBackend(app.config.get('REDIS_URL') or 'redis://localhost:6379/0')
+    except Exception as e:
+        print(f"⚠️ 计数后端 {backend} 不可用，改用进程内计数: {e}")
+    return MemoryCounterBackend()
+
+class PostCounters:
+    """
+    文章浏览量、点赞数的缓冲计数
+    请求只把增量交给计数后端（进程内、共享内存或Redis），后台线程每隔flush_interval秒
+    取走全部增量，按字段用原子的 col = col + :n 批量写库；写库失败时增量放回后端，下次重试
+    """
+
+    def __init__(self, app, session, post_table, backend, flush_interval=5.0):
+        self.app = app
+        self.session = session
+        self.post_table = post_table
+        self.backend = backend
+        # 后端（Redis）暂时不可用时的进程内计数，刷写时一并写库
+        self.local = MemoryCounterBackend()
+        self.flush_interval = flush_interval
+        self.recorded = 0
+        self.flushed = 0
+        self.failed_flushes = 0
+        self.backend_errors = 0
+        self._thread = None
+        self._pid = None
+        self._start_lock = threading.Lock()
+
+    def _ensure_started(self):
+        # gunicorn在fork后的worker里才启动后台线程
+        if self._pid == os.getpid() and self._thread and self._thread.is_alive():
+            return
+        with self._start_lock:
+            if self._pid == os.getpid() and self._thread and self._thread.is_alive():
+                return
+            if self._pid is not None and self._pid != os.getpid():
+                self.backend.after_fork()
+                self.local.after_fork()
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name='post-counters', daemon=True)
+            self._thread.start()
+
+    def increment(self, post_id, field='view_count', n=1):
+        """记录一次浏览/点赞，不做任何数据库操作"""
+        self._ensure_started()
+        try:
+            self.backend.incr(field, post_id, n)
+        except self.backend.errors:
+            self.backend_errors += 1
+            self.local.incr(field, post_id, n)
+        self.recorded += n
+
+    def pending(self, post_id, field='view_count'):
+        """尚未写库的增量（展示时加到数据库中的值上）"""
+        try:
+            pending = self.backend.get(field, post_id)
+        except self.backend.errors:
+            self.backend_errors += 1
+            pending = 0
+        return pending + self.local.get(field, post_id)
+
+    def _restore(self, counts):
+        """写库失败时把增量放回后端，后端不可用时放进进程内计数"""
+        try:
+            self.backend.restore(counts)
+        except self.backend.errors:
+            self.backend_errors += 1
+            self.local.restore(counts)
+
+    def _run(self):
+        while True:
+            time.sleep(self.flush_interval)
+            self.flush()
+
+    def flush(self):
+        """把后端中的增量写入数据库（进程退出时也会调用）"""
+        counts = self.local.collect()
+        try:
+            for key, n in self.backend.collect().items():
+                counts[key] = counts.get(key, 0) + n
+        except Exception as e:
+            self.failed_flushes += 1
+            print(f"计数读取失败: {e}")
+        if not counts:
+            return
+
+        by_field = {}
+        for (field, post_id), n in counts.items():
+            by_field.setdefault(field, []).append({'post_id': post_id, 'increment': n})
+
+        post_table = self.post_table
+        with self.app.app_context():
+            try:
+                for field, params in by_field.items():
+                    column = post_table.c[field]
+                    statement = post_table.update().where(post_table.c.id == bindparam('post_id')).values({
+                        column: func.coalesce(column, 0) + bindparam('increment'),
+                        # 计数不算内容修改，保持updated_at（ETag/Last-Modified依赖它）
+                        post_table.c.updated_at: post_table.c.updated_at
+                    })
+                    self.session.execute(statement, params)
+                self.counts_written(self.session.connection(), counts)
+                self.session.commit()
+                self.flushed += sum(counts.values())
+            except Exception as e:
+                self.session.rollback()
+                self.failed_flushes += 1
+                self._restore(counts)
+                print(f"计数写入失败: {e}")
+
+    def counts_written(self, connection, counts):
+        """增量写入文章表的同一事务里调用（批量UPDATE不触发模型事件，需要联动的计数在这里累加）"""
+
+    def stats(self):
+        try:
+            pending = self.backend.pending() + self.local.pending()
+        except Exception:
+            pending = None
+        return {
+            'backend': self.backend.name,
+            'pending': pending,
+            'backend_errors': self.backend_errors,
+            'recorded': self.recorded,
+            'flushed': self.flushed,
+            'failed_flushes': self.failed_flushes
+        }
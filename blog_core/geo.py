@@ -0,0 +1,284 @@
+# -*- coding: utf-8 -*-
+"""
+访客地理位置：离线IP库查询、查询结果缓存、到博主的距离计算
+"""
+
+import bisect
+import csv
+import ipaddress
+import math
+import threading
+import time
+from array import array
+from collections import OrderedDict
+
+try:
+    import numpy as np
+except ImportError:  # 未安装numpy时距离计算退回逐点计算
+    np = None
+
+class GeoIPResolver:
+    """
+    离线IP地理位置查询
+    CSV每行一个IP段：起始IP,结束IP,国家,城市,纬度,经度（可带表头，IP可为点分格式或整数）；
+    加载为按起始地址排序的紧凑数组，查询用二分查找。MMDB文件需要安装maxminddb
+    """
+
+    COLUMN_ALIASES = {
+        'start': ('start', 'start_ip', 'ip_start', 'ip_from', 'range_start'),
+        'end': ('end', 'end_ip', 'ip_end', 'ip_to', 'range_end'),
+        'country': ('country', 'country_name'),
+        'city': ('city', 'city_name'),
+        'latitude': ('latitude', 'lat'),
+        'longitude': ('longitude', 'lon', 'lng'),
+    }
+
+    def __init__(self, path):
+        self.path = path
+        self.loaded = False
+        self.ranges = 0
+        self._lock = threading.Lock()
+        self._mmdb = None
+        self._locations = []
+        # 4: IPv4 用32位数组，6: IPv6 超出数组范围，用int列表
+        self._starts = {4: array('I'), 6: []}
+        self._ends = {4: array('I'), 6: []}
+        self._location_ids = {4: array('I'), 6: array('I')}
+
+    def _ensure_loaded(self):
+        if self.loaded:
+            return
+        with self._lock:
+            if self.loaded:
+                return
+            try:
+                if self.path.endswith('.mmdb'):
+                    import maxminddb
+                    self._mmdb = maxminddb.open_database(self.path)
+                else:
+                    self._load_csv()
+                print(f"✅ 本地IP地理库已加载: {self.path} ({self.ranges} 个IP段)")
+            except Exception as e:
+                print(f"⚠️ 本地IP地理库加载失败: {e}")
+            self.loaded = True
+
+    @staticmethod
+    def _parse_ip(value):
+        value = value.strip()
+        if value.isdigit():
+            number = int(value)
+            return number, 4 if number <= 0xFFFFFFFF else 6
+        ip = ipaddress.ip_address(value)
+        return int(ip), ip.version
+
+    def _header_columns(self, row):
+        """第一行是表头时返回字段到列号的映射，否则返回None"""
+        header = [c.strip().lower() for c in row]
+        columns = {}
+        for field, aliases in self.COLUMN_ALIASES.items():
+            for alias in aliases:
+                if alias in header:
+                    columns[field] = header.index(alias)
+                    break
+        return columns if 'start' in columns and 'end' in columns else None
+
+    def _load_csv(self):
+        rows = []
+        location_index = {}
+        columns = {'start': 0, 'end': 1, 'country': 2, 'city': 3, 'latitude': 4, 'longitude': 5}
+        with open(self.path, newline='', encoding='utf-8') as f:
+            reader = csv.reader(f)
+            for row in reader:
+                if not row:
+                    continue
+                if reader.line_num == 1:
+                    header_columns = self._header_columns(row)
+                    if header_columns:
+                        columns = header_columns
+                        continue
+                try:
+                    start, version = self._parse_ip(row[columns['start']])
+                    end, _ = self._parse_ip(row[columns['end']])
+                    location = (
+                        row[columns['country']].strip() if 'country' in columns else '',
+                        row[columns['city']].strip() if 'city' in columns else '',
+                        float(row[columns['latitude']] or 0) if 'latitude' in columns else 0.0,
+                        float(row[columns['longitude']] or 0) if 'longitude' in columns else 0.0,
+                    )
+                except (ValueError, IndexError):
+                    continue
+                location_id = location_index.get(location)
+                if location_id is None:
+                    location_id = location_index[location] = len(self._locations)
+                    self._locations.append(location)
+                rows.append((version, start, end, location_id))
+
+        rows.sort()
+        for version, start, end, location_id in rows:
+            self._starts[version].append(start)
+            self._ends[version].append(end)
+            self._location_ids[version].append(location_id)
+        self.ranges = len(rows)
+
+    @staticmethod
+    def _mmdb_name(record, key):
+        names = record.get(key, {}).get('names', {})
+        return names.get('zh-CN') or names.get('en', '')
+
+    def lookup(self, ip_address):
+        """返回 {'country','city','latitude','longitude'}，查不到返回None"""
+        if not self.path:
+            return None
+        self._ensure_loaded()
+        try:
+            ip = ipaddress.ip_address(ip_address.split(',')[0].strip())
+        except ValueError:
+            return None
+
+        if self._mmdb is not None:
+            record = self._mmdb.get(str(ip)) or {}
+            if not record:
+                return None
+            location = record.get('location', {})
+            return {
+                'country': self._mmdb_name(record, 'country'),
+                'city': self._mmdb_name(record, 'city'),
+                'latitude': location.get('latitude', 0),
+                'longitude': location.get('longitude', 0)
+            }
+
+        number = int(ip)
+        starts = self._starts[ip.version]
+        index = bisect.bisect_right(starts, number) - 1
+        if index < 0 or number > self._ends[ip.version][index]:
+            return None
+        country, city, latitude, longitude = self._locations[self._location_ids[ip.version][index]]
+        return {'country': country, 'city': city, 'latitude': latitude, 'longitude': longitude}
+
+class GeoCache:
+    """
+    地理位置查询结果的TTL + LRU缓存
+    同时按IP和网段（IPv4 /24、IPv6 /48）缓存：同一运营商网段内轮换的地址直接命中网段结果；
+    查询失败只按IP短期缓存（negative_ttl），避免反复请求在线接口
+    """
+
+    MISSING = object()
+
+    def __init__(self, maxsize, ttl, negative_ttl, use_prefix=True):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.use_prefix = use_prefix
+        self.hits = 0
+        self.prefix_hits = 0
+        self.negative_hits = 0
+        self.private_skips = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def prefix_key(ip):
+        prefix = 24 if ip.version == 4 else 48
+        return str(ipaddress.ip_network(f'{ip}/{prefix}', strict=False))
+
+    def _get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return self.MISSING
+            value, expires = entry
+            if expires < time.time():
+                del self._entries[key]
+                return self.MISSING
+            self._entries.move_to_end(key)
+            return value
+
+    def _set(self, key, value, ttl):
+        with self._lock:
+            self._entries[key] = (value, time.time() + ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def get_or_resolve(self, ip_address, resolve):
+        """返回缓存结果，未命中时调用resolve(ip)并缓存"""
+        try:
+            ip = ipaddress.ip_address(ip_address.split(',')[0].strip())
+        except ValueError:
+            return None
+        if not ip.is_global:
+            # 内网、保留地址不查询
+            self.private_skips += 1
+            return None
+
+        value = self._get(str(ip))
+        if value is not self.MISSING:
+            if value is None:
+                self.negative_hits += 1
+            else:
+                self.hits += 1
+            return value
+        if self.use_prefix:
+            value = self._get(self.prefix_key(ip))
+            if value is not self.MISSING:
+                self.prefix_hits += 1
+                return value
+
+        self.misses += 1
+        value = resolve(str(ip))
+        if value is None:
+            self._set(str(ip), None, self.negative_ttl)
+        else:
+            self._set(str(ip), value, self.ttl)
+            if self.use_prefix:
+                self._set(self.prefix_key(ip), value, self.ttl)
+        return value
+
+    def stats(self):
+        lookups = self.hits + self.prefix_hits + self.negative_hits + self.misses
+        return {
+            'entries': len(self._entries),
+            'hits': self.hits,
+            'prefix_hits': self.prefix_hits,
+            'negative_hits': self.negative_hits,
+            'private_skips': self.private_skips,
+            'misses': self.misses,
+            'hit_rate': round((lookups - self.misses) / lookups, 4) if lookups else 0
+        }
+
+EARTH_RADIUS_KM = 6371.0
+
+def calculate_distance(lat1, lon1, lat2, lon2):
+    """计算两点间的距离（Haversine公式，公里，保留两位小数），坐标无效时返回None"""
+    try:
+        return haversine_distances([lat1], [lon1], lat2, lon2)[0]
+    except (TypeError, ValueError):
+        return None
+
+def haversine_distances(lats, lons, origin_lat, origin_lon):
+    """
+    批量计算各点到原点的球面距离（公里，保留两位小数）
+    安装了numpy时整批向量化计算，否则逐点计算；两种方式公式和取整相同，
+    返回与输入等长的列表，缺经纬度的点为None
+    """
+    if np is not None:
+        # None转为nan，算出的距离也是nan
+        lat = np.radians(np.asarray(lats, dtype=float))
+        lon = np.radians(np.asarray(lons, dtype=float))
+        lat0, lon0 = np.radians(origin_lat), np.radians(origin_lon)
+        a = np.sin((lat - lat0) / 2) ** 2 + np.cos(lat) * np.cos(lat0) * np.sin((lon - lon0) / 2) ** 2
+        distances = 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+        return [None if math.isnan(distance) else round(distance, 2) for distance in distances.tolist()]
+
+    lat0, lon0 = math.radians(origin_lat), math.radians(origin_lon)
+    cos_lat0 = math.cos(lat0)
+    distances = []
+    for lat, lon in zip(lats, lons):
+        if lat is None or lon is None:
+            distances.append(None)
+            continue
+        lat, lon = math.radians(lat), math.radians(lon)
+        a = math.sin((lat - lat0) / 2) ** 2 + math.cos(lat) * cos_lat0 * math.sin((lon - lon0) / 2) ** 2
+        distances.append(round(2 * EARTH_RADIUS_KM * math.asin(math.sqrt(min(a, 1.0))), 2))
+    return distances
@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+"""
+游标分页：按 (created_at, id) 的keyset分页，以及按相关度排序的检索结果的游标
+"""
+
+import base64
+import json
+from datetime import datetime
+
+from sqlalchemy import and_, or_
+
+def encode_cursor(post, direction='next'):
+    """把文章的 (created_at, id) 编码为不透明的游标"""
+    raw = json.dumps([post.created_at.isoformat(), post.id, direction[0]])
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+def decode_cursor(cursor):
+    """解析游标，返回 (created_at, id, 'next'|'prev')；格式不对时返回None"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        created_at, post_id, direction = json.loads(raw)
+        return datetime.fromisoformat(created_at), int(post_id), {'n': 'next', 'p': 'prev'}[direction]
+    except (ValueError, TypeError, KeyError):
+        return None
+
+def encode_rank_cursor(post_id, direction='next'):
+    """按相关度排序的检索结果的游标：记录上一页首/末篇文章的id"""
+    raw = json.dumps(['rank', post_id, direction[0]])
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+def decode_rank_cursor(cursor):
+    """解析相关度游标，返回 (id, 'next'|'prev')；不是相关度游标时返回None"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        kind, post_id, direction = json.loads(raw)
+        if kind != 'rank':
+            return None
+        return int(post_id), {'n': 'next', 'p': 'prev'}[direction]
+    except (ValueError, TypeError, KeyError):
+        return None
+
+def ranked_page(ranked_ids, decoded, per_page):
+    """
+    在按相关度排好的id列表（数量有上限，已在内存中）里按游标取一页
+    游标中的文章已不在结果里时从第一页开始；返回 (本页id列表, next_cursor, prev_cursor)
+    """
+    post_id, direction = decoded
+    start = 0
+    if post_id in ranked_ids:
+        position = ranked_ids.index(post_id)
+        start = position + 1 if direction == 'next' else max(position - per_page, 0)
+    page_ids = ranked_ids[start:start + per_page]
+    next_cursor = encode_rank_cursor(page_ids[-1], 'next') if start + per_page < len(ranked_ids) and page_ids else None
+    prev_cursor = encode_rank_cursor(page_ids[0], 'prev') if start > 0 and page_ids else None
+    return page_ids, next_cursor, prev_cursor
+
+def keyset_paginate(query, model, cursor, per_page):
+    """
+    按model的 (created_at, id) 倒序做游标分页，只取 per_page+1 行，不做COUNT和OFFSET
+    返回 (本页列表, next_cursor, prev_cursor)；游标无效时从第一页开始
+    """
+    decoded = decode_cursor(cursor) if cursor else None
+    if decoded and decoded[2] == 'prev':
+        created_at, post_id, _ = decoded
+        rows = query.filter(or_(
+            model.created_at > created_at,
+            and_(model.created_at == created_at, model.id > post_id)
+        )).order_by(model.created_at.asc(), model.id.asc()).limit(per_page + 1).all()
+        items = list(reversed(rows[:per_page]))
+        has_prev, has_next = len(rows) > per_page, True
+    else:
+        if decoded:
+            created_at, post_id, _ = decoded
+            query = query.filter(or_(
+                model.created_at < created_at,
+                and_(model.created_at == created_at, model.id < post_id)
+            ))
+        rows = query.order_by(model.created_at.desc(), model.id.desc()).limit(per_page + 1).all()
+        items = rows[:per_page]
+        has_prev, has_next = decoded is not None, len(rows) > per_page
+    next_cursor = encode_cursor(items[-1], 'next') if has_next and items else None
+    prev_cursor = encode_cursor(items[0], 'prev') if has_prev and items else None
+    return items, next_cursor, prev_cursor
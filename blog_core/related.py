@@ -0,0 +1,299 @@
+# -*- coding: utf-8 -*-
+"""
+基于内容的相关文章：TF-IDF向量的余弦相似度，前k名预先写入近邻表
+"""
+
+import heapq
+import math
+import os
+import threading
+from collections import defaultdict
+
+from sqlalchemy import func, select
+
+from blog_core.search import tokenize_search_text
+
+try:
+    import numpy as np
+except ImportError:  # 未安装numpy时全量重算逐篇计算
+    np = None
+
+# 相关文章的TF-IDF字段权重（标签最能说明主题，正文最长、权重最低）
+RELATED_FIELD_WEIGHTS = {'title': 3.0, 'summary': 2.0, 'content': 1.0, 'tags': 4.0}
+
+class RelatedPostsEngine:
+    """
+    基于内容的相关文章：标题、摘要、正文、标签的TF-IDF向量，余弦相似度取前k名写入post_neighbor表
+    模型（IDF、各文章的归一化向量和倒排表）常驻内存：文章保存后只记下文章id，由后台线程
+    只重新切词、向量化变化的文章，再按倒排表计算相似度；IDF只在全量拟合时更新
+    （进程内首次使用、增量更新的文章累计超过refit_ratio、或 flask rebuild-related-posts）。
+    全量重算有numpy时用稀疏矩阵（CSR/CSC数组）向量化计算。
+    文章表、近邻表和读取文章内容的load_documents(connection, post_ids=None)由调用方传入
+    """
+
+    def __init__(self, app, session, post_table, neighbor_table, load_documents, k, refit_ratio=0.2):
+        self.app = app
+        self.session = session
+        self.post_table = post_table
+        self.neighbor_table = neighbor_table
+        self.load_documents = load_documents
+        self.k = k
+        self.refit_ratio = refit_ratio
+        self.rebuilt_posts = 0
+        self.updated_posts = 0
+        self.fits = 0
+        self.failures = 0
+        self._model = None
+        self._lock = threading.Lock()
+        self._pending = set()
+        self._pending_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+        self._pid = None
+        self._start_lock = threading.Lock()
+
+    def _ensure_started(self):
+        # gunicorn在fork后的worker里才启动后台线程
+        if self._pid == os.getpid() and self._thread and self._thread.is_alive():
+            return
+        with self._start_lock:
+            if self._pid == os.getpid() and self._thread and self._thread.is_alive():
+                return
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name='related-posts', daemon=True)
+            self._thread.start()
+
+    def schedule(self, post_ids):
+        """文章提交后调用：只记下变化的文章，由后台线程增量重算"""
+        with self._pending_lock:
+            self._pending.update(post_ids)
+        self._ensure_started()
+        self._wakeup.set()
+
+    def _run(self):
+        while True:
+            self._wakeup.wait()
+            self._wakeup.clear()
+            self.drain()
+
+    def drain(self):
+        """同步处理排队的文章（后台线程和进程退出时调用）"""
+        with self._pending_lock:
+            changed, self._pending = self._pending, set()
+        if not changed:
+            return
+        try:
+            with self.app.app_context():
+                self.update(changed)
+        except Exception as e:
+            # 相关文章只影响侧栏，失败不影响保存，可用 flask rebuild-related-posts 补算
+            self.failures += 1
+            print(f"⚠️ 相关文章更新失败: {e}")
+
+    @staticmethod
+    def _term_counts(document):
+        counts = defaultdict(float)
+        for field, weight in RELATED_FIELD_WEIGHTS.items():
+            for token in tokenize_search_text(document[field]):
+                counts[token] += weight
+        return counts
+
+    @staticmethod
+    def _vectorize(counts, model):
+        """L2归一化的TF-IDF向量（亚线性词频；拟合后新出现的词按只出现在一篇文章计）"""
+        idf, default_idf = model['idf'], model['default_idf']
+        vector = {token: (1 + math.log(tf)) * idf.get(token, default_idf) for token, tf in counts.items()}
+        norm = math.sqrt(sum(w * w for w in vector.values())) or 1.0
+        return {token: w / norm for token, w in vector.items()}
+
+    @staticmethod
+    def _set_vector(model, post_id, vector):
+        """替换某篇文章的向量并维护倒排表，vector为None时移除"""
+        postings = model['postings']
+        for token in model['vectors'].pop(post_id, {}):
+            postings[token].pop(post_id, None)
+            if not postings[token]:
+                del postings[token]
+        if vector is not None:
+            model['vectors'][post_id] = vector
+            for token, w in vector.items():
+                postings[token][post_id] = w
+
+    def _fit(self, connection):
+        """读取全部已发布文章，拟合IDF（平滑）并向量化"""
+        synced_at = connection.execute(select(func.max(self.post_table.c.updated_at))).scalar()
+        documents = self.load_documents(connection)
+        rows = {post_id: self._term_counts(document) for post_id, document in documents.items()}
+        document_frequency = defaultdict(int)
+        for counts in rows.values():
+            for token in counts:
+                document_frequency[token] += 1
+        count = len(rows)
+        model = {
+            'idf': {token: math.log((1 + count) / (1 + df)) + 1 for token, df in document_frequency.items()},
+            'default_idf': math.log((1 + count) / 2) + 1,
+            'vectors': {},
+            'postings': defaultdict(dict),
+            'synced_at': synced_at,
+            'updates': 0
+        }
+        for post_id, counts in rows.items():
+            self._set_vector(model, post_id, self._vectorize(counts, model))
+        self.fits += 1
+        return model
+
+    @staticmethod
+    def _similarities(model, post_id):
+        """某篇文章与其他文章的余弦相似度 {post_id: score}，只含有共同词的文章"""
+        scores = defaultdict(float)
+        postings = model['postings']
+        for token, w in model['vectors'][post_id].items():
+            for other, other_w in postings[token].items():
+                scores[other] += w * other_w
+        scores.pop(post_id, None)
+        return scores
+
+    def _top(self, scores):
+        """相似度最高的k篇（只保留相似度大于0的）"""
+        return [(post_id, score) for post_id, score in
+                heapq.nlargest(self.k, scores.items(), key=lambda item: (item[1], -item[0])) if score > 0]
+
+    def _rebuild_params(self, model):
+        """全量重算所有文章的前k名；有numpy时把向量拼成CSR/CSC数组一次性计算"""
+        post_ids = sorted(model['vectors'])
+        if np is None:
+            return {post_id: self._top(self._similarities(model, post_id)) for post_id in post_ids}
+
+        columns = {}
+        indices, data = [], []
+        indptr = np.zeros(len(post_ids) + 1, dtype=np.int64)
+        for row, post_id in enumerate(post_ids):
+            for token, w in model['vectors'][post_id].items():
+                indices.append(columns.setdefault(token, len(columns)))
+                data.append(w)
+            indptr[row + 1] = len(indices)
+        count = len(post_ids)
+        indices = np.array(indices, dtype=np.int64)
+        data = np.array(data, dtype=np.float64)
+        row_of_entry = np.repeat(np.arange(count), np.diff(indptr))
+        # 按列排序得到CSC，用于一次取出某些词的全部文档
+        order = np.argsort(indices, kind='stable')
+        column_ptr = np.zeros(len(columns) + 1, dtype=np.int64)
+        column_ptr[1:] = np.cumsum(np.bincount(indices, minlength=len(columns)))
+        column_rows, column_data = row_of_entry[order], data[order]
+
+        neighbors = {}
+        k = min(self.k, count)
+        for row, post_id in enumerate(post_ids):
+            start, end = indptr[row], indptr[row + 1]
+            row_columns, weights = indices[start:end], data[start:end]
+            lengths = column_ptr[row_columns + 1] - column_ptr[row_columns]
+            offsets = np.repeat(column_ptr[row_columns] - (np.cumsum(lengths) - lengths), lengths)
+            positions = np.arange(lengths.sum()) + offsets
+            scores = np.bincount(column_rows[positions], weights=column_data[positions] * np.repeat(weights, lengths),
+                                 minlength=count)
+            scores[row] = -1.0
+            # 与第k名同分的都留作候选，按 (相似度, id) 排序，与增量计算的结果一致
+            top = np.flatnonzero(scores >= scores[np.argpartition(-scores, k - 1)[k - 1]]) if k else []
+            neighbors[post_id] = [(post_ids[i], float(scores[i]))
+                                  for i in sorted(top, key=lambda i: (-scores[i], post_ids[i]))[:k] if scores[i] > 0]
+        return neighbors
+
+    def _resync(self, model, connection, post_ids):
+        """重新读取这些文章写进模型（未发布、已删除的从模型中移除）"""
+        documents = self.load_documents(connection, list(post_ids))
+        for post_id in post_ids:
+            document = documents.get(post_id)
+            self._set_vector(model, post_id, self._vectorize(self._term_counts(document), model) if document else None)
+
+    def _sync(self, connection, changed_ids):
+        """
+        把变化的文章写进内存模型，返回实际变化的文章id：除了本进程提交的，还包括其他worker
+        修改过（updated_at不早于上次同步，按条件查询）的文章；其他worker删除的文章查不到updated_at，
+        已发布文章数与模型对不上时再只按id核对一遍。只读取变化文章的内容
+        """
+        model = self._model
+        posts = self.post_table.c
+        synced_at = model['synced_at']
+        statement = select(posts.id, posts.updated_at)
+        if synced_at is not None:
+            statement = statement.where(posts.updated_at >= synced_at)
+        recent = dict(connection.execute(statement).all())
+        changed = set(changed_ids) | set(recent)
+        self._resync(model, connection, changed)
+        published_count = connection.execute(
+            select(func.count()).select_from(self.post_table).where(posts.is_published == True)).scalar()
+        if published_count != len(model['vectors']):
+            published = set(connection.execute(select(posts.id).where(posts.is_published == True)).scalars())
+            drifted = published ^ set(model['vectors'])
+            self._resync(model, connection, drifted)
+            changed |= drifted
+        model['synced_at'] = max((updated_at for updated_at in recent.values() if updated_at), default=synced_at)
+        model['updates'] += len(changed)
+        return changed
+
+    def update(self, changed_ids=None):
+        """
+        重算相关文章并写表：changed_ids为None时重新拟合并全部重算；否则只重新向量化这些文章，
+        重算它们以及原列表中含有它们、或与它们的相似度超过自己第k名的文章。返回重算的文章数
+        """
+        neighbor_table = self.neighbor_table
+        with self._lock, self.session.get_bind().begin() as connection:
+            model = self._model
+            if changed_ids is None or model is None or \
+                    model['updates'] > self.refit_ratio * max(len(model['vectors']), 1):
+                model = self._model = self._fit(connection)
+            if changed_ids is None:
+                neighbors = self._rebuild_params(model)
+                targets = set(neighbors)
+                connection.execute(neighbor_table.delete())
+            else:
+                changed_ids = self._sync(connection, changed_ids)
+                similarities = {post_id: self._similarities(model, post_id)
+                                for post_id in changed_ids if post_id in model['vectors']}
+                targets = set(similarities)
+                columns = neighbor_table.c
+                # 原列表含有变化文章的文章都要重算（按neighbor_id索引只读这些行）
+                if changed_ids:
+                    targets.update(post_id for post_id in connection.execute(select(columns.post_id).where(
+                        columns.neighbor_id.in_(changed_ids))).scalars() if post_id in model['vectors'])
+                # 与变化文章有共同词的其他文章：与它们的相似度超过自己第k名（不足k篇时为0）才需要重算，
+                # 第k名只读每篇文章rank为k-1的一行
+                candidates = [post_id for post_id in set().union(*similarities.values()) - targets
+                              if post_id in model['vectors']]
+                weakest = {}
+                for offset in range(0, len(candidates), 500):
+                    weakest.update(connection.execute(select(columns.post_id, columns.score).where(
+                        columns.rank == self.k - 1, columns.post_id.in_(candidates[offset:offset + 500]))).all())
+                targets.update(post_id for post_id in candidates if any(
+                    scores.get(post_id, 0.0) > weakest.get(post_id, 0.0) for scores in similarities.values()))
+                stale = targets | (changed_ids - set(model['vectors']))
+                if stale:
+                    connection.execute(neighbor_table.delete().where(neighbor_table.c.post_id.in_(stale)))
+                neighbors = {post_id: self._top(similarities.get(post_id) or self._similarities(model, post_id))
+                             for post_id in targets}
+
+            params = [{'post_id': post_id, 'rank': rank, 'neighbor_id': neighbor_id, 'score': score}
+                      for post_id, top in neighbors.items() for rank, (neighbor_id, score) in enumerate(top)]
+            if params:
+                connection.execute(neighbor_table.insert(), params)
+
+        if changed_ids is None:
+            self.rebuilt_posts = len(targets)
+        else:
+            self.updated_posts += len(targets)
+        return len(targets)
+
+    def stats(self):
+        model = self._model
+        return {
+            'k': self.k,
+            'mode': 'numpy' if np is not None else 'python',
+            'model_posts': len(model['vectors']) if model else 0,
+            'vocabulary': len(model['idf']) if model else 0,
+            'fits': self.fits,
+            'pending': len(self._pending),
+            'failures': self.failures,
+            'rebuilt_posts': self.rebuilt_posts,
+            'updated_posts': self.updated_posts
+        }
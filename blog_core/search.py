@@ -0,0 +1,400 @@
+# -*- coding: utf-8 -*-
+"""
+文章全文检索：中日韩文字二元组切词、索引文档读取、可替换的索引后端（SQLite FTS5、MySQL全文索引、
+进程内倒排索引）以及检索结果的高亮
+后端通过会话访问数据库，文档由调用方传入的load_documents(connection, post_ids=None)读取
+"""
+
+import math
+import re
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+from collections import defaultdict
+
+from markupsafe import Markup, escape
+from sqlalchemy import bindparam, select, text as sql_text
+from sqlalchemy.engine import make_url
+
+from blog_core.versions import bump_file_version, file_version
+
+# 中日韩文字：连续的一段切成重叠的二元组，末字单独成词（单字检索按前缀匹配）
+CJK_RANGES = '\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff\uac00-\ud7af'
+SEARCH_TOKEN_PATTERN = re.compile(f'[{CJK_RANGES}]+|[0-9a-zÀ-ɏ]+')
+CJK_RUN_PATTERN = re.compile(f'^[{CJK_RANGES}]+$')
+
+# 标题、摘要、正文、标签各字段的权重
+SEARCH_FIELD_WEIGHTS = {'title': 10.0, 'summary': 4.0, 'content': 1.0, 'tags': 6.0}
+SEARCH_SNIPPET_LENGTH = 120
+MARKDOWN_SYNTAX_PATTERN = re.compile(r'!\[[^\]]*\]\([^)]*\)|\[([^\]]*)\]\([^)]*\)|[#>*_`~|]+')
+
+def tokenize_search_text(text):
+    """切词：拉丁字母和数字按词，中日韩文字按二元组"""
+    tokens = []
+    for run in SEARCH_TOKEN_PATTERN.findall((text or '').lower()):
+        if CJK_RUN_PATTERN.match(run):
+            tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+            tokens.append(run[-1])
+        else:
+            tokens.append(run)
+    return tokens
+
+def parse_search_query(query):
+    """
+    把检索词拆成 [(词组, 是否前缀)]：多字的中文词是一组连续的二元组（短语匹配），
+    单个汉字按前缀匹配，其余每个词一组；各组之间为“与”
+    """
+    groups = []
+    for run in SEARCH_TOKEN_PATTERN.findall((query or '').lower()):
+        if CJK_RUN_PATTERN.match(run):
+            if len(run) == 1:
+                groups.append(([run], True))
+            else:
+                groups.append(([run[i:i + 2] for i in range(len(run) - 1)], False))
+        else:
+            groups.append(([run], False))
+    return groups
+
+def load_search_documents(connection, post_table, tag_table, post_tags, post_ids=None):
+    """读取已发布文章的索引文档 {post_id: {title, summary, content, tags}}；post_ids为None时读取全部"""
+    statement = select(post_table.c.id, post_table.c.title, post_table.c.summary, post_table.c.content).where(
+        post_table.c.is_published == True)
+    if post_ids is not None:
+        if not post_ids:
+            return {}
+        statement = statement.where(post_table.c.id.in_(post_ids))
+    documents = {
+        row.id: {'title': row.title or '', 'summary': row.summary or '', 'content': row.content or '', 'tags': []}
+        for row in connection.execute(statement)
+    }
+    if documents:
+        tag_rows = connection.execute(
+            select(post_tags.c.post_id, tag_table.c.name).join(
+                tag_table, tag_table.c.id == post_tags.c.tag_id).where(post_tags.c.post_id.in_(documents)))
+        for post_id, name in tag_rows:
+            documents[post_id]['tags'].append(name)
+    for document in documents.values():
+        document['tags'] = ' '.join(document['tags'])
+    return documents
+
+class SearchIndex(ABC):
+    """
+    文章全文索引（标题、摘要、正文、标签）
+    transactional为True的实现在flush时与文章修改写入同一事务，否则在提交后更新
+    """
+
+    name = 'base'
+    transactional = True
+
+    def __init__(self, session, load_documents):
+        self.session = session
+        self.load_documents = load_documents
+
+    def setup(self, connection):
+        """在connection上创建索引表（已存在时跳过）"""
+
+    def is_empty(self):
+        return False
+
+    @abstractmethod
+    def search(self, query, limit):
+        """返回按相关度从高到低排列的 [(post_id, 得分)]"""
+
+    @abstractmethod
+    def apply(self, connection, documents, removed_ids):
+        """写入新文档 {post_id: 文档}，删除removed_ids"""
+
+    def rebuild(self):
+        """从文章表重建全部索引，返回文档数"""
+        with self.session.get_bind().begin() as connection:
+            self.clear(connection)
+            documents = self.load_documents(connection)
+            self.apply(connection, documents, ())
+        return len(documents)
+
+    @abstractmethod
+    def clear(self, connection):
+        """删除全部索引（在connection的事务中）"""
+
+    def stats(self):
+        return {'backend': self.name}
+
+class Fts5SearchIndex(SearchIndex):
+    """SQLite FTS5：文本先按tokenize_search_text切好再写入，bm25按字段加权排序"""
+
+    name = 'fts5'
+
+    def setup(self, connection):
+        connection.exec_driver_sql(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS post_search USING fts5("
+            "title, summary, content, tags, tokenize='unicode61 remove_diacritics 0')")
+
+    def is_empty(self):
+        return self.session.execute(sql_text('SELECT rowid FROM post_search LIMIT 1')).first() is None
+
+    def search(self, query, limit):
+        groups = parse_search_query(query)
+        if not groups:
+            return []
+        match = ' '.join('"%s"*' % tokens[0] if prefix else '"%s"' % ' '.join(tokens) for tokens, prefix in groups)
+        weights = ', '.join(str(weight) for weight in SEARCH_FIELD_WEIGHTS.values())
+        rows = self.session.execute(sql_text(
+            f'SELECT rowid, bm25(post_search, {weights}) AS rank FROM post_search '
+            'WHERE post_search MATCH :match ORDER BY rank LIMIT :limit'
+        ), {'match': match, 'limit': limit})
+        # bm25越小越相关
+        return [(post_id, -rank) for post_id, rank in rows]
+
+    def apply(self, connection, documents, removed_ids):
+        stale = list(documents) + list(removed_ids)
+        if stale:
+            connection.execute(sql_text('DELETE FROM post_search WHERE rowid IN :ids').bindparams(
+                bindparam('ids', expanding=True)), {'ids': stale})
+        if documents:
+            connection.execute(sql_text(
+                'INSERT INTO post_search (rowid, title, summary, content, tags) '
+                'VALUES (:post_id, :title, :summary, :content, :tags)'
+            ), [
+                {'post_id': post_id, **{field: ' '.join(tokenize_search_text(document[field]))
+                                        for field in SEARCH_FIELD_WEIGHTS}}
+                for post_id, document in documents.items()
+            ])
+
+    def clear(self, connection):
+        connection.exec_driver_sql('DELETE FROM post_search')
+
+class MySQLSearchIndex(SearchIndex):
+    """MySQL FULLTEXT索引（ngram解析器负责中文切分），标题单独建索引用于加权"""
+
+    name = 'mysql'
+
+    def setup(self, connection):
+        connection.exec_driver_sql(
+            'CREATE TABLE IF NOT EXISTS post_search ('
+            'post_id INT PRIMARY KEY, title VARCHAR(200), summary TEXT, content MEDIUMTEXT, tags VARCHAR(1000), '
+            'FULLTEXT KEY ft_post_search_title (title) WITH PARSER ngram, '
+            'FULLTEXT KEY ft_post_search (title, summary, content, tags) WITH PARSER ngram'
+            ') ENGINE=InnoDB DEFAULT CHARSET=utf8mb4')
+
+    def is_empty(self):
+        return self.session.execute(sql_text('SELECT post_id FROM post_search LIMIT 1')).first() is None
+
+    def search(self, query, limit):
+        # 布尔模式：每个词都必须出现；单字用前缀匹配（短于ngram_token_size）
+        words = [re.sub(r'[+\-<>()~*"@]', '', word) for word in (query or '').split()]
+        expression = ' '.join(f'+{word}*' if len(word) == 1 else f'+"{word}"' for word in words if word)
+        if not expression:
+            return []
+        rows = self.session.execute(sql_text(
+            'SELECT post_id, '
+            f"MATCH(title) AGAINST(:q IN BOOLEAN MODE) * {SEARCH_FIELD_WEIGHTS['title']} "
+            '+ MATCH(title, summary, content, tags) AGAINST(:q IN BOOLEAN MODE) AS score '
+            'FROM post_search WHERE MATCH(title, summary, content, tags) AGAINST(:q IN BOOLEAN MODE) '
+            'ORDER BY score DESC LIMIT :limit'
+        ), {'q': expression, 'limit': limit})
+        return [(post_id, score) for post_id, score in rows]
+
+    def apply(self, connection, documents, removed_ids):
+        stale = list(documents) + list(removed_ids)
+        if stale:
+            connection.execute(sql_text('DELETE FROM post_search WHERE post_id IN :ids').bindparams(
+                bindparam('ids', expanding=True)), {'ids': stale})
+        if documents:
+            connection.execute(sql_text(
+                'INSERT INTO post_search (post_id, title, summary, content, tags) '
+                'VALUES (:post_id, :title, :summary, :content, :tags)'
+            ), [{'post_id': post_id, **document} for post_id, document in documents.items()])
+
+    def clear(self, connection):
+        connection.exec_driver_sql('DELETE FROM post_search')
+
+class PythonSearchIndex(SearchIndex):
+    """
+    进程内倒排索引（其他数据库的兜底），BM25排序，首次检索时从文章表构建
+    本进程提交后增量更新；通过版本文件的mtime通知其他worker重建
+    """
+
+    name = 'python'
+    transactional = False
+    k1 = 1.2
+    b = 0.75
+
+    def __init__(self, session, load_documents, version_path):
+        super().__init__(session, load_documents)
+        self.version_path = version_path
+        self._postings = defaultdict(dict)  # 词 -> {post_id: 加权词频}
+        self._doc_terms = {}  # post_id -> 文档包含的词（删除时用）
+        self._doc_lengths = {}
+        self._total_length = 0.0
+        self._version = None
+        self._lock = threading.RLock()
+
+    def _current_version(self):
+        return file_version(self.version_path)
+
+    def _bump_version(self):
+        try:
+            bump_file_version(self.version_path)
+        except OSError as e:
+            print(f"⚠️ 检索索引版本更新失败: {e}")
+
+    def _ensure_built(self):
+        version = self._current_version()
+        if self._version == version:
+            return
+        with self._lock:
+            if self._version == version:
+                return
+            with self.session.get_bind().connect() as connection:
+                documents = self.load_documents(connection)
+            self._postings.clear()
+            self._doc_terms.clear()
+            self._doc_lengths.clear()
+            self._total_length = 0.0
+            for post_id, document in documents.items():
+                self._add(post_id, document)
+            self._version = version
+
+    def _add(self, post_id, document):
+        frequencies = defaultdict(float)
+        for field, weight in SEARCH_FIELD_WEIGHTS.items():
+            for token in tokenize_search_text(document[field]):
+                frequencies[token] += weight
+        for token, frequency in frequencies.items():
+            self._postings[token][post_id] = frequency
+        self._doc_terms[post_id] = list(frequencies)
+        self._doc_lengths[post_id] = sum(frequencies.values())
+        self._total_length += self._doc_lengths[post_id]
+
+    def _remove(self, post_id):
+        for token in self._doc_terms.pop(post_id, ()):
+            postings = self._postings.get(token)
+            if postings is not None:
+                postings.pop(post_id, None)
+                if not postings:
+                    del self._postings[token]
+        self._total_length -= self._doc_lengths.pop(post_id, 0.0)
+
+    def _group_postings(self, tokens, prefix):
+        """一组词的命中文档 {post_id: 词频}：组内每个词都要出现（近似短语匹配）"""
+        if prefix:
+            merged = defaultdict(float)
+            for token, postings in list(self._postings.items()):
+                if token.startswith(tokens[0]):
+                    for post_id, frequency in postings.items():
+                        merged[post_id] += frequency
+            return merged
+        merged = None
+        for token in tokens:
+            postings = self._postings.get(token, {})
+            if merged is None:
+                merged = dict(postings)
+            else:
+                merged = {post_id: frequency + postings[post_id]
+                          for post_id, frequency in merged.items() if post_id in postings}
+        return merged or {}
+
+    def search(self, query, limit):
+        groups = parse_search_query(query)
+        if not groups:
+            return []
+        self._ensure_built()
+        with self._lock:
+            count = len(self._doc_lengths)
+            if not count:
+                return []
+            average_length = self._total_length / count
+            scores = None
+            for tokens, prefix in groups:
+                postings = self._group_postings(tokens, prefix)
+                idf = math.log(1 + (count - len(postings) + 0.5) / (len(postings) + 0.5))
+                group_scores = {
+                    post_id: idf * frequency * (self.k1 + 1) / (
+                        frequency + self.k1 * (1 - self.b + self.b * self._doc_lengths[post_id] / average_length))
+                    for post_id, frequency in postings.items()
+                }
+                if scores is None:
+                    scores = group_scores
+                else:
+                    scores = {post_id: score + group_scores[post_id]
+                              for post_id, score in scores.items() if post_id in group_scores}
+        return sorted(scores.items(), key=lambda item: (-item[1], -item[0]))[:limit]
+
+    def apply(self, connection, documents, removed_ids):
+        with self._lock:
+            if self._version is not None:
+                for post_id in list(documents) + list(removed_ids):
+                    self._remove(post_id)
+                for post_id, document in documents.items():
+                    self._add(post_id, document)
+            # 其他worker下次检索时重建；本进程已是最新
+            self._bump_version()
+            if self._version is not None:
+                self._version = self._current_version()
+
+    def clear(self, connection):
+        """丢弃进程内索引，下次检索时重建"""
+        with self._lock:
+            self._version = None
+
+    def rebuild(self):
+        with self._lock:
+            self._version = None
+            self._bump_version()
+            self._ensure_built()
+            return len(self._doc_lengths)
+
+    def stats(self):
+        return {'backend': self.name, 'documents': len(self._doc_lengths), 'terms': len(self._postings)}
+
+def create_search_index(app, session, load_documents, version_path):
+    """
+    SEARCH_BACKEND为auto时按数据库选择：SQLite用FTS5，MySQL用ngram全文索引，其余用进程内索引
+    （进程内索引用version_path的mtime通知其他worker重建）
+    """
+    backend = (app.config.get('SEARCH_BACKEND') or 'auto').lower()
+    if backend == 'auto':
+        dialect = make_url(app.config['SQLALCHEMY_DATABASE_URI']).get_backend_name()
+        backend = {'sqlite': 'fts5', 'mysql': 'mysql'}.get(dialect, 'python')
+    if backend == 'fts5':
+        try:
+            sqlite3.connect(':memory:').execute('CREATE VIRTUAL TABLE fts5_check USING fts5(body)')
+            return Fts5SearchIndex(session, load_documents)
+        except sqlite3.Error as e:
+            print(f"⚠️ SQLite不支持FTS5，改用进程内索引: {e}")
+    elif backend == 'mysql':
+        return MySQLSearchIndex(session, load_documents)
+    return PythonSearchIndex(session, load_documents, version_path)
+
+def search_terms(query):
+    """用于高亮的检索词（长词优先匹配）"""
+    return sorted({word for word in (query or '').lower().split()}, key=len, reverse=True)
+
+def highlight_text(text, terms):
+    """转义HTML并用<mark>标出检索词"""
+    text = text or ''
+    if not terms:
+        return escape(text)
+    pattern = re.compile('|'.join(re.escape(term) for term in terms), re.IGNORECASE)
+    parts, last = [], 0
+    for match in pattern.finditer(text):
+        parts.append(escape(text[last:match.start()]))
+        parts.append(Markup('<mark>%s</mark>') % match.group())
+        last = match.end()
+    parts.append(escape(text[last:]))
+    return Markup('').join(parts)
+
+def search_snippet(content, terms, length=SEARCH_SNIPPET_LENGTH):
+    """截取正文中第一个命中位置附近的一段纯文本并高亮"""
+    plain = ' '.join(MARKDOWN_SYNTAX_PATTERN.sub(lambda m: m.group(1) or '', content or '').split())
+    start = 0
+    if terms:
+        match = re.search('|'.join(re.escape(term) for term in terms), plain, re.IGNORECASE)
+        if match:
+            start = max(0, match.start() - length // 4)
+    snippet = plain[start:start + length]
+    return Markup('').join([
+        '…' if start > 0 else '',
+        highlight_text(snippet, terms),
+        '…' if start + length < len(plain) else ''
+    ])
@@ -0,0 +1,139 @@
+# -*- coding: utf-8 -*-
+"""
+搜索框联想：文章标题、标签、分类的内存前缀索引
+条目由调用方传入的load_entries(connection)读取（各应用的权重来源不同）
+"""
+
+import bisect
+import threading
+import time
+
+from blog_core.search import CJK_RUN_PATTERN, SEARCH_TOKEN_PATTERN
+from blog_core.versions import bump_file_version, file_version
+
+SUGGEST_KEY_POSITIONS = 32  # 每个名称最多从前多少个词/字的位置建前缀键
+
+def suggest_keys(text):
+    """名称的前缀键：整体一个，之后每个拉丁词开头、每个汉字处各一个（输入名称中间的词也能命中）"""
+    lowered = ' '.join((text or '').lower().split())
+    if not lowered:
+        return []
+    keys = {lowered}
+    for match in SEARCH_TOKEN_PATTERN.finditer(lowered):
+        if CJK_RUN_PATTERN.match(match.group()):
+            keys.update(lowered[match.start() + i:] for i in range(len(match.group())))
+        else:
+            keys.add(lowered[match.start():])
+        if len(keys) >= SUGGEST_KEY_POSITIONS:
+            break
+    return sorted(keys)
+
+class SuggestIndex:
+    """
+    搜索框联想：文章标题、标签、分类的内存前缀索引（有序数组 + 二分查找）
+    条目按权重（浏览量/文章数）排序，键总数不超过max_keys；本进程的修改增量更新，
+    通过版本文件的mtime通知其他worker重建，超过ttl也重建一次以刷新权重
+    """
+
+    def __init__(self, session, load_entries, version_path, max_keys, ttl):
+        self.session = session
+        self.load_entries = load_entries
+        self.version_path = version_path
+        self.max_keys = max_keys
+        self.ttl = ttl
+        self.dropped = 0
+        self._keys = []  # 有序的 (键, 条目id)
+        self._entries = {}  # 条目id -> {type, id, text, url, weight}
+        self._version = None
+        self._built_at = 0
+        self._lock = threading.RLock()
+
+    def _current_version(self):
+        return file_version(self.version_path)
+
+    def _bump_version(self):
+        try:
+            bump_file_version(self.version_path)
+        except OSError as e:
+            print(f"⚠️ 联想索引版本更新失败: {e}")
+
+    def _ensure_built(self):
+        version = self._current_version()
+        if self._version == version and time.time() - self._built_at < self.ttl:
+            return
+        with self._lock:
+            if self._version == version and time.time() - self._built_at < self.ttl:
+                return
+            with self.session.get_bind().connect() as connection:
+                entries = self.load_entries(connection)
+            self._keys = []
+            self._entries = {}
+            self.dropped = 0
+            # 按权重从高到低加入，超出上限的低权重条目不建索引
+            for entry in sorted(entries, key=lambda entry: -entry['weight']):
+                self._add(entry, presorted=False)
+            self._keys.sort()
+            self._version = version
+            self._built_at = time.time()
+
+    def _add(self, entry, presorted=True):
+        keys = suggest_keys(entry['text'])
+        if len(self._keys) + len(keys) > self.max_keys:
+            self.dropped += 1
+            return
+        entry_id = (entry['type'], entry['id'])
+        self._entries[entry_id] = entry
+        for key in keys:
+            if presorted:
+                bisect.insort(self._keys, (key, entry_id))
+            else:
+                self._keys.append((key, entry_id))
+
+    def _remove(self, entry_id):
+        entry = self._entries.pop(entry_id, None)
+        if entry is None:
+            return
+        for key in suggest_keys(entry['text']):
+            index = bisect.bisect_left(self._keys, (key, entry_id))
+            if index < len(self._keys) and self._keys[index] == (key, entry_id):
+                del self._keys[index]
+
+    def suggest(self, prefix, limit):
+        """返回前缀匹配的条目，按权重从高到低"""
+        prefix = ' '.join((prefix or '').lower().split())
+        if not prefix:
+            return []
+        self._ensure_built()
+        with self._lock:
+            matched = {}
+            index = bisect.bisect_left(self._keys, (prefix,))
+            # 前缀很短时匹配的键可能很多，最多看前limit*50个
+            for key, entry_id in self._keys[index:index + limit * 50]:
+                if not key.startswith(prefix):
+                    break
+                matched[entry_id] = self._entries[entry_id]
+        return sorted(matched.values(), key=lambda entry: (-entry['weight'], entry['text']))[:limit]
+
+    def apply(self, entries, removed_ids):
+        """提交后更新：entries为新的条目，removed_ids为 (类型, id)"""
+        with self._lock:
+            if self._version is not None:
+                for entry_id in list(removed_ids) + [(entry['type'], entry['id']) for entry in entries]:
+                    self._remove(entry_id)
+                for entry in entries:
+                    self._add(entry)
+            self._bump_version()
+            if self._version is not None:
+                self._version = self._current_version()
+
+    def stats(self):
+        return {
+            'entries': len(self._entries),
+            'keys': len(self._keys),
+            'max_keys': self.max_keys,
+            'dropped': self.dropped,
+            'age': round(time.time() - self._built_at, 1) if self._version is not None else None
+        }
+
+def suggest_entry(kind, entity_id, text, url, weight):
+    return {'type': kind, 'id': entity_id, 'text': text, 'url': url, 'weight': weight or 0}
@@ -0,0 +1,21 @@
+# -*- coding: utf-8 -*-
+"""
+跨worker的版本号：保存在共享目录里版本文件的mtime中，任一worker更新后其他worker读取即可感知
+"""
+
+import os
+import time
+
+def file_version(path):
+    """版本文件的mtime（纳秒），文件不存在或不可读时为0"""
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return 0
+
+def bump_file_version(path):
+    """把版本文件的mtime改为当前时间（文件不存在时创建），失败时抛出OSError"""
+    now = time.time_ns()
+    with open(path, 'a'):
+        pass
+    os.utime(path, ns=(now, now))
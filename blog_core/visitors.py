@@ -0,0 +1,539 @@
+# -*- coding: utf-8 -*-
+"""
+访客统计：访客表的批量upsert、按时段的汇总、HyperLogLog去重草图，以及异步批量写入的VisitorTracker
+表（Visitor、VisitorRollup、VisitorSketch的__table__）和会话由调用方传入
+"""
+
+import hashlib
+import math
+import os
+import queue
+import threading
+import time
+import zlib
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+from sqlalchemy import bindparam, case, func, select
+from sqlalchemy.dialects.mysql import insert as mysql_insert
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+try:
+    import numpy as np
+except ImportError:  # 未安装numpy时草图合并、估计逐个寄存器计算
+    np = None
+
+def build_upsert(connection, table, rows, keys, updates):
+    """
+    批量插入、唯一键冲突时更新的语句：MySQL用 ON DUPLICATE KEY UPDATE，SQLite/PostgreSQL用 ON CONFLICT DO UPDATE
+    updates(new) 返回 {列名: 更新表达式}，new.<列> 为本行待插入的值；其他数据库返回None，由调用方先查再写
+    """
+    dialect = connection.dialect.name
+    if dialect == 'mysql':
+        stmt = mysql_insert(table).values(rows)
+        return stmt.on_duplicate_key_update(**updates(stmt.inserted))
+    if dialect in ('sqlite', 'postgresql'):
+        stmt = (sqlite_insert if dialect == 'sqlite' else postgresql_insert)(table).values(rows)
+        return stmt.on_conflict_do_update(index_elements=keys, set_=updates(stmt.excluded))
+    return None
+
+def upsert_visitors(connection, table, hits):
+    """
+    插入新访客或累加已有访客的访问次数，每批一条语句（依赖ip_address唯一索引）
+    table: 访客表；hits: {ip: {'count', 'user_agent', 'last_visit'}}，单次访问传一个IP即可；返回新插入的IP
+    """
+    rows = [{'ip_address': ip, 'user_agent': hit['user_agent'], 'visit_count': hit['count'],
+             'first_visit': hit['last_visit'], 'last_visit': hit['last_visit']} for ip, hit in hits.items()]
+    stmt = build_upsert(connection, table, rows, [table.c.ip_address], lambda new: {
+        'visit_count': table.c.visit_count + new.visit_count,
+        'last_visit': case((new.last_visit > table.c.last_visit, new.last_visit), else_=table.c.last_visit)})
+    if stmt is None:
+        existing = set(connection.execute(
+            select(table.c.ip_address).where(table.c.ip_address.in_(list(hits)))).scalars())
+        for ip in existing:
+            connection.execute(table.update().where(table.c.ip_address == ip).values(
+                visit_count=table.c.visit_count + hits[ip]['count'], last_visit=hits[ip]['last_visit']))
+        new_rows = [row for row in rows if row['ip_address'] not in existing]
+        if new_rows:
+            connection.execute(table.insert(), new_rows)
+        return [row['ip_address'] for row in new_rows]
+
+    # 更新后的访问次数 = 原次数(>=1) + 本批次数，等于本批次数的就是新插入的行
+    if connection.dialect.insert_returning:
+        counts = dict(connection.execute(stmt.returning(table.c.ip_address, table.c.visit_count)).all())
+    else:
+        result = connection.execute(stmt)
+        # MySQL的影响行数：插入计1，更新计2；全部是更新时不用再查
+        if result.rowcount >= 2 * len(rows):
+            return []
+        counts = dict(connection.execute(
+            select(table.c.ip_address, table.c.visit_count).where(table.c.ip_address.in_(list(hits)))).all())
+    return [ip for ip, hit in hits.items() if counts.get(ip) == hit['count']]
+
+# 访客汇总的时段；total不分时段，固定记在一个起点上
+ROLLUP_PERIODS = ('hour', 'day', 'total')
+ROLLUP_TOTAL_BUCKET = datetime(2000, 1, 1)
+ROLLUP_COUNTS = ('hits', 'visitors', 'new_visitors')
+
+def rollup_bucket(period, moment):
+    """moment所在时段的起点"""
+    if period == 'hour':
+        return moment.replace(minute=0, second=0, microsecond=0)
+    if period == 'day':
+        return moment.replace(hour=0, minute=0, second=0, microsecond=0)
+    return ROLLUP_TOTAL_BUCKET
+
+def visitor_rollup_rows(batch, previous_visits, locations, new_ips):
+    """
+    把一批访问 [(ip, user_agent, 时间)] 汇总为各时段的增量行
+    previous_visits: 本批之前各IP的最近访问时间（新访客没有），早于时段起点说明是时段内的新访客
+    locations: {ip: (国家, 城市)}
+    """
+    totals = {}
+    seen = set()
+    for ip, _, visited_at in batch:
+        country, city = locations.get(ip, ('', ''))
+        previous = previous_visits.get(ip)
+        for period in ROLLUP_PERIODS:
+            bucket = rollup_bucket(period, visited_at)
+            row = totals.setdefault((period, bucket, country, city), dict.fromkeys(ROLLUP_COUNTS, 0))
+            row['hits'] += 1
+            if (period, bucket, ip) in seen:
+                continue
+            seen.add((period, bucket, ip))
+            if previous is None or previous < bucket:
+                row['visitors'] += 1
+            if ip in new_ips and (period, ip) not in seen:
+                seen.add((period, ip))
+                row['new_visitors'] += 1
+    return [dict(counts, period=period, bucket=bucket, country=country, city=city)
+            for (period, bucket, country, city), counts in totals.items()]
+
+def upsert_visitor_rollups(connection, table, rows):
+    """把增量行累加到汇总表table（一条upsert；不支持的数据库逐行先更新、没有再插入）"""
+    if not rows:
+        return
+    keys = [table.c.period, table.c.bucket, table.c.country, table.c.city]
+    stmt = build_upsert(connection, table, rows, keys, lambda new: {
+        name: table.c[name] + getattr(new, name) for name in ROLLUP_COUNTS})
+    if stmt is not None:
+        connection.execute(stmt)
+        return
+    for row in rows:
+        result = connection.execute(table.update().where(*(key == row[key.name] for key in keys)).values(
+            **{name: table.c[name] + row[name] for name in ROLLUP_COUNTS}))
+        if result.rowcount == 0:
+            connection.execute(table.insert().values(**row))
+
+def prune_visitor_rollups(connection, table, hourly_days):
+    """删除超过保留天数的小时汇总（按天和total的汇总一直保留）"""
+    cutoff = rollup_bucket('day', datetime.utcnow()) - timedelta(days=hourly_days)
+    return connection.execute(table.delete().where(table.c.period == 'hour', table.c.bucket < cutoff)).rowcount
+
+def rebuild_visitor_rollups(session, visitor_table, rollup_table, hourly_days, chunk_size=5000):
+    """
+    从访客表重建汇总。访客表只保存首次/最近访问时间，重建结果是近似值：
+    每个访客在最近访问的时段计1次访问和1个访客，在首次访问的时段计1个新访客（时段不同时也计1次访问）；
+    total按visit_count计访问次数。返回写入的行数
+    """
+    hourly_cutoff = rollup_bucket('day', datetime.utcnow()) - timedelta(days=hourly_days)
+    totals = {}
+
+    def add(period, moment, country, city, **counts):
+        bucket = rollup_bucket(period, moment)
+        if period == 'hour' and bucket < hourly_cutoff:
+            return
+        row = totals.setdefault((period, bucket, country, city), dict.fromkeys(ROLLUP_COUNTS, 0))
+        for name, value in counts.items():
+            row[name] += value
+
+    last_id = 0
+    while True:
+        visitors = visitor_table.c
+        rows = session.execute(select(visitors.id, visitors.country, visitors.city, visitors.visit_count,
+                                      visitors.first_visit, visitors.last_visit)
+                               .where(visitors.id > last_id).order_by(visitors.id).limit(chunk_size)).all()
+        if not rows:
+            break
+        for _, country, city, visit_count, first_visit, last_visit in rows:
+            country, city = country or '', city or ''
+            last_visit = last_visit or first_visit or datetime.utcnow()
+            first_visit = first_visit or last_visit
+            add('total', last_visit, country, city, hits=visit_count or 1, visitors=1, new_visitors=1)
+            for period in ('hour', 'day'):
+                add(period, last_visit, country, city, hits=1, visitors=1)
+                if rollup_bucket(period, first_visit) == rollup_bucket(period, last_visit):
+                    add(period, first_visit, country, city, new_visitors=1)
+                else:
+                    add(period, first_visit, country, city, hits=1, visitors=1, new_visitors=1)
+        last_id = rows[-1][0]
+
+    connection = session.connection()
+    connection.execute(rollup_table.delete())
+    rows = [dict(counts, period=period, bucket=bucket, country=country, city=city)
+            for (period, bucket, country, city), counts in totals.items()]
+    for offset in range(0, len(rows), chunk_size):
+        connection.execute(rollup_table.insert(), rows[offset:offset + chunk_size])
+    session.commit()
+    return len(rows)
+
+SKETCH_TOTAL_DAY = ROLLUP_TOTAL_BUCKET.date()
+HLL_POWERS = [2.0 ** -rank for rank in range(65)]
+
+class HyperLogLog:
+    """
+    HyperLogLog基数估计：2^precision个寄存器（每个1字节），标准误差约1.04/sqrt(2^precision)，
+    precision=12时4096个寄存器、误差约1.6%。同一集合的草图取寄存器最大值即可合并，可重复合并
+    """
+
+    def __init__(self, precision=12, registers=None):
+        if not 4 <= precision <= 16:
+            raise ValueError(f'HyperLogLog精度须在4到16之间: {precision}')
+        self.precision = precision
+        self.registers = bytearray(registers) if registers is not None else bytearray(1 << precision)
+        if len(self.registers) != 1 << precision:
+            raise ValueError(f'寄存器数量与精度不符: {len(self.registers)}')
+
+    def add(self, value):
+        """加入一个元素（64位blake2b哈希：高precision位选寄存器，其余位记前导零个数+1）"""
+        x = int.from_bytes(hashlib.blake2b(str(value).encode('utf-8'), digest_size=8).digest(), 'big')
+        width = 64 - self.precision
+        index = x >> width
+        rank = width - (x & ((1 << width) - 1)).bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def reduce(self, precision):
+        """降到较低精度（合并不同精度的草图时使用，结果与直接用低精度统计相同）"""
+        if precision >= self.precision:
+            return self
+        shift = self.precision - precision
+        registers = bytearray(1 << precision)
+        for index, rank in enumerate(self.registers):
+            if not rank:
+                continue
+            low = index & ((1 << shift) - 1)
+            rank = shift - low.bit_length() + 1 if low else shift + rank
+            target = index >> shift
+            if rank > registers[target]:
+                registers[target] = rank
+        return HyperLogLog(precision, registers)
+
+    def merge(self, other):
+        """合并另一个草图（并集），精度不同时降到较低的精度"""
+        if other.precision < self.precision:
+            reduced = self.reduce(other.precision)
+            self.precision, self.registers = reduced.precision, reduced.registers
+        other = other.reduce(self.precision)
+        if np is not None:
+            self.registers = bytearray(np.maximum(np.frombuffer(self.registers, dtype=np.uint8),
+                                                  np.frombuffer(other.registers, dtype=np.uint8)).tobytes())
+        else:
+            self.registers = bytearray(map(max, self.registers, other.registers))
+        return self
+
+    def count(self):
+        """估计不同元素个数（小基数时用线性计数修正）"""
+        m = len(self.registers)
+        alpha = {16: 0.673, 32: 0.697, 64: 0.709}.get(m, 0.7213 / (1 + 1.079 / m))
+        if np is not None:
+            registers = np.frombuffer(self.registers, dtype=np.uint8)
+            total = float(np.exp2(-registers.astype(np.float64)).sum())
+            zeros = int(np.count_nonzero(registers == 0))
+        else:
+            total = sum(HLL_POWERS[rank] for rank in self.registers)
+            zeros = self.registers.count(0)
+        estimate = alpha * m * m / total
+        if estimate <= 2.5 * m and zeros:
+            estimate = m * math.log(m / zeros)
+        return int(round(estimate))
+
+    def to_bytes(self):
+        """精度1字节 + zlib压缩的寄存器（稀疏草图只有几十字节）"""
+        return bytes([self.precision]) + zlib.compress(bytes(self.registers))
+
+    @classmethod
+    def from_bytes(cls, data):
+        return cls(data[0], zlib.decompress(data[1:]))
+
+def merge_visitor_sketches(connection, table, sketches):
+    """
+    把内存中的草图 {(scope, scope_id, day): HyperLogLog} 合并进草图表table：
+    加行锁读出已有的行，取寄存器最大值后写回，没有的插入
+    """
+    groups = defaultdict(list)
+    for scope, scope_id, day in sketches:
+        groups[scope, day].append(scope_id)
+    existing = {}
+    for (scope, day), scope_ids in groups.items():
+        for offset in range(0, len(scope_ids), 500):
+            existing.update(((scope, scope_id, day), registers) for scope_id, registers in connection.execute(
+                select(table.c.scope_id, table.c.registers).where(
+                    table.c.scope == scope, table.c.day == day,
+                    table.c.scope_id.in_(scope_ids[offset:offset + 500])).with_for_update()))
+    updates, inserts = [], []
+    for (scope, scope_id, day), sketch in sketches.items():
+        row = {'s': scope, 'sid': scope_id, 'd': day}
+        if (scope, scope_id, day) in existing:
+            stored = HyperLogLog.from_bytes(existing[scope, scope_id, day])
+            merged = HyperLogLog(stored.precision, stored.registers).merge(sketch)
+            if merged.registers != stored.registers:
+                updates.append(dict(row, registers=merged.to_bytes()))
+        else:
+            inserts.append({'scope': scope, 'scope_id': scope_id, 'day': day, 'registers': sketch.to_bytes()})
+    if updates:
+        connection.execute(table.update().where(
+            table.c.scope == bindparam('s'), table.c.scope_id == bindparam('sid'),
+            table.c.day == bindparam('d')), updates)
+    if inserts:
+        connection.execute(table.insert(), inserts)
+    return len(updates) + len(inserts)
+
+def load_site_sketches(session, sketch_table, days):
+    """最近days天（UTC，含今天）的每日访客草图 {日期: HyperLogLog}"""
+    start = datetime.utcnow().date() - timedelta(days=days - 1)
+    sketches = sketch_table.c
+    return {day: HyperLogLog.from_bytes(registers) for day, registers in session.execute(
+        select(sketches.day, sketches.registers).where(
+            sketches.scope == 'site', sketches.scope_id == 0, sketches.day >= start))}
+
+def union_count(sketches):
+    """多个草图合并后的基数估计（没有草图时为0）"""
+    merged = None
+    for sketch in sketches:
+        merged = HyperLogLog(sketch.precision, sketch.registers) if merged is None else merged.merge(sketch)
+    return merged.count() if merged else 0
+
+def count_unique_visitors(session, sketch_table, days=1):
+    """最近days天（UTC，含今天）的独立访客数（合并每日草图的估计值，跨天去重）"""
+    return union_count(load_site_sketches(session, sketch_table, days).values())
+
+def count_post_readers(session, sketch_table, post_ids):
+    """各文章的独立读者数估计 {post_id: 人数}，没有读者的文章不在结果中"""
+    post_ids = list(post_ids)
+    if not post_ids:
+        return {}
+    sketches = sketch_table.c
+    return {post_id: HyperLogLog.from_bytes(registers).count() for post_id, registers in session.execute(
+        select(sketches.scope_id, sketches.registers).where(
+            sketches.scope == 'post', sketches.day == SKETCH_TOTAL_DAY, sketches.scope_id.in_(post_ids)))}
+
+def get_visitor_summary(session, sketch_table, rollup_table, days=7, hours=24, countries=10, month_days=30):
+    """
+    访客统计：今日/近days天/近month_days天独立访客（合并每日草图）、
+    近hours小时走势、访客最多的国家（汇总表）
+    """
+    now = datetime.utcnow()
+    today = now.date()
+    sketches = load_site_sketches(session, sketch_table, max(days, month_days))
+    hour_start = rollup_bucket('hour', now) - timedelta(hours=hours - 1)
+    rollups = rollup_table.c
+    hourly = {bucket: (hits, visitors) for bucket, hits, visitors in session.execute(select(
+        rollups.bucket, func.sum(rollups.hits), func.sum(rollups.visitors)
+    ).where(rollups.period == 'hour', rollups.bucket >= hour_start).group_by(rollups.bucket))}
+    visitor_count = func.sum(rollups.visitors)
+    top_countries = session.execute(select(rollups.country, visitor_count).where(
+        rollups.period == 'total'
+    ).group_by(rollups.country).having(visitor_count > 0).order_by(visitor_count.desc()).limit(countries)).all()
+    return {
+        'today_visitors': union_count(sketch for day, sketch in sketches.items() if day == today),
+        'week_visitors': union_count(sketch for day, sketch in sketches.items() if day > today - timedelta(days=days)),
+        'month_visitors': union_count(sketch for day, sketch in sketches.items()
+                                      if day > today - timedelta(days=month_days)),
+        'hourly': [{'hour': (hour_start + timedelta(hours=i)).isoformat() + 'Z',
+                    'hits': int(hourly.get(hour_start + timedelta(hours=i), (0, 0))[0]),
+                    'visitors': int(hourly.get(hour_start + timedelta(hours=i), (0, 0))[1])}
+                   for i in range(hours)],
+        'countries': [{'name': country, 'count': int(count)} for country, count in top_countries]
+    }
+
+class VisitorTracker:
+    """
+    访客记录的异步批量写入
+    请求线程只把访问记录放入有界队列，后台线程每攒够一批或每隔flush_interval秒
+    合并同一IP的访问并一次性写库；队列满时丢弃并计数，不阻塞请求。
+    独立访客（按天）和文章读者的HyperLogLog草图在内存中累积，每隔sketch_flush_interval秒合并进数据库。
+    新访客的地理信息由子类的geo_fields提供（各应用的访客表列不同）
+    """
+
+    def __init__(self, app, session, visitor_table, rollup_table, sketch_table, maxsize=10000, batch_size=200,
+                 flush_interval=1.0, rollup_hourly_days=14, hll_precision=12, sketch_flush_interval=10.0):
+        self.app = app
+        self.session = session
+        self.visitor_table = visitor_table
+        self.rollup_table = rollup_table
+        self.sketch_table = sketch_table
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.rollup_hourly_days = rollup_hourly_days
+        self.hll_precision = hll_precision
+        self.sketch_flush_interval = sketch_flush_interval
+        self._pruned_at = 0
+        self._sketches = {}
+        self._sketch_lock = threading.Lock()
+        self._sketches_flushed_at = time.time()
+        self.sketch_failures = 0
+        self.queue = queue.Queue(maxsize=maxsize)
+        self.enqueued = 0
+        self.dropped = 0
+        self.flushed = 0
+        self.failed_batches = 0
+        self._thread = None
+        self._pid = None
+        self._start_lock = threading.Lock()
+
+    def geo_fields(self, ip):
+        """新访客要补写的地理信息列 {列名: 值}，须包含country和city（汇总按国家、城市分组）"""
+        raise NotImplementedError
+
+    def visitors_inserted(self, connection, new_ips):
+        """新访客在写入访客表的同一事务里调用（维护计数等）"""
+
+    def visitors_committed(self, new_ips):
+        """新访客提交后调用（失效缓存等）"""
+
+    def _ensure_started(self):
+        # gunicorn在fork后的worker里才启动后台线程
+        if self._pid == os.getpid() and self._thread and self._thread.is_alive():
+            return
+        with self._start_lock:
+            if self._pid == os.getpid() and self._thread and self._thread.is_alive():
+                return
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name='visitor-tracker', daemon=True)
+            self._thread.start()
+
+    def record(self, ip, user_agent):
+        """记录一次访问，不做任何数据库或网络操作"""
+        self._ensure_started()
+        try:
+            self.queue.put_nowait((ip, user_agent, datetime.utcnow()))
+            self.enqueued += 1
+        except queue.Full:
+            self.dropped += 1
+
+    def record_read(self, post_id, ip):
+        """记录一次文章阅读（只更新内存中该文章的读者草图）"""
+        self._add_to_sketch(('post', post_id, SKETCH_TOTAL_DAY), ip)
+
+    def _add_to_sketch(self, key, value):
+        with self._sketch_lock:
+            sketch = self._sketches.get(key)
+            if sketch is None:
+                sketch = self._sketches[key] = HyperLogLog(self.hll_precision)
+            sketch.add(value)
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            if batch:
+                self.flush(batch)
+
+    def _collect(self):
+        """阻塞等待第一条记录，然后在flush_interval内尽量攒满一批"""
+        batch = [self.queue.get()]
+        deadline = time.time() + self.flush_interval
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self.queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def drain(self):
+        """同步写入队列中剩余的记录（进程退出时调用）"""
+        batch = []
+        while True:
+            try:
+                batch.append(self.queue.get_nowait())
+            except queue.Empty:
+                break
+        if batch:
+            self.flush(batch)
+        self.flush_sketches()
+
+    def flush(self, batch):
+        """
+        按IP合并后一条upsert写库；新访客提交后再补地理信息（查询IP库时不占着写锁），
+        同时把这批访问累加到按小时/天的汇总表
+        """
+        hits = {}
+        for ip, user_agent, visited_at in batch:
+            hit = hits.setdefault(ip, {'count': 0, 'user_agent': user_agent, 'last_visit': visited_at})
+            hit['count'] += 1
+            hit['last_visit'] = max(hit['last_visit'], visited_at)
+            self._add_to_sketch(('site', 0, visited_at.date()), ip)
+
+        table = self.visitor_table
+        session = self.session
+        with self.app.app_context():
+            try:
+                connection = session.connection()
+                # 汇总需要本批之前的最近访问时间和地区（按唯一索引查，只涉及本批的IP）
+                previous = {ip: (last_visit, country, city) for ip, last_visit, country, city in connection.execute(
+                    select(table.c.ip_address, table.c.last_visit, table.c.country, table.c.city)
+                    .where(table.c.ip_address.in_(list(hits))))}
+                new_ips = upsert_visitors(connection, table, hits)
+                self.visitors_inserted(connection, new_ips)
+                session.commit()
+                self.flushed += len(batch)
+            except Exception as e:
+                session.rollback()
+                self.failed_batches += 1
+                print(f"访客记录写入失败: {e}")
+                return
+            if new_ips:
+                self.visitors_committed(new_ips)
+            try:
+                geo_rows = [dict(self.geo_fields(ip), ip=ip) for ip in new_ips]
+                connection = session.connection()
+                if geo_rows:
+                    connection.execute(table.update().where(table.c.ip_address == bindparam('ip')), geo_rows)
+                locations = {ip: (country or '', city or '') for ip, (_, country, city) in previous.items()}
+                locations.update((row['ip'], (row['country'] or '', row['city'] or '')) for row in geo_rows)
+                upsert_visitor_rollups(connection, self.rollup_table, visitor_rollup_rows(
+                    batch, {ip: last_visit for ip, (last_visit, _, _) in previous.items()}, locations, set(new_ips)))
+                if time.time() - self._pruned_at > 3600:
+                    prune_visitor_rollups(connection, self.rollup_table, self.rollup_hourly_days)
+                    self._pruned_at = time.time()
+                session.commit()
+            except Exception as e:
+                session.rollback()
+                print(f"访客地理信息/汇总写入失败: {e}")
+        if time.time() - self._sketches_flushed_at >= self.sketch_flush_interval:
+            self.flush_sketches()
+
+    def flush_sketches(self):
+        """把内存中累积的草图合并进数据库；失败时放回内存，下次再合并（取最大值的合并可以重复）"""
+        with self._sketch_lock:
+            pending, self._sketches = self._sketches, {}
+            self._sketches_flushed_at = time.time()
+        if not pending:
+            return
+        with self.app.app_context():
+            try:
+                merge_visitor_sketches(self.session.connection(), self.sketch_table, pending)
+                self.session.commit()
+            except Exception as e:
+                self.session.rollback()
+                self.sketch_failures += 1
+                with self._sketch_lock:
+                    for key, sketch in pending.items():
+                        current = self._sketches.get(key)
+                        self._sketches[key] = sketch.merge(current) if current else sketch
+                print(f"访客草图写入失败: {e}")
+
+    def stats(self):
+        return {
+            'queued': self.queue.qsize(),
+            'enqueued': self.enqueued,
+            'dropped': self.dropped,
+            'flushed': self.flushed,
+            'failed_batches': self.failed_batches,
+            'pending_sketches': len(self._sketches),
+            'sketch_failures': self.sketch_failures
+        }
@@ -24,6 +24,53 @@ class Config:
     WEATHER_API_KEY = os.environ.get('WEATHER_API_KEY') or ''  # OpenWeatherMap API
     IPINFO_TOKEN = os.environ.get('IPINFO_TOKEN') or ''  # IPInfo.io token
     
+    # 本地IP地理库（CSV或MMDB），查不到时是否再调用ipinfo.io
+    GEOIP_DB_PATH = os.environ.get('GEOIP_DB_PATH') or ''
+    GEOIP_REMOTE_FALLBACK = (os.environ.get('GEOIP_REMOTE_FALLBACK') or 'true').lower() == 'true'
+    
+    # 地理位置查询缓存（按IP和网段，失败结果短期缓存）
+    GEO_CACHE_SIZE = int(os.environ.get('GEO_CACHE_SIZE') or 50000)
+    GEO_CACHE_TTL = int(os.environ.get('GEO_CACHE_TTL') or 7 * 24 * 3600)
+    GEO_CACHE_NEGATIVE_TTL = int(os.environ.get('GEO_CACHE_NEGATIVE_TTL') or 600)
+    GEO_CACHE_PREFIX = (os.environ.get('GEO_CACHE_PREFIX') or 'true').lower() == 'true'
+    
+    # 访客记录队列配置
+    VISITOR_QUEUE_SIZE = int(os.environ.get('VISITOR_QUEUE_SIZE') or 10000)
+    VISITOR_BATCH_SIZE = int(os.environ.get('VISITOR_BATCH_SIZE') or 200)
+    VISITOR_FLUSH_INTERVAL = float(os.environ.get('VISITOR_FLUSH_INTERVAL') or 1.0)
+    # 访客小时汇总的保留天数（按天汇总一直保留）
+    VISITOR_ROLLUP_HOURLY_DAYS = int(os.environ.get('VISITOR_ROLLUP_HOURLY_DAYS') or 14)
+    # 独立访客/文章读者的HyperLogLog草图：精度（2^p个寄存器，误差约1.04/sqrt(2^p)）、合并写库间隔（秒）
+    HLL_PRECISION = int(os.environ.get('HLL_PRECISION') or 12)
+    SKETCH_FLUSH_INTERVAL = float(os.environ.get('SKETCH_FLUSH_INTERVAL') or 10.0)
+    # 不记录访客的请求：端点（逗号分隔，如main.about）、追加的爬虫User-Agent子串（逗号分隔）、预取请求、空User-Agent
+    TRACKING_SKIP_ENDPOINTS = [name.strip() for name in (os.environ.get('TRACKING_SKIP_ENDPOINTS') or '').split(',') if name.strip()]
+    TRACKING_BOT_PATTERNS = [pattern.strip() for pattern in (os.environ.get('TRACKING_BOT_PATTERNS') or '').split(',') if pattern.strip()]
+    TRACKING_SKIP_PREFETCH = (os.environ.get('TRACKING_SKIP_PREFETCH') or 'true').lower() == 'true'
+    TRACKING_SKIP_EMPTY_UA = (os.environ.get('TRACKING_SKIP_EMPTY_UA') or 'true').lower() == 'true'
+    
+    # 浏览量计数：memory（进程内）、mmap（单机多worker共享内存）、redis（多节点）
+    COUNTER_BACKEND = os.environ.get('COUNTER_BACKEND') or 'memory'
+    COUNTER_MMAP_PATH = os.environ.get('COUNTER_MMAP_PATH')
+    COUNTER_MMAP_SLOTS = int(os.environ.get('COUNTER_MMAP_SLOTS') or 65536)
+    REDIS_URL = os.environ.get('REDIS_URL') or 'redis://localhost:6379/0'
+    COUNTER_FLUSH_INTERVAL = float(os.environ.get('COUNTER_FLUSH_INTERVAL') or 5.0)
+    
+    # 全文检索：auto（SQLite用FTS5，MySQL用ngram全文索引，其余用进程内索引）、fts5、mysql、python
+    SEARCH_BACKEND = os.environ.get('SEARCH_BACKEND') or 'auto'
+    SEARCH_MAX_RESULTS = int(os.environ.get('SEARCH_MAX_RESULTS') or 200)
+    # 搜索联想的内存前缀索引：键数上限、定期重建间隔（秒，刷新浏览量等权重）
+    SUGGEST_MAX_KEYS = int(os.environ.get('SUGGEST_MAX_KEYS') or 200000)
+    SUGGEST_TTL = int(os.environ.get('SUGGEST_TTL') or 600)
+    
+    # 每篇文章预计算的相关文章数
+    RELATED_POSTS_COUNT = int(os.environ.get('RELATED_POSTS_COUNT') or 3)
+    # 增量更新的文章累计超过该比例后重新拟合IDF（后台线程）
+    RELATED_REFIT_RATIO = float(os.environ.get('RELATED_REFIT_RATIO') or 0.2)
+    
+    # 标签云缓存时间（秒，标签或文章发布状态变化时立即失效）
+    TAG_CLOUD_TTL = int(os.environ.get('TAG_CLOUD_TTL') or 60)
+    
     # 分页配置
     POSTS_PER_PAGE = 10
     
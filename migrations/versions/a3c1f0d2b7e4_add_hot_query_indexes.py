@@ -0,0 +1,48 @@
+"""add indexes for hot query shapes
+
+列表/首页按发布状态+时间或浏览量排序、分类页、标签页、评论列表、友情链接、
+访客按IP查找和按最近访问时间统计。表由 db.create_all() 创建的库里可能已经有
+这些索引，所以只创建缺少的。
+
+Revision ID: a3c1f0d2b7e4
+Revises:
+Create Date: 2026-10-18 10:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a3c1f0d2b7e4'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+# (索引名, 表名, 列)
+INDEXES = [
+    ('ix_post_published_created', 'post', ['is_published', 'created_at']),
+    ('ix_post_published_views', 'post', ['is_published', 'view_count']),
+    ('ix_post_category_published_created', 'post', ['category_id', 'is_published', 'created_at']),
+    ('ix_post_tags_tag_post', 'post_tags', ['tag_id', 'post_id']),
+    ('ix_comment_post_approved_created', 'comment', ['post_id', 'is_approved', 'created_at']),
+    ('ix_link_active_sort', 'link', ['is_active', 'sort_order']),
+    ('ix_visitor_ip_address', 'visitor', ['ip_address']),
+    ('ix_visitor_last_visit', 'visitor', ['last_visit']),
+]
+
+
+def existing_indexes(table):
+    return {index['name'] for index in sa.inspect(op.get_bind()).get_indexes(table)}
+
+
+def upgrade():
+    for name, table, columns in INDEXES:
+        if name not in existing_indexes(table):
+            op.create_index(name, table, columns)
+
+
+def downgrade():
+    for name, table, columns in reversed(INDEXES):
+        if name in existing_indexes(table):
+            op.drop_index(name, table_name=table)
@@ -0,0 +1,63 @@
+"""unique visitor ip_address
+
+访客按IP用upsert累加访问次数，需要ip_address唯一。先把同一IP的重复行合并到
+id最小的一行（访问次数相加，首次/最近访问取最早/最晚），再用唯一索引替换
+原来的普通索引。
+
+Revision ID: b7e2d94c1f3a
+Revises: a3c1f0d2b7e4
+Create Date: 2026-10-18 12:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b7e2d94c1f3a'
+down_revision = 'a3c1f0d2b7e4'
+branch_labels = None
+depends_on = None
+
+visitor = sa.table(
+    'visitor',
+    sa.column('id', sa.Integer),
+    sa.column('ip_address', sa.String),
+    sa.column('visit_count', sa.Integer),
+    sa.column('first_visit', sa.DateTime),
+    sa.column('last_visit', sa.DateTime),
+)
+
+
+def existing_indexes():
+    return {index['name'] for index in sa.inspect(op.get_bind()).get_indexes('visitor')}
+
+
+def merge_duplicates():
+    connection = op.get_bind()
+    duplicates = connection.execute(
+        sa.select(visitor.c.ip_address, sa.func.min(visitor.c.id), sa.func.sum(visitor.c.visit_count),
+                  sa.func.min(visitor.c.first_visit), sa.func.max(visitor.c.last_visit))
+        .group_by(visitor.c.ip_address).having(sa.func.count(visitor.c.id) > 1)
+    ).all()
+    for ip, keep_id, visit_count, first_visit, last_visit in duplicates:
+        connection.execute(visitor.update().where(visitor.c.id == keep_id).values(
+            visit_count=visit_count, first_visit=first_visit, last_visit=last_visit))
+        connection.execute(visitor.delete().where(visitor.c.ip_address == ip, visitor.c.id != keep_id))
+
+
+def upgrade():
+    indexes = existing_indexes()
+    if 'uq_visitor_ip_address' not in indexes:
+        merge_duplicates()
+        op.create_index('uq_visitor_ip_address', 'visitor', ['ip_address'], unique=True)
+    if 'ix_visitor_ip_address' in indexes:
+        op.drop_index('ix_visitor_ip_address', table_name='visitor')
+
+
+def downgrade():
+    indexes = existing_indexes()
+    if 'ix_visitor_ip_address' not in indexes:
+        op.create_index('ix_visitor_ip_address', 'visitor', ['ip_address'])
+    if 'uq_visitor_ip_address' in indexes:
+        op.drop_index('uq_visitor_ip_address', table_name='visitor')
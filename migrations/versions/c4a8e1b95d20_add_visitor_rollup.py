@@ -0,0 +1,39 @@
+"""add visitor_rollup
+
+访客按小时/天/全部、国家、城市的汇总表。升级后执行 flask rebuild-visitor-rollups
+从访客表生成历史数据（近似值），之后由VisitorTracker增量累加。
+
+Revision ID: c4a8e1b95d20
+Revises: b7e2d94c1f3a
+Create Date: 2026-10-18 14:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c4a8e1b95d20'
+down_revision = 'b7e2d94c1f3a'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    if sa.inspect(op.get_bind()).has_table('visitor_rollup'):
+        return
+    op.create_table(
+        'visitor_rollup',
+        sa.Column('period', sa.String(length=8), nullable=False),
+        sa.Column('bucket', sa.DateTime(), nullable=False),
+        sa.Column('country', sa.String(length=100), nullable=False),
+        sa.Column('city', sa.String(length=100), nullable=False),
+        sa.Column('hits', sa.Integer(), nullable=False),
+        sa.Column('visitors', sa.Integer(), nullable=False),
+        sa.Column('new_visitors', sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint('period', 'bucket', 'country', 'city')
+    )
+
+
+def downgrade():
+    op.drop_table('visitor_rollup')
@@ -0,0 +1,36 @@
+"""add visitor_sketch
+
+独立访客（每个UTC日一行）和文章读者的HyperLogLog草图，由VisitorTracker定期合并写入。
+升级前的访问不会计入草图，今日/近7天独立访客从升级后开始累积。
+
+Revision ID: d9f3b6a2e871
+Revises: c4a8e1b95d20
+Create Date: 2026-10-18 16:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd9f3b6a2e871'
+down_revision = 'c4a8e1b95d20'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    if sa.inspect(op.get_bind()).has_table('visitor_sketch'):
+        return
+    op.create_table(
+        'visitor_sketch',
+        sa.Column('scope', sa.String(length=8), nullable=False),
+        sa.Column('scope_id', sa.Integer(), autoincrement=False, nullable=False),
+        sa.Column('day', sa.Date(), nullable=False),
+        sa.Column('registers', sa.LargeBinary(), nullable=False),
+        sa.PrimaryKeyConstraint('scope', 'scope_id', 'day')
+    )
+
+
+def downgrade():
+    op.drop_table('visitor_sketch')
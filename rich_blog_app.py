@@ -6,20 +6,45 @@
 """
 
 import os
+import re
+import hashlib
 import json
 import requests
 import time
-from datetime import datetime, timedelta
+import math
+import click
+import atexit
+import threading
+from collections import OrderedDict, defaultdict
+from functools import wraps
+from urllib.parse import urlencode
+from datetime import datetime
 from werkzeug.utils import secure_filename
-from flask import Flask, render_template_string, request, redirect, url_for, flash, session, jsonify
+from flask import Flask, render_template, request, redirect, url_for, flash, session, jsonify, make_response, abort, g, has_request_context
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy.engine import Engine
+from jinja2 import ChoiceLoader, DictLoader, FileSystemBytecodeCache
 from flask_login import LoginManager, UserMixin, login_user, logout_user, login_required, current_user
 from werkzeug.security import generate_password_hash, check_password_hash
 import markdown
 import calendar
-from geopy.distance import geodesic
 from geopy.geocoders import Nominatim
 
+try:
+    import numpy as np
+except ImportError:  # 未安装numpy时距离、相关文章计算退回纯Python
+    np = None
+
+from blog_core import pagination, search, visitors
+from blog_core.counters import PostCounters as BasePostCounters, create_counter_backend
+from blog_core.geo import GeoIPResolver, GeoCache, calculate_distance, haversine_distances
+from blog_core.pagination import encode_cursor
+from blog_core.related import RelatedPostsEngine
+from blog_core.search import create_search_index, search_terms, highlight_text, search_snippet
+from blog_core.suggest import SuggestIndex, suggest_entry
+from blog_core.traffic import TrafficClassifier
+from blog_core.visitors import VisitorTracker as BaseVisitorTracker
+
 # 创建扩展实例
 db = SQLAlchemy()
 login_manager = LoginManager()
@@ -27,7 +52,9 @@ login_manager = LoginManager()
 # 多对多关系表
 post_tags = db.Table('post_tags',
     db.Column('post_id', db.Integer, db.ForeignKey('post.id'), primary_key=True),
-    db.Column('tag_id', db.Integer, db.ForeignKey('tag.id'), primary_key=True)
+    db.Column('tag_id', db.Integer, db.ForeignKey('tag.id'), primary_key=True),
+    # 主键以post_id开头，按标签筛选文章需要另建以tag_id开头的索引
+    db.Index('ix_post_tags_tag_post', 'tag_id', 'post_id')
 )
 
 def create_app():
@@ -37,6 +64,8 @@ def create_app():
     # 基本配置
     app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', 'rich-blog-secret-2024')
     app.config['POSTS_PER_PAGE'] = 6
+    # 博客列表超过这一页后，分页链接改用游标（避免深分页的OFFSET扫描）
+    app.config['BLOG_OFFSET_PAGE_LIMIT'] = int(os.environ.get('BLOG_OFFSET_PAGE_LIMIT', 10))
     
     # 数据库配置
     database_url = os.environ.get('DATABASE_URL')
@@ -66,10 +95,88 @@ def create_app():
     app.config['WEATHER_API_KEY'] = os.environ.get('WEATHER_API_KEY', '')
     app.config['IPAPI_KEY'] = os.environ.get('IPAPI_KEY', '')
 
+    # 本地IP地理库（CSV或MMDB），查不到时是否再调用在线接口
+    app.config['GEOIP_DB_PATH'] = os.environ.get('GEOIP_DB_PATH', '')
+    app.config['GEOIP_REMOTE_FALLBACK'] = os.environ.get('GEOIP_REMOTE_FALLBACK', 'true').lower() == 'true'
+
+    # 地理位置查询缓存（按IP和网段，失败结果短期缓存）
+    app.config['GEO_CACHE_SIZE'] = int(os.environ.get('GEO_CACHE_SIZE', 50000))
+    app.config['GEO_CACHE_TTL'] = int(os.environ.get('GEO_CACHE_TTL', 7 * 24 * 3600))
+    app.config['GEO_CACHE_NEGATIVE_TTL'] = int(os.environ.get('GEO_CACHE_NEGATIVE_TTL', 600))
+    app.config['GEO_CACHE_PREFIX'] = os.environ.get('GEO_CACHE_PREFIX', 'true').lower() == 'true'
+
     # 文件上传配置
     app.config['UPLOAD_FOLDER'] = 'static/uploads'
     app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
 
+    # 模板字节码缓存（多worker共享，冷启动时免去重新编译）
+    app.config['TEMPLATE_CACHE_DIR'] = os.environ.get(
+        'TEMPLATE_CACHE_DIR', os.path.join(app.instance_path, 'jinja_cache'))
+    try:
+        os.makedirs(app.config['TEMPLATE_CACHE_DIR'], exist_ok=True)
+        app.jinja_options = {
+            **app.jinja_options,
+            'bytecode_cache': FileSystemBytecodeCache(app.config['TEMPLATE_CACHE_DIR'])
+        }
+    except OSError as e:
+        print(f"⚠️ 模板缓存目录不可用，仅使用内存缓存: {e}")
+
+    # 整页缓存配置（仅匿名GET请求）
+    app.config['PAGE_CACHE_ENABLED'] = os.environ.get('PAGE_CACHE_ENABLED', 'true').lower() == 'true'
+    app.config['PAGE_CACHE_MAX_BYTES'] = int(os.environ.get('PAGE_CACHE_MAX_BYTES', 32 * 1024 * 1024))
+    app.config['PAGE_CACHE_TTL'] = int(os.environ.get('PAGE_CACHE_TTL', 300))
+    app.config['PAGE_CACHE_DIR'] = os.environ.get(
+        'PAGE_CACHE_DIR', os.path.join(app.instance_path, 'page_cache'))
+    # 页面重建锁：file（同机各worker用flock文件）、redis（多台机器，设置了REDIS_URL时默认使用）
+    app.config['PAGE_CACHE_LOCK'] = os.environ.get(
+        'PAGE_CACHE_LOCK', 'redis' if os.environ.get('REDIS_URL') else 'file').lower()
+    app.config['PAGE_CACHE_LOCK_TIMEOUT'] = int(os.environ.get('PAGE_CACHE_LOCK_TIMEOUT', 30))
+    # 侧边栏统计快照的有效期（秒）
+    app.config['GLOBAL_STATS_TTL'] = int(os.environ.get('GLOBAL_STATS_TTL', 60))
+
+    # SQL统计：每个请求的语句数和耗时（Server-Timing响应头 + 管理端汇总）
+    app.config['SQL_INSTRUMENTATION'] = os.environ.get('SQL_INSTRUMENTATION', 'true').lower() == 'true'
+    app.config['SQL_SLOWEST_KEPT'] = int(os.environ.get('SQL_SLOWEST_KEPT', 10))
+
+    # 全文检索：auto（SQLite用FTS5，MySQL用ngram全文索引，其余用进程内索引）、fts5、mysql、python
+    app.config['SEARCH_BACKEND'] = os.environ.get('SEARCH_BACKEND', 'auto').lower()
+    app.config['SEARCH_MAX_RESULTS'] = int(os.environ.get('SEARCH_MAX_RESULTS', 200))
+    # 搜索联想的内存前缀索引：键数上限、定期重建间隔（秒，刷新浏览量等权重）
+    app.config['SUGGEST_MAX_KEYS'] = int(os.environ.get('SUGGEST_MAX_KEYS', 200000))
+    app.config['SUGGEST_TTL'] = int(os.environ.get('SUGGEST_TTL', 600))
+    # 每篇文章预计算的相关文章数
+    app.config['RELATED_POSTS_COUNT'] = int(os.environ.get('RELATED_POSTS_COUNT', 3))
+    # 增量更新的文章累计超过该比例后重新拟合IDF（后台线程）
+    app.config['RELATED_REFIT_RATIO'] = float(os.environ.get('RELATED_REFIT_RATIO', 0.2))
+
+    # 访客记录队列（请求只入队，后台线程批量写库）
+    app.config['VISITOR_QUEUE_SIZE'] = int(os.environ.get('VISITOR_QUEUE_SIZE', 10000))
+    app.config['VISITOR_BATCH_SIZE'] = int(os.environ.get('VISITOR_BATCH_SIZE', 200))
+    app.config['VISITOR_FLUSH_INTERVAL'] = float(os.environ.get('VISITOR_FLUSH_INTERVAL', 1.0))
+    # 访客小时汇总的保留天数（按天汇总一直保留）
+    app.config['VISITOR_ROLLUP_HOURLY_DAYS'] = int(os.environ.get('VISITOR_ROLLUP_HOURLY_DAYS', 14))
+    # 独立访客/文章读者的HyperLogLog草图：精度（2^p个寄存器，误差约1.04/sqrt(2^p)）、合并写库间隔（秒）
+    app.config['HLL_PRECISION'] = int(os.environ.get('HLL_PRECISION', 12))
+    app.config['SKETCH_FLUSH_INTERVAL'] = float(os.environ.get('SKETCH_FLUSH_INTERVAL', 10.0))
+    # 不记录访客的请求：端点（逗号分隔）、追加的爬虫User-Agent子串（逗号分隔）、预取请求、空User-Agent
+    app.config['TRACKING_SKIP_ENDPOINTS'] = [name.strip() for name in os.environ.get(
+        'TRACKING_SKIP_ENDPOINTS', 'health,api_visitor_stats,api_weather,api_search_suggest').split(',') if name.strip()]
+    app.config['TRACKING_BOT_PATTERNS'] = [pattern.strip() for pattern in os.environ.get(
+        'TRACKING_BOT_PATTERNS', '').split(',') if pattern.strip()]
+    app.config['TRACKING_SKIP_PREFETCH'] = os.environ.get('TRACKING_SKIP_PREFETCH', 'true').lower() == 'true'
+    app.config['TRACKING_SKIP_EMPTY_UA'] = os.environ.get('TRACKING_SKIP_EMPTY_UA', 'true').lower() == 'true'
+
+    # 浏览量/点赞计数：memory（进程内）、mmap（单机多worker共享内存）、redis（多节点）
+    app.config['COUNTER_BACKEND'] = os.environ.get('COUNTER_BACKEND', 'memory').lower()
+    app.config['COUNTER_MMAP_PATH'] = os.environ.get('COUNTER_MMAP_PATH', os.path.join(app.instance_path, 'post_counters.bin'))
+    app.config['COUNTER_MMAP_SLOTS'] = int(os.environ.get('COUNTER_MMAP_SLOTS', 65536))
+    app.config['REDIS_URL'] = os.environ.get('REDIS_URL', 'redis://localhost:6379/0')
+    # 每隔多少秒把累计的增量写入数据库
+    app.config['COUNTER_FLUSH_INTERVAL'] = float(os.environ.get('COUNTER_FLUSH_INTERVAL', 5.0))
+
+    # 静态导出目录（设置后保存文章会增量导出，由nginx直接提供）
+    app.config['STATIC_EXPORT_DIR'] = os.environ.get('STATIC_EXPORT_DIR', '')
+
     # 初始化扩展
     db.init_app(app)
     login_manager.init_app(app)
@@ -124,22 +231,62 @@ class Post(db.Model):
     summary = db.Column(db.Text)
     slug = db.Column(db.String(200), unique=True, nullable=False)
     featured_image = db.Column(db.String(200))
-    is_published = db.Column(db.Boolean, default=False)
+    # active_history：修改时保留旧值，供计数事件计算增量
+    is_published = db.column_property(db.Column(db.Boolean, default=False), active_history=True)
     is_featured = db.Column(db.Boolean, default=False)
-    view_count = db.Column(db.Integer, default=0)
+    view_count = db.column_property(db.Column(db.Integer, default=0), active_history=True)
     like_count = db.Column(db.Integer, default=0)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
-    category_id = db.Column(db.Integer, db.ForeignKey('category.id'))
+    category_id = db.column_property(db.Column(db.Integer, db.ForeignKey('category.id')), active_history=True)
+    
+    # 列表/首页按发布状态筛选后按时间或浏览量排序，分类页再加分类条件；
+    # 列表页ETag取已发布文章的最新修改时间
+    __table_args__ = (
+        db.Index('ix_post_published_created', 'is_published', 'created_at'),
+        db.Index('ix_post_published_updated', 'is_published', 'updated_at'),
+        db.Index('ix_post_published_views', 'is_published', 'view_count'),
+        db.Index('ix_post_category_published_created', 'category_id', 'is_published', 'created_at'),
+    )
     
     tags = db.relationship('Tag', secondary=post_tags, lazy='subquery',
                           backref=db.backref('posts', lazy=True))
     comments = db.relationship('Comment', backref='post', lazy='dynamic', cascade='all, delete-orphan')
+    render = db.relationship('PostRender', uselist=False, cascade='all, delete-orphan')
     
+    def get_render(self):
+        """获取与当前内容匹配的渲染结果，内容已变化时临时渲染（不落库）"""
+        content_hash = compute_content_hash(self.content)
+        if self.render and self.render.content_hash == content_hash:
+            return self.render
+        fallback = getattr(self, '_fallback_render', None)
+        if fallback is None or fallback.content_hash != content_hash:
+            fallback = self._fallback_render = build_post_render(self)
+        return fallback
+
     def get_html_content(self):
-        return markdown.markdown(self.content, extensions=['fenced_code', 'tables', 'toc'])
+        return self.get_render().html
+
+    def get_toc(self):
+        return self.get_render().toc
+
+    def get_excerpt(self):
+        return self.summary or self.get_render().excerpt
+
+    def get_reading_time(self):
+        return self.get_render().reading_time
+
+class PostRender(db.Model):
+    """文章渲染结果（保存文章时生成，按内容哈希校验是否过期）"""
+    post_id = db.Column(db.Integer, db.ForeignKey('post.id'), primary_key=True)
+    content_hash = db.Column(db.String(64), nullable=False)
+    html = db.Column(db.Text(16777215), nullable=False)
+    toc = db.Column(db.Text)
+    excerpt = db.Column(db.Text)
+    reading_time = db.Column(db.Integer, default=1)  # 分钟
+    rendered_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
 class Comment(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -148,10 +295,14 @@ class Comment(db.Model):
     author_email = db.Column(db.String(120), nullable=False)
     author_website = db.Column(db.String(200))
     author_ip = db.Column(db.String(45))
-    is_approved = db.Column(db.Boolean, default=False)
+    is_approved = db.column_property(db.Column(db.Boolean, default=False), active_history=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
-    post_id = db.Column(db.Integer, db.ForeignKey('post.id'), nullable=False)
+    post_id = db.column_property(db.Column(db.Integer, db.ForeignKey('post.id'), nullable=False), active_history=True)
+
+    __table_args__ = (
+        db.Index('ix_comment_post_approved_created', 'post_id', 'is_approved', 'created_at'),
+    )
 
 class Project(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -182,6 +333,10 @@ class Link(db.Model):
     sort_order = db.Column(db.Integer, default=0)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
+    __table_args__ = (
+        db.Index('ix_link_category_active_sort', 'category', 'is_active', 'sort_order'),
+    )
+
 class Timeline(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     title = db.Column(db.String(200), nullable=False)
@@ -205,6 +360,35 @@ class Visitor(db.Model):
     first_visit = db.Column(db.DateTime, default=datetime.utcnow)
     last_visit = db.Column(db.DateTime, default=datetime.utcnow)
 
+    # 每个IP一行（访问记录用upsert累加）；统计页按最近访问时间筛选
+    __table_args__ = (
+        db.Index('uq_visitor_ip_address', 'ip_address', unique=True),
+        db.Index('ix_visitor_last_visit', 'last_visit'),
+    )
+
+class VisitorRollup(db.Model):
+    """
+    访客按时段、国家、城市的汇总（VisitorTracker写库时增量累加，flask rebuild-visitor-rollups 重建）
+    period为hour/day/total，bucket为时段起点（UTC），total只有一个时段ROLLUP_TOTAL_BUCKET
+    """
+    period = db.Column(db.String(8), primary_key=True)
+    bucket = db.Column(db.DateTime, primary_key=True)
+    country = db.Column(db.String(100), primary_key=True)
+    city = db.Column(db.String(100), primary_key=True)
+    hits = db.Column(db.Integer, nullable=False, default=0)
+    visitors = db.Column(db.Integer, nullable=False, default=0)  # 时段内的不同访客
+    new_visitors = db.Column(db.Integer, nullable=False, default=0)  # 时段内首次访问的访客
+
+class VisitorSketch(db.Model):
+    """
+    访客去重的HyperLogLog草图（VisitorTracker在内存中累积，定期合并写入）
+    scope为site（scope_id=0，每个UTC日一行）或post（scope_id为文章id，day固定为SKETCH_TOTAL_DAY）
+    """
+    scope = db.Column(db.String(8), primary_key=True)
+    scope_id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    day = db.Column(db.Date, primary_key=True)
+    registers = db.Column(db.LargeBinary, nullable=False)  # HyperLogLog.to_bytes()
+
 class SiteConfig(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     key = db.Column(db.String(100), unique=True, nullable=False)
@@ -213,13 +397,231 @@ class SiteConfig(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
+class SiteCounter(db.Model):
+    """
+    反规范化的计数（由模型事件维护，flask reconcile-counters 校正）
+    全站计数如 posts.published、comments.pending、views.total；
+    实体计数如 category.<id>.posts、tag.<id>.posts、post.<id>.comments（已审核）
+    """
+    name = db.Column(db.String(100), primary_key=True)
+    value = db.Column(db.BigInteger, nullable=False, default=0)
+
+class PostNeighbor(db.Model):
+    """预计算的相关文章（按TF-IDF余弦相似度排名，由RelatedPostsEngine维护）"""
+    post_id = db.Column(db.Integer, db.ForeignKey('post.id', ondelete='CASCADE'), primary_key=True)
+    rank = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    neighbor_id = db.Column(db.Integer, db.ForeignKey('post.id', ondelete='CASCADE'), nullable=False, index=True)
+    score = db.Column(db.Float, nullable=False)
+
+# 按路由的加载策略（Post.tags默认lazy='subquery'，每次查询文章都会多一条标签查询，不需要时显式关闭）
+def post_card_loaders():
+    """文章卡片：分类用JOIN，标签用一次IN查询"""
+    return (db.joinedload(Post.category), db.selectinload(Post.tags))
+
+def post_detail_loaders():
+    """文章详情：卡片的关联再加作者和渲染缓存"""
+    return post_card_loaders() + (db.joinedload(Post.author), db.joinedload(Post.render))
+
+def post_title_loaders():
+    """只显示标题等少量列的文章列表"""
+    return (db.load_only(Post.id, Post.title, Post.slug, Post.created_at, Post.view_count),
+            db.lazyload(Post.tags))
+
 @login_manager.user_loader
 def load_user(user_id):
     return db.session.get(User, int(user_id))
 
 # 工具函数
+def bump_counters(connection, deltas):
+    """在当前事务里原子地累加计数，计数行不存在时插入"""
+    table = SiteCounter.__table__
+    for name, delta in deltas.items():
+        if not delta:
+            continue
+        result = connection.execute(
+            table.update().where(table.c.name == name).values(value=table.c.value + delta))
+        if result.rowcount == 0:
+            connection.execute(table.insert().values(name=name, value=delta))
+
+def get_counters(*names):
+    """一次查询读取多个计数，不存在的计为0"""
+    values = dict(db.session.query(SiteCounter.name, SiteCounter.value).filter(SiteCounter.name.in_(names)).all())
+    return {name: values.get(name, 0) for name in names}
+
+def get_entity_counters(prefix, ids, suffix):
+    """读取一组实体的计数，如 get_entity_counters('category', [1, 2], 'posts') -> {1: n, 2: m}"""
+    names = {f'{prefix}.{entity_id}.{suffix}': entity_id for entity_id in ids}
+    values = get_counters(*names) if names else {}
+    return {entity_id: values[name] for name, entity_id in names.items()}
+
+def compute_site_counters():
+    """从业务表重新统计全部计数（用于校正）"""
+    counters = {
+        'posts.total': Post.query.count(),
+        'posts.published': Post.query.filter_by(is_published=True).count(),
+        'posts.draft': Post.query.filter(db.or_(Post.is_published == False, Post.is_published.is_(None))).count(),
+        'comments.total': Comment.query.count(),
+        'comments.approved': Comment.query.filter_by(is_approved=True).count(),
+        'comments.pending': Comment.query.filter(db.or_(Comment.is_approved == False, Comment.is_approved.is_(None))).count(),
+        'categories.total': Category.query.count(),
+        'tags.total': Tag.query.count(),
+        'visitors.total': Visitor.query.count(),
+        'views.total': db.session.query(db.func.sum(Post.view_count)).scalar() or 0,
+    }
+    for category_id, count in db.session.query(Post.category_id, db.func.count(Post.id)).filter(
+            Post.category_id.isnot(None)).group_by(Post.category_id):
+        counters[f'category.{category_id}.posts'] = count
+    for tag_id, count in db.session.query(post_tags.c.tag_id, db.func.count()).group_by(post_tags.c.tag_id):
+        counters[f'tag.{tag_id}.posts'] = count
+    for post_id, count in db.session.query(Comment.post_id, db.func.count(Comment.id)).filter(
+            Comment.is_approved == True).group_by(Comment.post_id):
+        counters[f'post.{post_id}.comments'] = count
+    return counters
+
+def reconcile_site_counters():
+    """用重新统计的结果覆盖计数表，返回被修正的计数名称列表"""
+    expected = compute_site_counters()
+    current = dict(db.session.query(SiteCounter.name, SiteCounter.value).all())
+    drifted = sorted(name for name in set(expected) | set(current)
+                     if expected.get(name, 0) != current.get(name, 0))
+    for name in drifted:
+        counter = db.session.get(SiteCounter, name)
+        if name not in expected:
+            db.session.delete(counter)
+        elif counter:
+            counter.value = expected[name]
+        else:
+            db.session.add(SiteCounter(name=name, value=expected[name]))
+    db.session.commit()
+    return drifted
+
+def _previous_value(target, attr):
+    """flush过程中某属性修改前的值"""
+    history = db.inspect(target).attrs[attr].history
+    if history.deleted:
+        return history.deleted[0]
+    return history.unchanged[0] if history.unchanged else getattr(target, attr)
+
+def _post_counter_deltas(deltas, is_published, category_id, tag_ids, view_count, sign):
+    deltas['posts.total'] += sign
+    deltas['posts.published' if is_published else 'posts.draft'] += sign
+    if category_id:
+        deltas[f'category.{category_id}.posts'] += sign
+    for tag_id in tag_ids:
+        deltas[f'tag.{tag_id}.posts'] += sign
+    deltas['views.total'] += sign * (view_count or 0)
+
+def _comment_counter_deltas(deltas, is_approved, post_id, sign):
+    deltas['comments.total'] += sign
+    deltas['comments.approved' if is_approved else 'comments.pending'] += sign
+    if is_approved and post_id:
+        deltas[f'post.{post_id}.comments'] += sign
+
+def _post_tag_ids(post, include_added=True, include_deleted=False):
+    history = db.inspect(post).attrs.tags.history
+    tags = list(history.unchanged)
+    if include_added:
+        tags += list(history.added)
+    if include_deleted:
+        tags += list(history.deleted)
+    return [tag.id for tag in tags]
+
+def _remove_entity_counters(connection, prefix, entity_id):
+    table = SiteCounter.__table__
+    connection.execute(table.delete().where(table.c.name.like(f'{prefix}.{entity_id}.%')))
+
+@db.event.listens_for(Post, 'after_insert')
+def count_inserted_post(mapper, connection, post):
+    deltas = defaultdict(int)
+    _post_counter_deltas(deltas, post.is_published, post.category_id, _post_tag_ids(post), post.view_count, 1)
+    bump_counters(connection, deltas)
+
+@db.event.listens_for(Post, 'after_update')
+def count_updated_post(mapper, connection, post):
+    deltas = defaultdict(int)
+    _post_counter_deltas(deltas, _previous_value(post, 'is_published'), _previous_value(post, 'category_id'),
+                         _post_tag_ids(post, include_added=False, include_deleted=True),
+                         _previous_value(post, 'view_count'), -1)
+    _post_counter_deltas(deltas, post.is_published, post.category_id, _post_tag_ids(post), post.view_count, 1)
+    bump_counters(connection, deltas)
+
+@db.event.listens_for(Post, 'after_delete')
+def count_deleted_post(mapper, connection, post):
+    deltas = defaultdict(int)
+    _post_counter_deltas(deltas, _previous_value(post, 'is_published'), _previous_value(post, 'category_id'),
+                         _post_tag_ids(post, include_added=False, include_deleted=True),
+                         _previous_value(post, 'view_count'), -1)
+    bump_counters(connection, deltas)
+    _remove_entity_counters(connection, 'post', post.id)
+
+@db.event.listens_for(Comment, 'after_insert')
+def count_inserted_comment(mapper, connection, comment):
+    deltas = defaultdict(int)
+    _comment_counter_deltas(deltas, comment.is_approved, comment.post_id, 1)
+    bump_counters(connection, deltas)
+
+@db.event.listens_for(Comment, 'after_update')
+def count_updated_comment(mapper, connection, comment):
+    deltas = defaultdict(int)
+    _comment_counter_deltas(deltas, _previous_value(comment, 'is_approved'), _previous_value(comment, 'post_id'), -1)
+    _comment_counter_deltas(deltas, comment.is_approved, comment.post_id, 1)
+    bump_counters(connection, deltas)
+
+@db.event.listens_for(Comment, 'after_delete')
+def count_deleted_comment(mapper, connection, comment):
+    deltas = defaultdict(int)
+    _comment_counter_deltas(deltas, _previous_value(comment, 'is_approved'), _previous_value(comment, 'post_id'), -1)
+    bump_counters(connection, deltas)
+
+@db.event.listens_for(Category, 'after_insert')
+def count_inserted_category(mapper, connection, category):
+    bump_counters(connection, {'categories.total': 1})
+
+@db.event.listens_for(Category, 'after_delete')
+def count_deleted_category(mapper, connection, category):
+    bump_counters(connection, {'categories.total': -1})
+    _remove_entity_counters(connection, 'category', category.id)
+
+@db.event.listens_for(Tag, 'after_insert')
+def count_inserted_tag(mapper, connection, tag):
+    bump_counters(connection, {'tags.total': 1})
+
+@db.event.listens_for(Tag, 'after_delete')
+def count_deleted_tag(mapper, connection, tag):
+    bump_counters(connection, {'tags.total': -1})
+    _remove_entity_counters(connection, 'tag', tag.id)
+
+@db.event.listens_for(Visitor, 'after_insert')
+def count_inserted_visitor(mapper, connection, visitor):
+    bump_counters(connection, {'visitors.total': 1})
+
+@db.event.listens_for(Visitor, 'after_delete')
+def count_deleted_visitor(mapper, connection, visitor):
+    bump_counters(connection, {'visitors.total': -1})
+
+geoip_resolver = None
+geo_cache = None
+
 def get_visitor_info(ip_address):
-    """获取访客地理信息"""
+    """获取访客地理信息（带缓存）"""
+    global geo_cache
+    if geo_cache is None:
+        geo_cache = GeoCache(app.config['GEO_CACHE_SIZE'], app.config['GEO_CACHE_TTL'],
+                             app.config['GEO_CACHE_NEGATIVE_TTL'], app.config['GEO_CACHE_PREFIX'])
+    return geo_cache.get_or_resolve(ip_address, resolve_visitor_info)
+
+def resolve_visitor_info(ip_address):
+    """先查本地IP库，查不到再按配置调用在线接口"""
+    global geoip_resolver
+    if geoip_resolver is None:
+        geoip_resolver = GeoIPResolver(app.config['GEOIP_DB_PATH'])
+    geo_info = geoip_resolver.lookup(ip_address)
+    if geo_info or not app.config['GEOIP_REMOTE_FALLBACK']:
+        return geo_info
+    return get_remote_visitor_info(ip_address)
+
+def get_remote_visitor_info(ip_address):
+    """通过在线接口获取访客地理信息"""
     try:
         # 使用免费的IP地理位置API
         response = requests.get(f'http://ip-api.com/json/{ip_address}', timeout=5)
@@ -236,12 +638,31 @@ def get_visitor_info(ip_address):
         pass
     return None
 
-def calculate_distance(lat1, lon1, lat2, lon2):
-    """计算两点间距离"""
-    try:
-        return geodesic((lat1, lon1), (lat2, lon2)).kilometers
-    except:
-        return 0
+def backfill_visitor_distances(origin_lat, origin_lon, chunk_size=5000):
+    """
+    按id分块重算所有访客到博主的距离，每块一次批量UPDATE
+    没有坐标的访客（经纬度为空或均为0）距离记为0；返回更新的行数
+    """
+    updated = 0
+    last_id = 0
+    while True:
+        rows = db.session.query(Visitor.id, Visitor.latitude, Visitor.longitude)\
+            .filter(Visitor.id > last_id).order_by(Visitor.id).limit(chunk_size).all()
+        if not rows:
+            break
+        located = [row for row in rows if row.latitude or row.longitude]
+        distances = dict(zip(
+            (row.id for row in located),
+            haversine_distances([row.latitude for row in located], [row.longitude for row in located],
+                                origin_lat, origin_lon)
+        ))
+        db.session.execute(db.update(Visitor), [
+            {'id': row.id, 'distance_km': distances.get(row.id) or 0} for row in rows
+        ])
+        db.session.commit()
+        updated += len(rows)
+        last_id = rows[-1].id
+    return updated
 
 def get_weather_info(city='Beijing'):
     """获取天气信息"""
@@ -327,12 +748,620 @@ def allowed_file(filename):
     return '.' in filename and \
            filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
+# 文章渲染
+MARKDOWN_EXTENSIONS = ['fenced_code', 'tables', 'toc']
+EXCERPT_LENGTH = 200
+CJK_CHARS_PER_MINUTE = 400
+WORDS_PER_MINUTE = 200
+
+def compute_content_hash(content):
+    """计算文章内容哈希"""
+    return hashlib.sha256((content or '').encode('utf-8')).hexdigest()
+
+def html_to_text(html):
+    """去除HTML标签，得到纯文本"""
+    text = re.sub(r'<(script|style)[^>]*>.*?</\1>', ' ', html or '', flags=re.S | re.I)
+    text = re.sub(r'<[^>]+>', ' ', text)
+    text = text.replace('&nbsp;', ' ').replace('&lt;', '<').replace('&gt;', '>').replace('&amp;', '&')
+    return re.sub(r'\s+', ' ', text).strip()
+
+def estimate_reading_time(text):
+    """估算阅读时间（分钟），中文按字数、英文按单词数计算"""
+    cjk_count = len(re.findall(r'[\u4e00-\u9fff]', text))
+    word_count = len(re.findall(r'[A-Za-z0-9_]+', text))
+    minutes = cjk_count / CJK_CHARS_PER_MINUTE + word_count / WORDS_PER_MINUTE
+    return max(1, int(round(minutes)))
+
+def build_post_render(post):
+    """渲染文章Markdown，返回未保存的PostRender对象"""
+    md = markdown.Markdown(extensions=MARKDOWN_EXTENSIONS)
+    html = md.convert(post.content or '')
+    text = html_to_text(html)
+    excerpt = text[:EXCERPT_LENGTH] + ('...' if len(text) > EXCERPT_LENGTH else '')
+    return PostRender(
+        content_hash=compute_content_hash(post.content),
+        html=html,
+        toc=md.toc,
+        excerpt=excerpt,
+        reading_time=estimate_reading_time(text)
+    )
+
+def refresh_post_render(post, force=False):
+    """内容变化时重新渲染并挂到文章上，随文章一起提交；返回是否重新渲染"""
+    if not force and post.render and post.render.content_hash == compute_content_hash(post.content):
+        return False
+    fresh = build_post_render(post)
+    if post.render:
+        for field in ('content_hash', 'html', 'toc', 'excerpt', 'reading_time'):
+            setattr(post.render, field, getattr(fresh, field))
+    else:
+        post.render = fresh
+    return True
+
+# 整页缓存
+class FilePageLock:
+    """
+    重建某个页面的跨进程锁：共享目录下每个缓存键一个flock文件，同机的各worker互斥。
+    释放时在持锁状态下删除文件，拿到锁后发现文件已被删除（锁住的是旧文件）就重新打开
+    """
+
+    def __init__(self, path):
+        import fcntl
+        self._fcntl = fcntl
+        self.path = path
+        self._file = None
+
+    def acquire(self, blocking=True):
+        flags = self._fcntl.LOCK_EX if blocking else self._fcntl.LOCK_EX | self._fcntl.LOCK_NB
+        while True:
+            f = open(self.path, 'a')
+            try:
+                self._fcntl.flock(f, flags)
+            except BlockingIOError:
+                f.close()
+                return False
+            try:
+                if os.fstat(f.fileno()).st_ino == os.stat(self.path).st_ino:
+                    self._file = f
+                    return True
+            except FileNotFoundError:
+                pass
+            f.close()
+
+    def release(self):
+        f, self._file = self._file, None
+        try:
+            os.unlink(self.path)
+        except OSError:
+            pass
+        f.close()
+
+class RedisPageLock:
+    """重建某个页面的Redis锁，多台机器之间互斥；超过timeout秒自动释放，防止进程退出后一直锁住"""
+
+    def __init__(self, client, name, timeout):
+        self._lock = client.lock(name, timeout=timeout, sleep=0.05, blocking_timeout=timeout)
+        self._held = False
+
+    def acquire(self, blocking=True):
+        try:
+            self._held = self._lock.acquire(blocking=blocking)
+        except Exception as e:
+            # Redis不可用时不加锁，直接重建
+            print(f"⚠️ 页面缓存Redis锁不可用: {e}")
+            return True
+        return self._held
+
+    def release(self):
+        if self._held:
+            self._held = False
+            try:
+                self._lock.release()
+            except Exception:
+                pass
+
+class PageCache:
+    """
+    匿名GET请求的整页缓存
+    按字节预算淘汰的LRU，每个条目记录所依赖的实体标签；
+    标签版本保存在共享目录的文件mtime中，任一worker失效后其他worker也会感知。
+    生成的页面同时写入共享目录，其他worker直接读取，不必各自重建；
+    重建由跨进程的锁保护（同机用flock文件，配置了Redis时用Redis锁），同一页面同时只有一个请求在重建
+    """
+
+    def __init__(self, max_bytes, ttl, version_dir, lock_backend='file', redis_url=None, lock_timeout=30):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.version_dir = version_dir
+        self.page_dir = os.path.join(version_dir, 'pages')
+        self.lock_dir = os.path.join(version_dir, 'locks')
+        self.lock_timeout = lock_timeout
+        self.hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+        self.stale_hits = 0
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._key_locks = [threading.Lock() for _ in range(64)]
+        self._redis = None
+        self.lock_backend = 'thread'
+        try:
+            os.makedirs(version_dir, exist_ok=True)
+            os.makedirs(self.page_dir, exist_ok=True)
+        except OSError as e:
+            self.page_dir = None
+            print(f"⚠️ 页面缓存目录不可用，失效仅在当前进程生效: {e}")
+        if lock_backend == 'redis':
+            try:
+                import redis
+                self._redis = redis.Redis.from_url(redis_url, socket_timeout=5, socket_connect_timeout=5)
+                self._redis.ping()
+                self.lock_backend = 'redis'
+            except Exception as e:
+                self._redis = None
+                print(f"⚠️ 页面缓存Redis锁不可用，改用文件锁: {e}")
+        if self.lock_backend == 'thread':
+            try:
+                import fcntl  # noqa: F401
+                os.makedirs(self.lock_dir, exist_ok=True)
+                self.lock_backend = 'file'
+            except (ImportError, OSError) as e:
+                print(f"⚠️ 页面缓存文件锁不可用，只在当前进程内防止重复重建: {e}")
+
+    def _tag_version(self, tag):
+        try:
+            return os.stat(os.path.join(self.version_dir, tag)).st_mtime_ns
+        except OSError:
+            return 0
+
+    def tag_versions(self, tags):
+        """读取标签的当前版本，需在生成页面之前调用"""
+        return {tag: self._tag_version(tag) for tag in tags}
+
+    def _is_stale(self, entry):
+        """已过期或依赖的标签已失效"""
+        return time.time() - entry['created'] > self.ttl or \
+            any(self._tag_version(tag) != version for tag, version in entry['versions'].items())
+
+    @staticmethod
+    def _digest(key):
+        return hashlib.sha1(key.encode('utf-8')).hexdigest()
+
+    def get(self, key):
+        """
+        返回 (条目, 是否需要重建)。本进程没有或已过时的，先读取其他worker写入共享目录的页面；
+        过期、标签已失效的条目仍然返回，供重建期间作为旧页面使用
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+        if entry is not None and not self._is_stale(entry):
+            return entry, False
+        shared = self._load(key)
+        if shared is not None and not self._is_stale(shared):
+            self._store(key, shared)
+            self.shared_hits += 1
+            return shared, False
+        entry = entry or shared
+        return entry, entry is not None
+
+    def _load(self, key):
+        if self.page_dir is None:
+            return None
+        try:
+            with open(os.path.join(self.page_dir, self._digest(key)), 'rb') as f:
+                meta = json.loads(f.readline())
+                body = f.read()
+        except (OSError, ValueError):
+            return None
+        return {**meta, 'body': body, 'size': len(body)}
+
+    def _save(self, key, entry):
+        """先写临时文件再改名，其他worker不会读到写了一半的页面"""
+        if self.page_dir is None:
+            return
+        path = os.path.join(self.page_dir, self._digest(key))
+        meta = {field: entry[field] for field in ('status', 'headers', 'versions', 'created')}
+        temp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        try:
+            with open(temp_path, 'wb') as f:
+                f.write(json.dumps(meta).encode('utf-8') + b'\n')
+                f.write(entry['body'])
+            os.replace(temp_path, path)
+        except OSError as e:
+            print(f"⚠️ 页面写入共享目录失败: {e}")
+
+    def _store(self, key, entry):
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old:
+                self._bytes -= old['size']
+            self._entries[key] = entry
+            self._bytes += entry['size']
+            while self._bytes > self.max_bytes and self._entries:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= evicted['size']
+
+    def set(self, key, body, status, headers, versions):
+        size = len(body)
+        if size > self.max_bytes:
+            return
+        entry = {
+            'body': body,
+            'status': status,
+            'headers': headers,
+            'versions': versions,
+            'created': time.time(),
+            'size': size
+        }
+        self._store(key, entry)
+        self._save(key, entry)
+
+    def invalidate(self, *tags):
+        """使依赖这些标签的页面全部失效（所有worker）；本进程的条目标记为过期，重建期间仍可作为旧页面返回"""
+        now = time.time_ns()
+        for tag in tags:
+            path = os.path.join(self.version_dir, tag)
+            try:
+                with open(path, 'a'):
+                    pass
+                os.utime(path, ns=(now, now))
+            except OSError:
+                pass
+        with self._lock:
+            for entry in self._entries.values():
+                if set(tags) & set(entry['versions']):
+                    entry['created'] = 0
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+        if self.page_dir is not None:
+            for name in os.listdir(self.page_dir):
+                try:
+                    os.unlink(os.path.join(self.page_dir, name))
+                except OSError:
+                    pass
+
+    def key_lock(self, key):
+        """重建某个页面的锁（acquire(blocking)/release），防止多个请求同时重建同一页面"""
+        if self.lock_backend == 'redis':
+            return RedisPageLock(self._redis, f'page_cache:lock:{self._digest(key)}', self.lock_timeout)
+        if self.lock_backend == 'file':
+            return FilePageLock(os.path.join(self.lock_dir, self._digest(key)))
+        return self._key_locks[hash(key) % len(self._key_locks)]
+
+    def stats(self):
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'max_bytes': self.max_bytes,
+                'lock_backend': self.lock_backend,
+                'hits': self.hits,
+                'shared_hits': self.shared_hits,
+                'stale_hits': self.stale_hits,
+                'misses': self.misses
+            }
+
+class GlobalStatsSnapshot:
+    """
+    模板全局变量（统计数、最新评论、热门文章）的内存快照
+    版本 = 本进程的提交计数 + 页面缓存中'stats'标签的版本（跨worker）；
+    版本变化或超过ttl后，下一次渲染时重新查询
+    """
+
+    tag = 'stats'
+
+    def __init__(self, ttl, page_cache):
+        self.ttl = ttl
+        self.page_cache = page_cache
+        self.hits = 0
+        self.misses = 0
+        self._local_version = 0
+        self._snapshot = None
+        self._lock = threading.Lock()
+
+    def _version(self):
+        return (self._local_version, self.page_cache.tag_versions([self.tag])[self.tag])
+
+    def get(self):
+        snapshot = self._snapshot
+        version = self._version()
+        if snapshot and snapshot['version'] == version and time.time() - snapshot['created'] < self.ttl:
+            self.hits += 1
+            return snapshot['data']
+        with self._lock:
+            snapshot = self._snapshot
+            if snapshot and snapshot['version'] == version and time.time() - snapshot['created'] < self.ttl:
+                self.hits += 1
+                return snapshot['data']
+            self.misses += 1
+            self._snapshot = {'version': version, 'created': time.time(), 'data': self._build()}
+            return self._snapshot['data']
+
+    def _build(self):
+        """查询统计数据；评论和文章只取列，快照不持有ORM对象"""
+        counters = get_counters('posts.published', 'categories.total', 'tags.total',
+                                'views.total', 'visitors.total', 'comments.approved')
+        stats = {
+            'total_posts': counters['posts.published'],
+            'total_categories': counters['categories.total'],
+            'total_tags': counters['tags.total'],
+            'total_views': counters['views.total'],
+            'total_visitors': counters['visitors.total'],
+            'total_comments': counters['comments.approved']
+        }
+        recent_comments = db.session.query(
+            Comment.id, Comment.post_id, Comment.author_name, Comment.content, Comment.created_at
+        ).filter_by(is_approved=True).order_by(Comment.created_at.desc()).limit(5).all()
+        popular_posts = db.session.query(
+            Post.id, Post.title, Post.slug, Post.view_count, Post.created_at
+        ).filter_by(is_published=True).order_by(Post.view_count.desc()).limit(5).all()
+        return {'stats': stats, 'recent_comments': recent_comments, 'popular_posts': popular_posts}
+
+    def invalidate(self, local_only=False):
+        """local_only为False时同时通知其他worker"""
+        self._local_version += 1
+        if not local_only:
+            self.page_cache.invalidate(self.tag)
+
+    def stats(self):
+        snapshot = self._snapshot
+        lookups = self.hits + self.misses
+        return {
+            'age': round(time.time() - snapshot['created'], 1) if snapshot else None,
+            'ttl': self.ttl,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / lookups, 4) if lookups else 0
+        }
+
+TAG_CLOUD_LEVELS = 5
+
+class TagCloudSnapshot(GlobalStatsSnapshot):
+    """
+    标签云：每个标签的已发布文章数（一次GROUP BY），按热度分为1~TAG_CLOUD_LEVELS级
+    缓存方式与统计快照相同，文章发布状态/标签变化或标签增删改后失效
+    """
+
+    tag = 'tag_cloud'
+
+    def _build(self):
+        post_count = db.func.count(Post.id)
+        rows = db.session.query(Tag.id, Tag.name, Tag.color, post_count).outerjoin(
+            post_tags, post_tags.c.tag_id == Tag.id
+        ).outerjoin(
+            Post, db.and_(Post.id == post_tags.c.post_id, Post.is_published == True)
+        ).group_by(Tag.id, Tag.name, Tag.color).order_by(post_count.desc(), Tag.name).all()
+        counts = [count for *_, count in rows if count]
+        low, high = (math.log(min(counts)), math.log(max(counts))) if counts else (0, 0)
+        cloud = []
+        for tag_id, name, color, count in rows:
+            if not count:
+                continue
+            # 对数刻度：少数热门标签不会把其余标签都压到最小一级
+            level = 1 + round((TAG_CLOUD_LEVELS - 1) * (math.log(count) - low) / (high - low)) if high > low else 1
+            cloud.append({'id': tag_id, 'name': name, 'color': color, 'count': count, 'level': level})
+        return cloud
+
+    def top(self, limit):
+        """最热门的limit个标签，按名称排列"""
+        return sorted(self.get()[:limit], key=lambda tag: tag['name'])
+
+class SqlStats:
+    """
+    SQL语句统计（按进程汇总）
+    每个请求的语句数、数据库耗时按endpoint累计，并保留全局最慢的若干条语句
+    """
+
+    def __init__(self, slowest_kept):
+        self.slowest_kept = slowest_kept
+        self.since = datetime.utcnow()
+        self._endpoints = {}
+        self._slowest = []
+        self._lock = threading.Lock()
+
+    def record(self, endpoint, queries, duration, slowest):
+        """记录一个请求；slowest为该请求的 [(耗时秒, 语句)]"""
+        with self._lock:
+            item = self._endpoints.setdefault(endpoint, {
+                'requests': 0, 'queries': 0, 'db_time': 0.0, 'max_queries': 0, 'max_db_time': 0.0
+            })
+            item['requests'] += 1
+            item['queries'] += queries
+            item['db_time'] += duration
+            item['max_queries'] = max(item['max_queries'], queries)
+            item['max_db_time'] = max(item['max_db_time'], duration)
+            for elapsed, statement in slowest:
+                self._slowest.append((elapsed, endpoint, statement))
+            self._slowest.sort(key=lambda entry: entry[0], reverse=True)
+            del self._slowest[self.slowest_kept:]
+
+    def reset(self):
+        with self._lock:
+            self._endpoints.clear()
+            self._slowest.clear()
+            self.since = datetime.utcnow()
+
+    def report(self):
+        with self._lock:
+            endpoints = [
+                dict(item, endpoint=endpoint,
+                     avg_queries=round(item['queries'] / item['requests'], 2),
+                     avg_db_ms=round(item['db_time'] * 1000 / item['requests'], 2),
+                     db_time=round(item['db_time'] * 1000, 2),
+                     max_db_time=round(item['max_db_time'] * 1000, 2))
+                for endpoint, item in self._endpoints.items()
+            ]
+            slowest = [{'ms': round(elapsed * 1000, 2), 'endpoint': endpoint, 'statement': statement}
+                       for elapsed, endpoint, statement in self._slowest]
+        endpoints.sort(key=lambda item: item['db_time'], reverse=True)
+        return {'pid': os.getpid(), 'since': self.since.isoformat(), 'endpoints': endpoints, 'slowest': slowest}
+
+# 访客记录
+def merge_duplicate_visitors():
+    """合并同一IP的重复访客行（保留id最小的一行），建立ip_address唯一索引前调用；返回删除的行数"""
+    table = Visitor.__table__
+    duplicates = db.session.query(
+        Visitor.ip_address, db.func.min(Visitor.id), db.func.sum(Visitor.visit_count),
+        db.func.min(Visitor.first_visit), db.func.max(Visitor.last_visit)
+    ).group_by(Visitor.ip_address).having(db.func.count(Visitor.id) > 1).all()
+    connection = db.session.connection()
+    removed = 0
+    for ip, keep_id, visit_count, first_visit, last_visit in duplicates:
+        connection.execute(table.update().where(table.c.id == keep_id).values(
+            visit_count=visit_count, first_visit=first_visit, last_visit=last_visit))
+        removed += connection.execute(
+            table.delete().where(table.c.ip_address == ip, table.c.id != keep_id)).rowcount
+    # 计数表还是空的（刚升级）时由init_database整体统计，这里不用先记一个负数
+    if removed and db.session.query(SiteCounter.name).first():
+        bump_counters(connection, {'visitors.total': -removed})
+    db.session.commit()
+    return removed
+
+def rebuild_visitor_rollups(hourly_days, chunk_size=5000):
+    """从访客表重建按小时/天/总计的汇总（近似值），返回写入的行数"""
+    return visitors.rebuild_visitor_rollups(db.session, Visitor.__table__, VisitorRollup.__table__,
+                                            hourly_days, chunk_size)
+
+def count_unique_visitors(days=1):
+    """最近days天（UTC，含今天）的独立访客数（合并每日草图的估计值，跨天去重）"""
+    return visitors.count_unique_visitors(db.session, VisitorSketch.__table__, days)
+
+def count_post_readers(post_ids):
+    """各文章的独立读者数估计 {post_id: 人数}，没有读者的文章不在结果中"""
+    return visitors.count_post_readers(db.session, VisitorSketch.__table__, post_ids)
+
+def get_visitor_summary(days=7, hours=24, countries=10, month_days=30):
+    """访客统计：今日/近days天/近month_days天独立访客、近hours小时走势、访客最多的国家"""
+    return visitors.get_visitor_summary(db.session, VisitorSketch.__table__, VisitorRollup.__table__,
+                                        days, hours, countries, month_days)
+
+class VisitorTracker(BaseVisitorTracker):
+    """访客记录的异步批量写入；新访客计入访客总数，并补写地理位置和到作者所在地的距离"""
+
+    def visitors_inserted(self, connection, new_ips):
+        bump_counters(connection, {'visitors.total': len(new_ips)})
+
+    def visitors_committed(self, new_ips):
+        # 访客插入频繁，只失效本进程的统计快照
+        global_stats.invalidate(local_only=True)
+
+    def geo_fields(self, ip):
+        geo_info = get_visitor_info(ip)
+        distance = 0
+        if geo_info:
+            distance = calculate_distance(
+                geo_info['latitude'], geo_info['longitude'],
+                self.app.config['AUTHOR_LAT'], self.app.config['AUTHOR_LON']
+            ) or 0
+        return {
+            'country': geo_info['country'] if geo_info else '',
+            'city': geo_info['city'] if geo_info else '',
+            'latitude': geo_info['latitude'] if geo_info else 0,
+            'longitude': geo_info['longitude'] if geo_info else 0,
+            'distance_km': distance
+        }
+
+class PostCounters(BasePostCounters):
+    """文章浏览量、点赞数的缓冲计数（写入Post表，同时累加总浏览量计数）"""
+
+    def __init__(self, app, backend, flush_interval):
+        super().__init__(app, db.session, Post.__table__, backend, flush_interval)
+
+    def counts_written(self, connection, counts):
+        bump_counters(connection, {
+            'views.total': sum(n for (field, _), n in counts.items() if field == 'view_count')
+        })
+
+def load_search_documents(connection, post_ids=None):
+    """读取已发布文章的索引文档 {post_id: {title, summary, content, tags}}；post_ids为None时读取全部"""
+    return search.load_search_documents(connection, Post.__table__, Tag.__table__, post_tags, post_ids)
+
+def search_posts(query):
+    """全文检索已发布文章，返回按相关度排序的id（同一请求内只检索一次）"""
+    results = g.setdefault('search_results', {}) if has_request_context() else {}
+    if query not in results:
+        results[query] = [post_id for post_id, _ in search_index.search(query, app.config['SEARCH_MAX_RESULTS'])]
+    return results[query]
+
+def load_suggest_entries(connection, post_ids=None, tag_ids=None, category_ids=None):
+    """读取联想条目；参数都为None时读取全部，否则只读取给定id（未发布、已删除的不返回）"""
+    load_all = post_ids is None and tag_ids is None and category_ids is None
+    entries = []
+    if load_all or post_ids:
+        statement = db.select(Post.id, Post.title, Post.slug, Post.view_count).where(Post.is_published == True)
+        if not load_all:
+            statement = statement.where(Post.id.in_(post_ids))
+        entries.extend(suggest_entry('post', post_id, title, f'/post/{slug}', view_count)
+                       for post_id, title, slug, view_count in connection.execute(statement))
+    for kind, model, ids in (('tag', Tag, tag_ids), ('category', Category, category_ids)):
+        if not (load_all or ids):
+            continue
+        statement = db.select(model.id, model.name)
+        if not load_all:
+            statement = statement.where(model.id.in_(ids))
+        rows = connection.execute(statement).all()
+        # 权重为已发布文章数（计数表）
+        names = {f'{kind}.{entity_id}.posts': entity_id for entity_id, _ in rows}
+        counts = dict(connection.execute(db.select(SiteCounter.name, SiteCounter.value).where(
+            SiteCounter.name.in_(names))).all()) if names else {}
+        entries.extend(suggest_entry(kind, entity_id, name, f'/blog?{kind}={entity_id}',
+                                     counts.get(f'{kind}.{entity_id}.posts'))
+                       for entity_id, name in rows)
+    return entries
+
+def get_related_posts(post, limit):
+    """读取预计算的相关文章（按相似度排序）"""
+    return Post.query.options(*post_title_loaders()).join(
+        PostNeighbor, PostNeighbor.neighbor_id == Post.id
+    ).filter(
+        PostNeighbor.post_id == post.id,
+        Post.is_published == True
+    ).order_by(PostNeighbor.rank).limit(limit).all()
+
+# 已被取代、需要从旧库删除的索引 (表名, 索引名, 列)
+OBSOLETE_INDEXES = [('visitor', 'ix_visitor_ip_address', ['ip_address'])]  # 改为唯一索引uq_visitor_ip_address
+
+def ensure_indexes():
+    """补建模型中声明但库里还没有的索引（create_all只建新表，不会给已有的表加索引）"""
+    inspector = db.inspect(db.engine)
+    created = []
+    for table in db.metadata.sorted_tables:
+        existing = {index['name'] for index in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name not in existing:
+                index.create(bind=db.engine)
+                created.append(index.name)
+    with db.engine.begin() as connection:
+        for table_name, index_name, columns in OBSOLETE_INDEXES:
+            if index_name in {index['name'] for index in inspector.get_indexes(table_name)}:
+                # 用临时的表定义构造索引，不影响模型的元数据
+                table = db.Table(table_name, db.MetaData(), *(db.Column(column) for column in columns))
+                db.Index(index_name, *table.c).drop(bind=connection)
+    return created
+
 def init_database(app):
     """初始化数据库"""
     with app.app_context():
         try:
             print("🔧 初始化数据库...")
             db.create_all()
+            # 旧库可能有同一IP的重复访客行，合并后才能建唯一索引
+            if 'uq_visitor_ip_address' not in {index['name'] for index in db.inspect(db.engine).get_indexes('visitor')}:
+                merged_visitors = merge_duplicate_visitors()
+                if merged_visitors:
+                    print(f"🧹 合并重复访客记录: {merged_visitors} 行")
+            created_indexes = ensure_indexes()
+            if created_indexes:
+                print(f"🗂️ 补建索引: {', '.join(created_indexes)}")
+            # 全文索引表（FTS5虚拟表、MySQL全文索引不由模型创建）
+            with db.engine.begin() as connection:
+                search_index.setup(connection)
             
             # 创建默认管理员
             if not User.query.first():
@@ -550,6 +1579,7 @@ plt.show()
                         user_id=admin.id
                     )
                     post.tags = tags
+                    refresh_post_render(post)
                     db.session.add(post)
 
                 # 创建示例项目
@@ -658,6 +1688,21 @@ plt.show()
                 print("✅ 数据库初始化成功")
                 print("👤 管理员账号: admin")
                 print("🔑 管理员密码: admin123")
+
+            # 计数表为空（新建或刚升级）时从业务表统计一次
+            if not SiteCounter.query.first():
+                reconcile_site_counters()
+
+            # 索引表为空（新建或刚升级）时从文章表构建
+            if search_index.is_empty():
+                search_index.rebuild()
+
+            if not PostNeighbor.query.first():
+                related_posts_engine.update()
+
+            # 汇总表为空（刚升级）时从访客表重建
+            if not VisitorRollup.query.first() and Visitor.query.first():
+                rebuild_visitor_rollups(app.config['VISITOR_ROLLUP_HOURLY_DAYS'])
             
             return True
         except Exception as e:
@@ -667,70 +1712,387 @@ plt.show()
 # 创建应用实例
 app = create_app()
 
+# 访客记录队列
+visitor_tracker = VisitorTracker(app, db.session, Visitor.__table__, VisitorRollup.__table__, VisitorSketch.__table__,
+                                 app.config['VISITOR_QUEUE_SIZE'], app.config['VISITOR_BATCH_SIZE'],
+                                 app.config['VISITOR_FLUSH_INTERVAL'], app.config['VISITOR_ROLLUP_HOURLY_DAYS'],
+                                 app.config['HLL_PRECISION'], app.config['SKETCH_FLUSH_INTERVAL'])
+atexit.register(visitor_tracker.drain)
+
+# 爬虫/探活/预取请求过滤（在访客记录之前，不访问数据库）
+traffic_classifier = TrafficClassifier(app.config['TRACKING_SKIP_ENDPOINTS'], app.config['TRACKING_BOT_PATTERNS'],
+                                       app.config['TRACKING_SKIP_PREFETCH'], app.config['TRACKING_SKIP_EMPTY_UA'])
+
+# 浏览量/点赞计数
+post_counters = PostCounters(app, create_counter_backend(app), app.config['COUNTER_FLUSH_INTERVAL'])
+atexit.register(post_counters.flush)
+
+# 整页缓存
+page_cache = PageCache(app.config['PAGE_CACHE_MAX_BYTES'], app.config['PAGE_CACHE_TTL'],
+                       app.config['PAGE_CACHE_DIR'], app.config['PAGE_CACHE_LOCK'],
+                       app.config['REDIS_URL'], app.config['PAGE_CACHE_LOCK_TIMEOUT'])
+
+# 模板全局统计快照
+global_stats = GlobalStatsSnapshot(app.config['GLOBAL_STATS_TTL'], page_cache)
+
+# 影响统计快照的模型；访客插入频繁，只失效本进程的快照，其余跨worker失效
+GLOBAL_STATS_MODELS = (Post, Comment, Category, Tag)
+
+@db.event.listens_for(db.session, 'after_flush')
+def track_global_stats_changes(session, flush_context):
+    changed = list(session.new) + list(session.deleted)
+    if any(isinstance(obj, GLOBAL_STATS_MODELS) for obj in changed + list(session.dirty)):
+        session.info['global_stats_changed'] = 'shared'
+    elif any(isinstance(obj, Visitor) for obj in changed):
+        session.info.setdefault('global_stats_changed', 'local')
+
+@db.event.listens_for(db.session, 'after_commit')
+def invalidate_global_stats(session):
+    changed = session.info.pop('global_stats_changed', None)
+    if changed:
+        global_stats.invalidate(local_only=changed == 'local')
+
+@db.event.listens_for(db.session, 'after_rollback')
+def discard_global_stats_changes(session):
+    session.info.pop('global_stats_changed', None)
+
+# 标签云（每个标签的文章数）
+tag_cloud = TagCloudSnapshot(app.config['GLOBAL_STATS_TTL'], page_cache)
+
+@db.event.listens_for(db.session, 'after_flush')
+def track_tag_cloud_changes(session, flush_context):
+    if any(isinstance(obj, (Post, Tag)) for obj in list(session.new) + list(session.deleted)) or any(
+            isinstance(obj, Tag) or isinstance(obj, Post) and (
+                db.inspect(obj).attrs.is_published.history.has_changes()
+                or db.inspect(obj).attrs.tags.history.has_changes())
+            for obj in session.dirty):
+        session.info['tag_cloud_changed'] = True
+
+@db.event.listens_for(db.session, 'after_commit')
+def invalidate_tag_cloud(session):
+    if session.info.pop('tag_cloud_changed', None):
+        tag_cloud.invalidate()
+
+@db.event.listens_for(db.session, 'after_rollback')
+def discard_tag_cloud_changes(session):
+    session.info.pop('tag_cloud_changed', None)
+
+# 评论在管理接口之外（脚本、命令行）修改时，也失效含评论的页面（与文章页ETag中的评论版本一致），
+# 并重新导出所在文章的静态页面
+@db.event.listens_for(db.session, 'after_flush')
+def track_comment_changes(session, flush_context):
+    post_ids = {obj.post_id for obj in list(session.new) + list(session.deleted) + list(session.dirty)
+                if isinstance(obj, Comment)}
+    if post_ids:
+        session.info.setdefault('comment_post_ids', set()).update(post_ids)
+
+@db.event.listens_for(db.session, 'after_commit')
+def invalidate_comment_pages(session):
+    post_ids = session.info.pop('comment_post_ids', None)
+    if post_ids:
+        page_cache.invalidate('comments')
+        post_ids.discard(None)
+        if app.config['STATIC_EXPORT_DIR'] and post_ids:
+            # after_commit中会话已不能再查询，在新线程中导出
+            threading.Thread(target=export_comment_pages, args=(post_ids,)).start()
+
+@db.event.listens_for(db.session, 'after_rollback')
+def discard_comment_changes(session):
+    session.info.pop('comment_post_ids', None)
+
+# 全文索引（保存文章时增量更新）
+search_index = create_search_index(app, db.session, load_search_documents,
+                                   os.path.join(page_cache.version_dir, 'search'))
+
+SEARCH_INDEXED_FIELDS = ('title', 'summary', 'content', 'is_published', 'tags')
+
+@db.event.listens_for(db.session, 'before_flush')
+def collect_search_tag_changes(session, flush_context, instances):
+    """标签改名或删除时重建相关文章的索引；删除后关联行就查不到了，所以在flush前记下"""
+    tag_ids = [tag.id for tag in session.deleted if isinstance(tag, Tag)] + [
+        tag.id for tag in session.dirty
+        if isinstance(tag, Tag) and db.inspect(tag).attrs.name.history.has_changes()]
+    if tag_ids:
+        rows = session.connection().execute(
+            db.select(post_tags.c.post_id).where(post_tags.c.tag_id.in_(tag_ids)))
+        session.info.setdefault('search_post_ids', set()).update(post_id for post_id, in rows)
+
+@db.event.listens_for(db.session, 'after_flush')
+def update_search_index(session, flush_context):
+    post_ids = session.info.pop('search_post_ids', set())
+    post_ids.update(obj.id for obj in session.new if isinstance(obj, Post))
+    post_ids.update(obj.id for obj in session.dirty if isinstance(obj, Post) and any(
+        db.inspect(obj).attrs[field].history.has_changes() for field in SEARCH_INDEXED_FIELDS))
+    removed_ids = {obj.id for obj in session.deleted if isinstance(obj, Post)}
+    post_ids -= removed_ids
+    if not post_ids and not removed_ids:
+        return
+    connection = session.connection()
+    documents = load_search_documents(connection, post_ids)
+    # 未发布（或已撤回）的文章从索引中删除
+    removed_ids |= post_ids - documents.keys()
+    if search_index.transactional:
+        search_index.apply(connection, documents, removed_ids)
+        return
+    pending_documents, pending_removed = session.info.setdefault('search_pending', ({}, set()))
+    for post_id in removed_ids:
+        pending_documents.pop(post_id, None)
+    pending_documents.update(documents)
+    pending_removed.update(removed_ids)
+    pending_removed.difference_update(documents)
+
+@db.event.listens_for(db.session, 'after_commit')
+def apply_search_index_changes(session):
+    pending = session.info.pop('search_pending', None)
+    if pending:
+        search_index.apply(None, *pending)
+
+@db.event.listens_for(db.session, 'after_rollback')
+def discard_search_index_changes(session):
+    session.info.pop('search_post_ids', None)
+    session.info.pop('search_pending', None)
+
+# 搜索联想索引（后台增删文章、标签、分类后增量更新）
+suggest_index = SuggestIndex(db.session, load_suggest_entries, os.path.join(page_cache.version_dir, 'suggest'),
+                             app.config['SUGGEST_MAX_KEYS'], app.config['SUGGEST_TTL'])
+
+SUGGEST_MODELS = {Post: ('post', ('title', 'slug', 'is_published')), Tag: ('tag', ('name',)),
+                  Category: ('category', ('name',))}
+
+@db.event.listens_for(db.session, 'after_flush')
+def track_suggest_changes(session, flush_context):
+    changed = {'post': set(), 'tag': set(), 'category': set()}
+    for obj in list(session.new) + list(session.deleted) + list(session.dirty):
+        kind, fields = SUGGEST_MODELS.get(type(obj), (None, ()))
+        if kind and (obj not in session.dirty or any(
+                db.inspect(obj).attrs[field].history.has_changes() for field in fields)):
+            changed[kind].add(obj.id)
+    if not any(changed.values()):
+        return
+    # 提交后会话不能再查询，条目在flush时读出
+    entries = load_suggest_entries(session.connection(), changed['post'], changed['tag'], changed['category'])
+    pending_entries, pending_removed = session.info.setdefault('suggest_pending', ({}, set()))
+    pending_removed.update((kind, entity_id) for kind, ids in changed.items() for entity_id in ids)
+    for entity_id in [entity_id for entity_id in pending_entries if entity_id in pending_removed]:
+        del pending_entries[entity_id]
+    pending_entries.update({(entry['type'], entry['id']): entry for entry in entries})
+
+@db.event.listens_for(db.session, 'after_commit')
+def apply_suggest_changes(session):
+    pending = session.info.pop('suggest_pending', None)
+    if pending:
+        suggest_index.apply(list(pending[0].values()), pending[1])
+
+@db.event.listens_for(db.session, 'after_rollback')
+def discard_suggest_changes(session):
+    session.info.pop('suggest_pending', None)
+
+# 相关文章（文章增删改后由后台线程增量重算）
+related_posts_engine = RelatedPostsEngine(app, db.session, Post.__table__, PostNeighbor.__table__, load_search_documents,
+                                          app.config['RELATED_POSTS_COUNT'], app.config['RELATED_REFIT_RATIO'])
+atexit.register(related_posts_engine.drain)
+
+@db.event.listens_for(db.session, 'after_flush')
+def track_related_changes(session, flush_context):
+    changed = {obj.id for obj in list(session.new) + list(session.deleted) if isinstance(obj, Post)}
+    changed.update(obj.id for obj in session.dirty if isinstance(obj, Post) and any(
+        db.inspect(obj).attrs[field].history.has_changes() for field in SEARCH_INDEXED_FIELDS))
+    if changed:
+        session.info.setdefault('related_post_ids', set()).update(changed)
+
+@db.event.listens_for(db.session, 'after_commit')
+def update_related_posts(session):
+    changed = session.info.pop('related_post_ids', None)
+    if changed:
+        # 不在请求线程里重算，只交给后台线程
+        related_posts_engine.schedule(changed)
+
+@db.event.listens_for(db.session, 'after_rollback')
+def discard_related_changes(session):
+    session.info.pop('related_post_ids', None)
+
+# SQL统计
+sql_stats = SqlStats(app.config['SQL_SLOWEST_KEPT'])
+
+@db.event.listens_for(Engine, 'before_cursor_execute')
+def start_sql_timer(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('sql_started', []).append(time.perf_counter())
+
+@db.event.listens_for(Engine, 'after_cursor_execute')
+def record_sql_timing(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info['sql_started'].pop()
+    # 只统计请求内的语句（后台线程没有请求上下文）
+    if not has_request_context() or 'sql_queries' not in g:
+        return
+    g.sql_queries.append((elapsed, statement))
+
+# 管理端写操作 -> 需要失效的页面标签
+ADMIN_WRITE_INVALIDATIONS = {
+    'posts': ('posts', 'comments'),
+    'categories': ('categories', 'posts'),
+    'projects': ('projects',),
+    'timeline': ('timeline',),
+    'links': ('links',),
+    'profile': ('profile',),
+    'account': ('profile',),
+    'settings': ('settings',),
+}
+
+def is_page_cacheable():
+    """只缓存匿名访客的GET请求"""
+    return (app.config['PAGE_CACHE_ENABLED']
+            and request.method == 'GET'
+            and not session.get('admin_logged_in')
+            and not session.get('_flashes')
+            and not current_user.is_authenticated)
+
+def cached_page(*tags):
+    """整页缓存装饰器，tags为页面依赖的实体，对应实体被修改时页面失效"""
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            if not is_page_cacheable():
+                return f(*args, **kwargs)
+
+            key = request.full_path
+            entry, expired = page_cache.get(key)
+            if entry and not expired:
+                page_cache.hits += 1
+                return _cached_response(entry, 'HIT')
+            # 有旧页面时不等锁：已有请求（可能在其他worker）在重建，先返回旧页面
+            lock = page_cache.key_lock(key)
+            locked = lock.acquire(blocking=entry is None)
+            if not locked and entry:
+                page_cache.stale_hits += 1
+                return _cached_response(entry, 'STALE')
+            try:
+                # 等锁期间其他请求（包括其他worker）可能已经生成好了
+                if locked:
+                    entry, expired = page_cache.get(key)
+                    if entry and not expired:
+                        page_cache.hits += 1
+                        return _cached_response(entry, 'HIT')
+
+                page_cache.misses += 1
+                versions = page_cache.tag_versions(tags)
+                response = make_response(f(*args, **kwargs))
+                if response.status_code == 200 and not response.direct_passthrough:
+                    page_cache.set(key, response.get_data(), response.status_code,
+                                   {'Content-Type': response.headers.get('Content-Type')}, versions)
+                response.headers['X-Page-Cache'] = 'MISS'
+                return response
+            finally:
+                if locked:
+                    lock.release()
+        return decorated_function
+    return decorator
+
+def _cached_response(entry, state):
+    response = make_response(entry['body'], entry['status'])
+    response.headers.update(entry['headers'])
+    response.headers['X-Page-Cache'] = state
+    return response
+
+# 条件请求（ETag / Last-Modified）
+def make_etag(*parts):
+    """根据版本信息生成ETag，模板版本变化时ETag随之变化"""
+    raw = '|'.join(str(part) for part in (TEMPLATE_VERSION,) + parts)
+    return hashlib.sha1(raw.encode('utf-8')).hexdigest()
+
+def not_modified_response(etag, last_modified, weak=False):
+    """客户端缓存仍然有效时返回304响应，否则返回None"""
+    if request.if_none_match:
+        # 有If-None-Match时忽略If-Modified-Since；GET请求按弱比较
+        matched = request.if_none_match.contains_weak(etag)
+    elif request.if_modified_since and last_modified:
+        matched = last_modified.replace(microsecond=0) <= request.if_modified_since.replace(tzinfo=None)
+    else:
+        matched = False
+    if not matched:
+        return None
+    response = make_response('', 304)
+    return set_validators(response, etag, last_modified, weak)
+
+def set_validators(response, etag, last_modified, weak=False):
+    response.set_etag(etag, weak=weak)
+    if last_modified:
+        response.last_modified = last_modified
+    response.cache_control.no_cache = True
+    return response
+
+@app.before_request
+def start_sql_stats():
+    if app.config['SQL_INSTRUMENTATION']:
+        g.sql_queries = []
+
+@app.after_request
+def add_sql_timing(response):
+    """Server-Timing响应头：SQL语句数、数据库总耗时和最慢一条"""
+    queries = g.pop('sql_queries', None)
+    if queries is None:
+        return response
+    total = sum(elapsed for elapsed, _ in queries)
+    slowest = sorted(queries, key=lambda query: query[0], reverse=True)[:3]
+    sql_stats.record(request.endpoint or request.path, len(queries), total,
+                     [(elapsed, ' '.join(statement.split())[:300]) for elapsed, statement in slowest])
+    timings = [f'db;dur={total * 1000:.2f};desc="{len(queries)} queries"']
+    if slowest:
+        timings.append(f'db-slowest;dur={slowest[0][0] * 1000:.2f}')
+    response.headers.add('Server-Timing', ', '.join(timings))
+    return response
+
+@app.after_request
+def add_api_etag(response):
+    """JSON接口按响应内容生成ETag，未变化时返回304"""
+    if (request.method == 'GET' and request.path.startswith('/api/')
+            and response.status_code == 200 and response.mimetype == 'application/json'
+            and not response.direct_passthrough):
+        response.add_etag()
+        response.make_conditional(request)
+    return response
+
+@app.after_request
+def invalidate_page_cache(response):
+    """管理端写操作成功后失效相关页面，并重新导出静态页面"""
+    if request.method in ('POST', 'PUT', 'DELETE') and response.status_code < 400:
+        resource = None
+        if request.path.startswith('/api/admin/'):
+            resource = request.path[len('/api/admin/'):].split('/', 1)[0]
+        elif request.endpoint == 'admin_settings':
+            resource = 'settings'
+        elif request.endpoint == 'admin_account':
+            resource = 'account'
+        tags = ADMIN_WRITE_INVALIDATIONS.get(resource, ())
+        if tags:
+            page_cache.invalidate(*tags)
+            export_resource_pages(resource)
+    return response
+
 # 路由定义
 @app.before_request
 def track_visitor():
-    """跟踪访客信息"""
+    """跟踪访客信息（先过滤爬虫/探活/预取，读者只入队，由后台线程批量写库）"""
     if request.endpoint and not request.endpoint.startswith('static'):
         ip = request.environ.get('HTTP_X_FORWARDED_FOR', request.remote_addr)
-        if ip and ip != '127.0.0.1':
-            visitor = Visitor.query.filter_by(ip_address=ip).first()
-            if visitor:
-                visitor.visit_count += 1
-                visitor.last_visit = datetime.utcnow()
-            else:
-                # 获取地理信息
-                geo_info = get_visitor_info(ip)
-                distance = 0
-                if geo_info:
-                    distance = calculate_distance(
-                        geo_info['latitude'], geo_info['longitude'],
-                        app.config['AUTHOR_LAT'], app.config['AUTHOR_LON']
-                    )
-
-                visitor = Visitor(
-                    ip_address=ip,
-                    user_agent=request.user_agent.string,
-                    country=geo_info['country'] if geo_info else '',
-                    city=geo_info['city'] if geo_info else '',
-                    latitude=geo_info['latitude'] if geo_info else 0,
-                    longitude=geo_info['longitude'] if geo_info else 0,
-                    distance_km=distance
-                )
-
-            try:
-                db.session.add(visitor)
-                db.session.commit()
-            except:
-                db.session.rollback()
+        if ip and ip != '127.0.0.1' and traffic_classifier.check(request.endpoint, request.user_agent.string,
+                                                                  request.headers):
+            g.visitor_ip = ip
+            visitor_tracker.record(ip, request.user_agent.string)
 
 @app.context_processor
 def inject_global_vars():
     """注入全局模板变量"""
-    # 统计信息
-    stats = {
-        'total_posts': Post.query.filter_by(is_published=True).count(),
-        'total_categories': Category.query.count(),
-        'total_tags': Tag.query.count(),
-        'total_views': db.session.query(db.func.sum(Post.view_count)).scalar() or 0,
-        'total_visitors': Visitor.query.count(),
-        'total_comments': Comment.query.filter_by(is_approved=True).count()
-    }
-
-    # 最新评论
-    recent_comments = Comment.query.filter_by(is_approved=True).order_by(Comment.created_at.desc()).limit(5).all()
-
-    # 热门文章
-    popular_posts = Post.query.filter_by(is_published=True).order_by(Post.view_count.desc()).limit(5).all()
+    # 统计信息、最新评论、热门文章（来自快照）
+    snapshot = global_stats.get()
 
     # 当前时间和日历
     now = datetime.now()
     cal = calendar.monthcalendar(now.year, now.month)
 
     return {
-        'stats': stats,
-        'recent_comments': recent_comments,
-        'popular_posts': popular_posts,
+        'stats': snapshot['stats'],
+        'recent_comments': snapshot['recent_comments'],
+        'popular_posts': snapshot['popular_posts'],
         'current_time': now,
         'calendar_data': cal,
         'month_name': calendar.month_name[now.month],
@@ -738,19 +2100,22 @@ def inject_global_vars():
     }
 
 @app.route('/')
+@cached_page('posts', 'categories', 'tags', 'comments', 'projects', 'links')
 def index():
     """首页"""
     # 精选文章
-    featured_posts = Post.query.filter_by(is_published=True, is_featured=True).order_by(Post.created_at.desc()).limit(3).all()
+    featured_posts = Post.query.options(*post_card_loaders()).filter_by(
+        is_published=True, is_featured=True).order_by(Post.created_at.desc()).limit(3).all()
 
     # 最新文章
-    recent_posts = Post.query.filter_by(is_published=True).order_by(Post.created_at.desc()).limit(6).all()
+    recent_posts = Post.query.options(*post_card_loaders()).filter_by(
+        is_published=True).order_by(Post.created_at.desc()).limit(6).all()
 
     # 分类
     categories = Category.query.all()
 
-    # 热门标签
-    tags = Tag.query.limit(15).all()
+    # 热门标签（缓存的标签云）
+    tags = tag_cloud.top(15)
 
     # 最新项目
     recent_projects = Project.query.filter_by(is_featured=True).order_by(Project.created_at.desc()).limit(3).all()
@@ -765,11 +2130,12 @@ def index():
     current_time = datetime.now()
 
     # 统计数据
+    counters = get_counters('posts.total', 'visitors.total', 'views.total', 'comments.total')
     stats = {
-        'total_posts': Post.query.count(),
-        'total_visitors': Visitor.query.count(),
-        'total_views': sum(post.view_count for post in Post.query.all()),
-        'total_comments': Comment.query.count()
+        'total_posts': counters['posts.total'],
+        'total_visitors': counters['visitors.total'],
+        'total_views': counters['views.total'],
+        'total_comments': counters['comments.total']
     }
 
     # 日历数据
@@ -782,26 +2148,20 @@ def index():
         'year': now.year
     }
 
-    return render_template_string(INDEX_TEMPLATE,
-                                featured_posts=featured_posts,
-                                recent_posts=recent_posts,
-                                categories=categories,
-                                tags=tags,
-                                recent_projects=recent_projects,
-                                friend_links=friend_links,
-                                recent_visitors=recent_visitors,
-                                current_time=current_time,
-                                stats=stats,
-                                **calendar_data)
-
-@app.route('/blog')
-def blog():
-    """博客列表"""
-    page = request.args.get('page', 1, type=int)
-    category_id = request.args.get('category', type=int)
-    tag_id = request.args.get('tag', type=int)
-    search = request.args.get('search', '')
-
+    return render_template('index.html',
+                           featured_posts=featured_posts,
+                           recent_posts=recent_posts,
+                           categories=categories,
+                           tags=tags,
+                           recent_projects=recent_projects,
+                           friend_links=friend_links,
+                           recent_visitors=recent_visitors,
+                           current_time=current_time,
+                           stats=stats,
+                           **calendar_data)
+
+def build_blog_query(category_id=None, tag_id=None, search=''):
+    """博客列表的筛选条件"""
     query = Post.query.filter_by(is_published=True)
 
     if category_id:
@@ -811,59 +2171,180 @@ def blog():
         query = query.filter(Post.tags.any(Tag.id == tag_id))
 
     if search:
-        query = query.filter(Post.title.contains(search) | Post.content.contains(search))
+        query = query.filter(Post.id.in_(search_posts(search)))
+
+    return query
+
+class KeysetPage:
+    """游标分页结果（按 created_at, id 倒序），模板中用 cursor_mode 区分页码分页"""
+
+    cursor_mode = True
+
+    def __init__(self, items, per_page, next_cursor=None, prev_cursor=None, total=None):
+        self.items = items
+        self.per_page = per_page
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
+        self.total = total
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
 
-    posts = query.order_by(Post.created_at.desc()).paginate(
-        page=page, per_page=app.config['POSTS_PER_PAGE'], error_out=False)
+    @property
+    def has_prev(self):
+        return self.prev_cursor is not None
+
+def keyset_paginate(query, cursor, per_page, total=None):
+    """
+    按 (created_at, id) 做游标分页：只取 per_page+1 行判断是否还有下一页，不做COUNT和OFFSET
+    游标无效时从第一页开始
+    """
+    items, next_cursor, prev_cursor = pagination.keyset_paginate(query, Post, cursor, per_page)
+    return KeysetPage(items, per_page, next_cursor=next_cursor, prev_cursor=prev_cursor, total=total)
+
+# 博客列表页ETag依赖的计数：文章删除/下线、评论审核、分类和标签增删都会改变其中之一
+BLOG_ETAG_COUNTERS = ('posts.published', 'comments.approved', 'categories.total', 'tags.total')
+
+@app.route('/blog')
+def blog():
+    """博客列表"""
+    category_id = request.args.get('category', type=int)
+    tag_id = request.args.get('tag', type=int)
+    search = request.args.get('search', '')
+
+    # 列表页使用弱ETag：筛选结果的最新修改时间 + 计数表中的几项计数（各主机一致，不依赖本机文件），
+    # 一次查询取出；未筛选时走 (is_published, updated_at) 索引。
+    # 页码分页需要总数：未筛选时用计数表，筛选时在同一查询里COUNT（渲染时不再单独COUNT）；游标分页不计数
+    counter_values = [db.select(SiteCounter.value).where(SiteCounter.name == name).scalar_subquery()
+                      for name in BLOG_ETAG_COUNTERS]
+    filtered = bool(category_id or tag_id or search)
+    paged = not request.args.get('cursor')
+    aggregates = [db.func.max(Post.updated_at), db.func.count(Post.id) if filtered and paged else db.null()]
+    last_modified, total, *values = build_blog_query(category_id, tag_id, search).with_entities(
+        *aggregates, *counter_values).one()
+    counters = {name: value or 0 for name, value in zip(BLOG_ETAG_COUNTERS, values)}
+    etag = make_etag(request.full_path, last_modified, *(counters[name] for name in BLOG_ETAG_COUNTERS))
+    not_modified = not_modified_response(etag, last_modified, weak=True)
+    if not_modified:
+        return not_modified
+
+    if paged and not filtered:
+        total = counters['posts.published']
+    response = make_response(render_blog_page(category_id, tag_id, search, total))
+    return set_validators(response, etag, last_modified, weak=True)
+
+@cached_page('posts', 'categories', 'tags', 'comments')
+def render_blog_page(category_id, tag_id, search, total=None):
+    """
+    渲染博客列表页：带cursor参数时用游标分页，否则按页码分页；搜索结果按相关度排序、按页码分页
+    total为已知的文章总数（计数表），有则不再单独COUNT；游标分页不计算总数
+    """
+    query = build_blog_query(category_id, tag_id, search).options(*post_card_loaders())
+    per_page = app.config['POSTS_PER_PAGE']
+    cursor = request.args.get('cursor')
+    search_highlights = None
+    if search:
+        ranked_ids = search_posts(search)
+        if ranked_ids:
+            query = query.order_by(db.case({post_id: rank for rank, post_id in enumerate(ranked_ids)}, value=Post.id))
+        posts = query.paginate(page=request.args.get('page', 1, type=int), per_page=per_page,
+                               error_out=False, count=total is None)
+        if total is not None:
+            posts.total = total
+        # 结果数有上限（SEARCH_MAX_RESULTS），按页码翻到底
+        posts.next_cursor = None
+        terms = search_terms(search)
+        search_highlights = {
+            post.id: {'title': highlight_text(post.title, terms), 'snippet': search_snippet(post.content, terms)}
+            for post in posts.items
+        }
+    elif cursor:
+        posts = keyset_paginate(query, cursor, per_page)
+    else:
+        page = request.args.get('page', 1, type=int)
+        posts = query.order_by(Post.created_at.desc(), Post.id.desc()).paginate(
+            page=page, per_page=per_page, error_out=False, count=total is None)
+        if total is not None:
+            posts.total = total
+        # 超过页码分页上限的“下一页”改用游标
+        posts.next_cursor = encode_cursor(posts.items[-1], 'next') if posts.items else None
 
     categories = Category.query.all()
-    tags = Tag.query.all()
+    tags = tag_cloud.get()
 
-    return render_template_string(BLOG_TEMPLATE,
-                                posts=posts,
-                                categories=categories,
-                                tags=tags,
-                                current_category=category_id,
-                                current_tag=tag_id,
-                                search_query=search)
+    return render_template('blog.html',
+                           posts=posts,
+                           categories=categories,
+                           tags=tags,
+                           current_category=category_id,
+                           current_tag=tag_id,
+                           search_query=search,
+                           search_highlights=search_highlights)
 
 @app.route('/post/<slug>')
 def post(slug):
     """文章详情"""
-    post = Post.query.filter_by(slug=slug, is_published=True).first_or_404()
-
-    # 增加浏览量
-    post.view_count += 1
-    db.session.commit()
-
-    # 相关文章
-    related_posts = []
-    if post.category_id:
-        related_posts = Post.query.filter(
-            Post.id != post.id,
-            Post.is_published == True,
-            Post.category_id == post.category_id
-        ).limit(3).all()
+    # 页面还包含已审核的评论：最新评论id和评论数随验证信息一起查询（走评论的 post_id, is_approved 索引）
+    approved = db.and_(Comment.post_id == Post.id, Comment.is_approved == True)
+    latest_comment = db.select(db.func.max(Comment.id)).where(approved).correlate(Post).scalar_subquery()
+    comment_count = db.select(db.func.count(Comment.id)).where(approved).correlate(Post).scalar_subquery()
+    commented_at = db.select(db.func.max(Comment.created_at)).where(approved).correlate(Post).scalar_subquery()
+    validators = db.session.query(
+        Post.id, Post.updated_at, PostRender.content_hash, latest_comment, comment_count, commented_at
+    ).outerjoin(PostRender, PostRender.post_id == Post.id).filter(
+        Post.slug == slug, Post.is_published == True).first()
+    if not validators:
+        abort(404)
+    post_id, last_modified, content_hash, latest_comment_id, comment_count, commented_at = validators
+    if commented_at and (last_modified is None or commented_at > last_modified):
+        last_modified = commented_at
+
+    # 文章页使用弱ETag：修改时间 + 内容版本 + 已审核评论；浏览量和侧栏统计不计入，
+    # 只保证语义相同，不保证逐字节相同
+    etag = make_etag(post_id, last_modified, content_hash, latest_comment_id, comment_count)
+    not_modified = not_modified_response(etag, last_modified, weak=True)
+    if not_modified:
+        return not_modified
+
+    # 只有发送完整页面时才计浏览量（页面可能命中缓存，计数先缓冲，由后台线程批量写库），304不计
+    post_counters.increment(post_id)
+    # 文章读者草图（track_visitor已过滤掉爬虫等请求）
+    if g.get('visitor_ip'):
+        visitor_tracker.record_read(post_id, g.visitor_ip)
+
+    response = make_response(render_post_page(slug))
+    return set_validators(response, etag, last_modified, weak=True)
+
+@cached_page('posts', 'categories', 'tags', 'comments')
+def render_post_page(slug):
+    """渲染文章详情页"""
+    post = Post.query.options(*post_detail_loaders()).filter_by(slug=slug, is_published=True).first_or_404()
+
+    # 相关文章（预计算的TF-IDF近邻）
+    related_posts = get_related_posts(post, app.config['RELATED_POSTS_COUNT'])
 
     # 评论
     comments = Comment.query.filter_by(post_id=post.id, is_approved=True).order_by(Comment.created_at.asc()).all()
 
-    return render_template_string(POST_TEMPLATE,
-                                post=post,
-                                related_posts=related_posts,
-                                comments=comments)
+    return render_template('post.html',
+                           post=post,
+                           related_posts=related_posts,
+                           comments=comments)
 
 @app.route('/projects')
+@cached_page('projects', 'posts', 'comments')
 def projects():
     """项目展示"""
     featured_projects = Project.query.filter_by(is_featured=True).order_by(Project.sort_order).all()
     other_projects = Project.query.filter_by(is_featured=False).order_by(Project.sort_order).all()
 
-    return render_template_string(PROJECTS_TEMPLATE,
-                                featured_projects=featured_projects,
-                                other_projects=other_projects)
+    return render_template('projects.html',
+                           featured_projects=featured_projects,
+                           other_projects=other_projects)
 
 @app.route('/project/<int:project_id>')
+@cached_page('projects', 'posts', 'comments')
 def project_detail(project_id):
     """项目详情页面"""
     try:
@@ -875,13 +2356,14 @@ def project_detail(project_id):
             Project.is_featured == True
         ).limit(3).all()
 
-        return render_template_string(PROJECT_DETAIL_TEMPLATE,
-                                    project=project,
-                                    related_projects=related_projects)
+        return render_template('project_detail.html',
+                               project=project,
+                               related_projects=related_projects)
     except Exception as e:
         return f"<h1>项目详情</h1><p>项目ID: {project_id}</p><p>错误: {str(e)}</p>", 500
 
 @app.route('/timeline')
+@cached_page('timeline', 'posts', 'comments')
 def timeline():
     """学习历程时间线"""
     timeline_items = Timeline.query.order_by(Timeline.date.desc()).all()
@@ -894,22 +2376,24 @@ def timeline():
             timeline_by_year[year] = []
         timeline_by_year[year].append(item)
 
-    return render_template_string(TIMELINE_TEMPLATE,
-                                timeline_by_year=timeline_by_year)
+    return render_template('timeline.html',
+                           timeline_by_year=timeline_by_year)
 
 @app.route('/links')
+@cached_page('links', 'posts', 'comments')
 def links():
     """友情链接和推荐网站"""
     friend_links = Link.query.filter_by(category='friend', is_active=True).order_by(Link.sort_order).all()
     recommend_links = Link.query.filter_by(category='recommend', is_active=True).order_by(Link.sort_order).all()
     tool_links = Link.query.filter_by(category='tool', is_active=True).order_by(Link.sort_order).all()
 
-    return render_template_string(LINKS_TEMPLATE,
-                                friend_links=friend_links,
-                                recommend_links=recommend_links,
-                                tool_links=tool_links)
+    return render_template('links.html',
+                           friend_links=friend_links,
+                           recommend_links=recommend_links,
+                           tool_links=tool_links)
 
 @app.route('/about')
+@cached_page('settings', 'profile', 'posts', 'categories', 'tags', 'comments')
 def about():
     """关于页面"""
     # 获取博主信息
@@ -961,10 +2445,10 @@ def about():
         'Git': 90
     }
 
-    return render_template_string(ABOUT_TEMPLATE,
-                                author=author,
-                                tech_stats=tech_stats,
-                                about_content=about_content)
+    return render_template('about.html',
+                           author=author,
+                           tech_stats=tech_stats,
+                           about_content=about_content)
 
 @app.route('/api/weather')
 def api_weather():
@@ -973,33 +2457,43 @@ def api_weather():
     weather_data = get_weather_info(city)
     return jsonify(weather_data) if weather_data else jsonify({'error': 'Unable to fetch weather data'})
 
+@app.route('/api/search/suggest')
+def api_search_suggest():
+    """搜索框联想：按前缀返回文章标题、标签、分类（内存索引，不查数据库）"""
+    query = request.args.get('q', '').strip()[:50]
+    limit = max(1, min(request.args.get('limit', 8, type=int), 20))
+    suggestions = suggest_index.suggest(query, limit) if query else []
+    response = jsonify({
+        'query': query,
+        'suggestions': [{'type': item['type'], 'text': item['text'], 'url': item['url']} for item in suggestions]
+    })
+    response.cache_control.public = True
+    response.cache_control.max_age = 60
+    return response
+
+@app.route('/api/posts/<int:post_id>/like', methods=['POST'])
+def api_like_post(post_id):
+    """文章点赞（同一会话只计一次，计数先缓冲再批量写库）"""
+    post = db.session.query(Post.id, Post.like_count).filter(
+        Post.id == post_id, Post.is_published == True).first()
+    if not post:
+        return jsonify({'success': False, 'message': '文章不存在'}), 404
+
+    liked_posts = session.get('liked_posts', [])
+    if post_id not in liked_posts:
+        post_counters.increment(post_id, 'like_count')
+        session['liked_posts'] = liked_posts + [post_id]
+    return jsonify({'success': True,
+                    'like_count': (post.like_count or 0) + post_counters.pending(post_id, 'like_count')})
+
 @app.route('/api/visitor-stats')
 def api_visitor_stats():
-    """访客统计API"""
-    # 今日访客
-    today = datetime.now().date()
-    today_visitors = Visitor.query.filter(
-        db.func.date(Visitor.last_visit) == today
-    ).count()
-
-    # 本周访客
-    week_ago = datetime.now() - timedelta(days=7)
-    week_visitors = Visitor.query.filter(
-        Visitor.last_visit >= week_ago
-    ).count()
-
-    # 访客地区分布
-    visitor_countries = db.session.query(
-        Visitor.country,
-        db.func.count(Visitor.id).label('count')
-    ).group_by(Visitor.country).order_by(db.desc('count')).limit(10).all()
-
-    return jsonify({
-        'today_visitors': today_visitors,
-        'week_visitors': week_visitors,
-        'total_visitors': Visitor.query.count(),
-        'countries': [{'name': country, 'count': count} for country, count in visitor_countries]
-    })
+    """访客统计API（首页每次加载都会请求，只读草图表和汇总表的少量行）"""
+    summary = get_visitor_summary()
+    summary['total_visitors'] = get_counters('visitors.total')['visitors.total']
+    response = jsonify(summary)
+    response.headers['Cache-Control'] = 'public, max-age=60'
+    return response
 
 @app.route('/login', methods=['GET', 'POST'])
 def login():
@@ -1016,36 +2510,36 @@ def login():
         else:
             flash('用户名或密码错误')
 
-    return render_template_string(LOGIN_TEMPLATE)
+    return render_template('login.html')
 
 @app.route('/admin')
 @login_required
 def admin_dashboard():
     """管理后台首页"""
     # 统计数据
+    counters = get_counters('posts.total', 'posts.published', 'posts.draft',
+                            'comments.total', 'comments.pending', 'visitors.total')
     dashboard_stats = {
-        'total_posts': Post.query.count(),
-        'published_posts': Post.query.filter_by(is_published=True).count(),
-        'draft_posts': Post.query.filter_by(is_published=False).count(),
-        'total_comments': Comment.query.count(),
-        'pending_comments': Comment.query.filter_by(is_approved=False).count(),
-        'total_visitors': Visitor.query.count(),
-        'today_visitors': Visitor.query.filter(
-            db.func.date(Visitor.last_visit) == datetime.now().date()
-        ).count()
+        'total_posts': counters['posts.total'],
+        'published_posts': counters['posts.published'],
+        'draft_posts': counters['posts.draft'],
+        'total_comments': counters['comments.total'],
+        'pending_comments': counters['comments.pending'],
+        'total_visitors': counters['visitors.total'],
+        'today_visitors': count_unique_visitors()
     }
 
     # 最新文章
-    recent_posts = Post.query.order_by(Post.created_at.desc()).limit(5).all()
+    recent_posts = Post.query.options(*post_title_loaders()).order_by(Post.created_at.desc()).limit(5).all()
 
     # 最新评论
     recent_comments = Comment.query.order_by(Comment.created_at.desc()).limit(5).all()
 
-    return render_template_string(ADMIN_DASHBOARD_TEMPLATE,
-                                dashboard_stats=dashboard_stats,
-                                recent_posts=recent_posts,
-                                recent_comments=recent_comments,
-                                current_user=current_user)
+    return render_template('admin/dashboard.html',
+                           dashboard_stats=dashboard_stats,
+                           recent_posts=recent_posts,
+                           recent_comments=recent_comments,
+                           current_user=current_user)
 
 @app.route('/admin/settings', methods=['GET', 'POST'])
 @login_required
@@ -1133,7 +2627,7 @@ def admin_settings():
         if key not in settings_data:
             settings_data[key] = default_value
 
-    return render_template_string(ADMIN_SETTINGS_TEMPLATE, settings=settings_data)
+    return render_template('admin/settings.html', settings=settings_data)
 
 @app.route('/admin/account', methods=['GET', 'POST'])
 @login_required
@@ -1238,7 +2732,7 @@ def admin_account():
 
         return redirect(url_for('admin_account'))
 
-    return render_template_string(ADMIN_ACCOUNT_TEMPLATE, user=current_user)
+    return render_template('admin/account.html', user=current_user)
 
 @app.route('/logout')
 @login_required
@@ -1249,7 +2743,16 @@ def logout():
 
 @app.route('/health')
 def health():
-    return {'status': 'ok', 'app': 'rich_blog_app.py', 'features': 'complete', 'version': '2.0', 'timestamp': datetime.now().isoformat()}
+    return {'status': 'ok', 'app': 'rich_blog_app.py', 'features': 'complete', 'version': '2.0', 'timestamp': datetime.now().isoformat(),
+            'visitor_queue': visitor_tracker.stats(),
+            'traffic': traffic_classifier.stats(),
+            'post_counters': post_counters.stats(),
+            'global_stats': global_stats.stats(),
+            'tag_cloud': tag_cloud.stats(),
+            'geo_cache': geo_cache.stats() if geo_cache else None,
+            'search_index': search_index.stats(),
+            'suggest_index': suggest_index.stats(),
+            'related_posts': related_posts_engine.stats()}
 
 # 模板定义
 INDEX_TEMPLATE = '''
@@ -2434,8 +3937,8 @@ INDEX_TEMPLATE = '''
                     </h5>
                     {% for tag in tags %}
                     <a href="{{ url_for('blog', tag=tag.id) }}"
-                       class="tag"
-                       style="background-color: {{ tag.color }}; color: white;">
+                       class="tag" title="{{ tag.count }} 篇文章"
+                       style="background-color: {{ tag.color }}; color: white; font-size: {{ 0.7 + tag.level * 0.1 }}rem;">
                         {{ tag.name }}
                     </a>
                     {% endfor %}
@@ -3220,6 +4723,48 @@ BASE_STYLES = '''
         .fade-in-up {
             animation: fadeInUp 0.6s ease-out;
         }
+
+        /* 搜索联想下拉框 */
+        .search-suggestions {
+            position: absolute;
+            top: 100%;
+            left: 0;
+            right: 3rem;
+            z-index: 1000;
+            margin-top: 0.3rem;
+            background: rgba(30, 41, 59, 0.97);
+            border: 1px solid rgba(102, 126, 234, 0.3);
+            border-radius: 12px;
+            overflow: hidden;
+            display: none;
+        }
+
+        .search-suggestions a {
+            display: flex;
+            justify-content: space-between;
+            padding: 0.5rem 1rem;
+            color: white;
+            text-decoration: none;
+            font-size: 0.9rem;
+        }
+
+        .search-suggestions a.active,
+        .search-suggestions a:hover {
+            background: rgba(102, 126, 234, 0.25);
+        }
+
+        .search-suggestions small {
+            opacity: 0.6;
+            margin-left: 1rem;
+        }
+
+        /* 搜索结果高亮 */
+        mark {
+            background: rgba(240, 147, 251, 0.35);
+            color: inherit;
+            padding: 0 0.1em;
+            border-radius: 3px;
+        }
     </style>
 '''
 
@@ -3488,14 +5033,15 @@ BLOG_TEMPLATE = '''
             <!-- 搜索和筛选 -->
             <div class="row mb-5 fade-in-up justify-content-center">
                 <div class="col-md-6">
-                    <form method="GET" class="d-flex">
-                        <input type="text" name="search" class="form-control me-2"
-                               placeholder="🔍 搜索学习笔记..."
+                    <form method="GET" class="d-flex position-relative">
+                        <input type="text" name="search" id="blog-search" class="form-control me-2"
+                               placeholder="🔍 搜索学习笔记..." autocomplete="off"
                                value="{{ search_query or '' }}"
                                style="background: rgba(30, 41, 59, 0.8); border: 1px solid rgba(102, 126, 234, 0.3); color: white; border-radius: 20px; padding: 0.6rem 1.2rem; font-size: 0.9rem;">
                         <button type="submit" class="btn btn-cool btn-sm">
                             <i class="fas fa-search"></i>
                         </button>
+                        <div id="search-suggestions" class="search-suggestions"></div>
                     </form>
                 </div>
                 <div class="col-md-3">
@@ -3512,6 +5058,19 @@ BLOG_TEMPLATE = '''
                 </div>
             </div>
 
+            <!-- 标签云 -->
+            {% if tags %}
+            <div class="text-center mb-4 fade-in-up">
+                {% for tag in tags %}
+                <a href="{{ url_for('blog', tag=tag.id) }}" class="cool-tag text-decoration-none d-inline-block mb-2"
+                   title="{{ tag.count }} 篇文章"
+                   style="font-size: {{ 0.7 + tag.level * 0.1 }}rem; {% if current_tag == tag.id %}background-color: {{ tag.color }}; color: white;{% else %}background-color: {{ tag.color }}20; color: {{ tag.color }};{% endif %} border-color: {{ tag.color }}40;">
+                    {{ tag.name }} <small class="opacity-75">{{ tag.count }}</small>
+                </a>
+                {% endfor %}
+            </div>
+            {% endif %}
+
             <!-- 文章列表 -->
             <div class="row">
                 {% for post in posts.items %}
@@ -3524,14 +5083,15 @@ BLOG_TEMPLATE = '''
                             </div>
                             {% endif %}
                             <div class="flex-grow-1">
+                                {% set highlight = search_highlights[post.id] if search_highlights else None %}
                                 <h5 class="mb-2">
                                     <a href="{{ url_for('post', slug=post.slug) }}"
                                        class="text-decoration-none text-white"
                                        style="transition: all 0.3s ease;">
-                                        {{ post.title }}
+                                        {{ highlight.title if highlight else post.title }}
                                     </a>
                                 </h5>
-                                <p class="text-light opacity-75 mb-3">{{ post.summary or post.content[:120] + '...' }}</p>
+                                <p class="text-light opacity-75 mb-3">{{ highlight.snippet if highlight else post.summary or post.content[:120] + '...' }}</p>
                             </div>
                         </div>
 
@@ -3563,29 +5123,57 @@ BLOG_TEMPLATE = '''
             </div>
 
             <!-- 分页 -->
-            {% if posts.pages > 1 %}
+            {% set page_args = {'category': current_category, 'tag': current_tag, 'search': search_query or None} %}
+            {% set offset_limit = posts.pages if search_query else config.BLOG_OFFSET_PAGE_LIMIT %}
+            {% if posts.cursor_mode %}
+            {% if posts.has_prev or posts.has_next %}
+            <nav class="mt-5 fade-in-up">
+                <ul class="pagination justify-content-center">
+                    {% if posts.has_prev %}
+                    <li class="page-item">
+                        <a class="page-link btn-cool me-2" href="{{ url_for('blog', cursor=posts.prev_cursor, **page_args) }}">
+                            <i class="fas fa-chevron-left me-1"></i>上一页
+                        </a>
+                    </li>
+                    {% endif %}
+
+                    <li class="page-item">
+                        <a class="page-link cool-tag me-1" href="{{ url_for('blog', **page_args) }}">首页</a>
+                    </li>
+
+                    {% if posts.has_next %}
+                    <li class="page-item">
+                        <a class="page-link btn-cool ms-2" href="{{ url_for('blog', cursor=posts.next_cursor, **page_args) }}">
+                            下一页<i class="fas fa-chevron-right ms-1"></i>
+                        </a>
+                    </li>
+                    {% endif %}
+                </ul>
+            </nav>
+            {% endif %}
+            {% elif posts.pages > 1 %}
             <nav class="mt-5 fade-in-up">
                 <ul class="pagination justify-content-center">
                     {% if posts.has_prev %}
                     <li class="page-item">
-                        <a class="page-link btn-cool me-2" href="{{ url_for('blog', page=posts.prev_num) }}">
+                        <a class="page-link btn-cool me-2" href="{{ url_for('blog', page=posts.prev_num, **page_args) }}">
                             <i class="fas fa-chevron-left me-1"></i>上一页
                         </a>
                     </li>
                     {% endif %}
 
-                    {% for page_num in posts.iter_pages() %}
-                        {% if page_num %}
+                    {% for page_num in posts.iter_pages(right_edge=0 if posts.pages > offset_limit else 2) %}
+                        {% if page_num and page_num <= offset_limit %}
                             {% if page_num != posts.page %}
                             <li class="page-item">
-                                <a class="page-link cool-tag me-1" href="{{ url_for('blog', page=page_num) }}">{{ page_num }}</a>
+                                <a class="page-link cool-tag me-1" href="{{ url_for('blog', page=page_num, **page_args) }}">{{ page_num }}</a>
                             </li>
                             {% else %}
                             <li class="page-item active">
                                 <span class="page-link btn-cool me-1">{{ page_num }}</span>
                             </li>
                             {% endif %}
-                        {% else %}
+                        {% elif not page_num %}
                         <li class="page-item disabled">
                             <span class="page-link cool-tag me-1">…</span>
                         </li>
@@ -3594,7 +5182,11 @@ BLOG_TEMPLATE = '''
 
                     {% if posts.has_next %}
                     <li class="page-item">
-                        <a class="page-link btn-cool ms-2" href="{{ url_for('blog', page=posts.next_num) }}">
+                        {% if posts.next_num > offset_limit %}
+                        <a class="page-link btn-cool ms-2" href="{{ url_for('blog', cursor=posts.next_cursor, **page_args) }}">
+                        {% else %}
+                        <a class="page-link btn-cool ms-2" href="{{ url_for('blog', page=posts.next_num, **page_args) }}">
+                        {% endif %}
                             下一页<i class="fas fa-chevron-right ms-1"></i>
                         </a>
                     </li>
@@ -3606,6 +5198,74 @@ BLOG_TEMPLATE = '''
     </div>
 
     ''' + BASE_JAVASCRIPT + '''
+    <script>
+        // 搜索联想：停止输入150ms后请求，新的输入会取消上一次请求
+        (function () {
+            const input = document.getElementById('blog-search');
+            const box = document.getElementById('search-suggestions');
+            const typeNames = {post: '文章', tag: '标签', category: '分类'};
+            let timer = null;
+            let controller = null;
+            let active = -1;
+
+            function hide() {
+                box.style.display = 'none';
+                active = -1;
+            }
+
+            function render(items) {
+                box.innerHTML = '';
+                items.forEach(item => {
+                    const link = document.createElement('a');
+                    link.href = item.url;
+                    const text = document.createElement('span');
+                    text.textContent = item.text;
+                    const type = document.createElement('small');
+                    type.textContent = typeNames[item.type] || '';
+                    link.append(text, type);
+                    box.appendChild(link);
+                });
+                active = -1;
+                box.style.display = items.length ? 'block' : 'none';
+            }
+
+            input.addEventListener('input', () => {
+                clearTimeout(timer);
+                const q = input.value.trim();
+                if (!q) {
+                    hide();
+                    return;
+                }
+                timer = setTimeout(() => {
+                    if (controller) controller.abort();
+                    controller = new AbortController();
+                    fetch('/api/search/suggest?q=' + encodeURIComponent(q), {signal: controller.signal})
+                        .then(response => response.json())
+                        .then(data => render(data.suggestions))
+                        .catch(() => {});
+                }, 150);
+            });
+
+            input.addEventListener('keydown', event => {
+                const links = box.querySelectorAll('a');
+                if (box.style.display !== 'block' || !links.length) return;
+                if (event.key === 'ArrowDown' || event.key === 'ArrowUp') {
+                    event.preventDefault();
+                    active = (active + (event.key === 'ArrowDown' ? 1 : links.length - 1)) % links.length;
+                    links.forEach((link, i) => link.classList.toggle('active', i === active));
+                } else if (event.key === 'Enter' && active >= 0) {
+                    event.preventDefault();
+                    location.href = links[active].href;
+                } else if (event.key === 'Escape') {
+                    hide();
+                }
+            });
+
+            document.addEventListener('click', event => {
+                if (!box.contains(event.target) && event.target !== input) hide();
+            });
+        })();
+    </script>
 </body>
 </html>
 '''
@@ -5636,6 +7296,9 @@ POST_TEMPLATE = '''
                             <span class="me-4">
                                 <i class="fas fa-eye me-2"></i>{{ post.view_count }} 次浏览
                             </span>
+                            <span class="me-4">
+                                <i class="fas fa-clock me-2"></i>约 {{ post.get_reading_time() }} 分钟
+                            </span>
                             <span class="me-4">
                                 <i class="fas fa-user me-2"></i>{{ post.author.username }}
                             </span>
@@ -9941,7 +11604,12 @@ def api_admin_posts():
     if not session.get('admin_logged_in'):
         return jsonify({'error': '未授权'}), 401
 
-    posts = Post.query.order_by(Post.created_at.desc()).all()
+    posts = Post.query.options(
+        db.load_only(Post.id, Post.title, Post.slug, Post.category_id, Post.is_published,
+                     Post.created_at, Post.view_count),
+        db.joinedload(Post.category).load_only(Category.name),
+        db.lazyload(Post.tags)
+    ).order_by(Post.created_at.desc()).all()
     posts_data = []
     for post in posts:
         posts_data.append({
@@ -9961,7 +11629,7 @@ def api_get_post(post_id):
     if not session.get('admin_logged_in'):
         return jsonify({'error': '未授权'}), 401
 
-    post = Post.query.get_or_404(post_id)
+    post = Post.query.options(db.lazyload(Post.tags)).filter_by(id=post_id).first_or_404()
     post_data = {
         'id': post.id,
         'title': post.title,
@@ -9973,7 +11641,8 @@ def api_get_post(post_id):
         'is_featured': post.is_featured,
         'created_at': post.created_at.strftime('%Y-%m-%d %H:%M'),
         'updated_at': post.updated_at.strftime('%Y-%m-%d %H:%M'),
-        'view_count': post.view_count
+        'view_count': post.view_count,
+        'unique_readers': count_post_readers([post.id]).get(post.id, 0)
     }
 
     return jsonify({'post': post_data})
@@ -10027,9 +11696,12 @@ def api_create_post():
             created_at=datetime.now(),
             updated_at=datetime.now()
         )
+        refresh_post_render(new_post)
 
         db.session.add(new_post)
         db.session.commit()
+        if new_post.is_published:
+            export_post_pages(new_post, membership_changed=True)
 
         return jsonify({'message': '文章创建成功', 'post_id': new_post.id})
 
@@ -10045,6 +11717,7 @@ def api_update_post(post_id):
 
     post = Post.query.get_or_404(post_id)
     data = request.get_json()
+    previous = (post.is_published, post.category_id)
 
     post.title = data['title']
     post.content = data['content']
@@ -10052,8 +11725,11 @@ def api_update_post(post_id):
     post.category_id = data.get('category_id')
     post.is_published = data.get('is_published', False)
     post.updated_at = datetime.now()
+    refresh_post_render(post)
 
     db.session.commit()
+    export_post_pages(post, membership_changed=previous != (post.is_published, post.category_id),
+                      previous_category_id=previous[1])
 
     return jsonify({'message': '文章更新成功'})
 
@@ -10063,8 +11739,10 @@ def api_delete_post(post_id):
         return jsonify({'error': '未授权'}), 401
 
     post = Post.query.get_or_404(post_id)
+    snapshot = (post.slug, post.category_id, [tag.id for tag in post.tags])
     db.session.delete(post)
     db.session.commit()
+    export_deleted_post_pages(*snapshot)
 
     return jsonify({'message': '文章删除成功'})
 
@@ -10075,6 +11753,7 @@ def api_admin_categories():
         return jsonify({'error': '未授权'}), 401
 
     categories = Category.query.all()
+    post_counts = get_entity_counters('category', [category.id for category in categories], 'posts')
     categories_data = []
     for category in categories:
         categories_data.append({
@@ -10083,7 +11762,7 @@ def api_admin_categories():
             'description': category.description,
             'color': category.color,
             'icon': category.icon,
-            'post_count': category.posts.count()  # 使用count()方法而不是len()
+            'post_count': post_counts[category.id]
         })
 
     return jsonify({'categories': categories_data})
@@ -10100,7 +11779,7 @@ def api_get_category(category_id):
         'description': category.description,
         'color': category.color,
         'icon': category.icon,
-        'post_count': category.posts.count()
+        'post_count': get_entity_counters('category', [category.id], 'posts')[category.id]
     }
 
     return jsonify({'category': category_data})
@@ -10673,6 +12352,328 @@ def api_logout_all_sessions():
         print(f"退出所有会话错误: {e}")
         return jsonify({'error': f'操作失败: {str(e)}'}), 500
 
+@app.route('/api/admin/sql-stats', methods=['GET', 'DELETE'])
+def api_sql_stats():
+    """SQL统计汇总（当前worker），DELETE清空"""
+    if not session.get('admin_logged_in'):
+        return jsonify({'error': '未授权'}), 401
+
+    if request.method == 'DELETE':
+        sql_stats.reset()
+        return jsonify({'message': 'SQL统计已清空'})
+    return jsonify(sql_stats.report())
+
+# ==================== 模板注册 ====================
+
+PAGE_TEMPLATES = {
+    'index.html': INDEX_TEMPLATE,
+    'blog.html': BLOG_TEMPLATE,
+    'post.html': POST_TEMPLATE,
+    'projects.html': PROJECTS_TEMPLATE,
+    'project_detail.html': PROJECT_DETAIL_TEMPLATE,
+    'timeline.html': TIMELINE_TEMPLATE,
+    'links.html': LINKS_TEMPLATE,
+    'about.html': ABOUT_TEMPLATE,
+    'login.html': LOGIN_TEMPLATE,
+    'admin/dashboard.html': ADMIN_DASHBOARD_TEMPLATE,
+    'admin/settings.html': ADMIN_SETTINGS_TEMPLATE,
+    'admin/account.html': ADMIN_ACCOUNT_TEMPLATE,
+}
+
+# 模板内容变化（重新部署）时，条件请求的ETag随之失效
+TEMPLATE_VERSION = hashlib.sha1(''.join(PAGE_TEMPLATES.values()).encode('utf-8')).hexdigest()[:12]
+
+def register_page_templates(app):
+    """将内置模板字符串注册到Jinja加载器，并在启动时预编译"""
+    app.jinja_loader = ChoiceLoader([DictLoader(PAGE_TEMPLATES), app.jinja_loader])
+    for name in PAGE_TEMPLATES:
+        app.jinja_env.get_template(name)
+
+register_page_templates(app)
+
+# ==================== 静态站点导出 ====================
+# 文件布局与 nginx/aublog.conf 中的 try_files 规则对应：
+#   /path        -> <输出目录>/path/index.html
+#   /path?query  -> <输出目录>/path/index-<query>.html（按原始查询串，参数顺序须与页面中的链接一致）
+
+def static_export_path(output_dir, path, query=''):
+    """URL对应的导出文件路径"""
+    filename = f'index-{query}.html' if query else 'index.html'
+    return os.path.join(output_dir, path.strip('/'), filename)
+
+def render_static_page(path, query=''):
+    """在请求上下文中直接调用页面函数渲染（不经过页面缓存、不计浏览量）"""
+    url = f'{path}?{query}' if query else path
+    with app.test_request_context(url):
+        args = request.args
+        if path == '/':
+            result = index.__wrapped__()
+        elif path == '/blog':
+            result = render_blog_page.__wrapped__(args.get('category', type=int), args.get('tag', type=int), '')
+        elif path.startswith('/post/'):
+            result = render_post_page.__wrapped__(path[len('/post/'):])
+        elif path.startswith('/project/'):
+            result = project_detail.__wrapped__(int(path[len('/project/'):]))
+        else:
+            result = {
+                '/projects': projects,
+                '/timeline': timeline,
+                '/links': links,
+                '/about': about,
+            }[path].__wrapped__()
+        response = make_response(result)
+        if response.status_code != 200:
+            return None
+        return response.get_data()
+
+def write_static_page(output_dir, path, query=''):
+    """渲染并原子写入单个页面，返回是否写入"""
+    body = render_static_page(path, query)
+    if body is None:
+        return False
+    target = static_export_path(output_dir, path, query)
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    tmp_path = f'{target}.{os.getpid()}.{threading.get_ident()}.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(body)
+    os.replace(tmp_path, target)
+    return True
+
+def remove_static_page(output_dir, path, query=''):
+    target = static_export_path(output_dir, path, query)
+    try:
+        os.remove(target)
+        os.rmdir(os.path.dirname(target))  # 目录非空时保留
+    except OSError:
+        pass
+
+def blog_listing_query(category_id=None, tag_id=None, page=None, cursor=None):
+    """
+    列表页的查询串，参数顺序与模板中 url_for('blog', page=/cursor=..., **page_args) 生成的分页链接一致：
+    page或cursor在前，然后是category、tag
+    """
+    params = (('page', page), ('cursor', cursor), ('category', category_id), ('tag', tag_id))
+    return urlencode([(name, value) for name, value in params if value is not None])
+
+def blog_listing_pages(category_id=None, tag_id=None):
+    """
+    博客列表（可按分类/标签筛选）的各页，每页是指向同一内容的一组 ('/blog', 查询串)，与页面中的分页链接对应：
+    前BLOG_OFFSET_PAGE_LIMIT页按页码，第一页还有不带page的形式；页数超过上限时有游标页，
+    游标模式下每页还能从上一页的“下一页”（上一页末篇文章的next游标）、下一页的“上一页”（下一页首篇文章的prev游标）到达
+    """
+    per_page = app.config['POSTS_PER_PAGE']
+    offset_limit = app.config['BLOG_OFFSET_PAGE_LIMIT']
+    rows = build_blog_query(category_id, tag_id).with_entities(Post.created_at, Post.id).order_by(
+        Post.created_at.desc(), Post.id.desc()).all()
+    page_count = max(1, -(-len(rows) // per_page))
+    pages = []
+    for number in range(1, page_count + 1):
+        start = (number - 1) * per_page
+        queries = [blog_listing_query(category_id, tag_id, page=number)] if number <= offset_limit else []
+        if number == 1:
+            queries.append(blog_listing_query(category_id, tag_id))
+        if page_count > offset_limit:
+            if number > 1:
+                queries.append(blog_listing_query(category_id, tag_id, cursor=encode_cursor(rows[start - 1], 'next')))
+            if number < page_count:
+                queries.append(blog_listing_query(category_id, tag_id,
+                                                  cursor=encode_cursor(rows[start + per_page], 'prev')))
+        pages.append([('/blog', query) for query in queries])
+    return pages
+
+def post_listing_page(post, category_id=None, tag_id=None):
+    """文章在某个列表中所在的页码"""
+    newer = build_blog_query(category_id, tag_id).filter(Post.created_at > post.created_at).count()
+    return newer // app.config['POSTS_PER_PAGE'] + 1
+
+def site_urls():
+    """全部需要导出的页面"""
+    urls = [('/', ''), ('/projects', ''), ('/timeline', ''), ('/links', ''), ('/about', '')]
+    listings = [(None, None)] + [(category.id, None) for category in Category.query.all()] + \
+        [(None, tag.id) for tag in Tag.query.all()]
+    for category_id, tag_id in listings:
+        urls += [url for page in blog_listing_pages(category_id, tag_id) for url in page]
+    for post in Post.query.filter_by(is_published=True).all():
+        urls.append((f'/post/{post.slug}', ''))
+    for project in Project.query.all():
+        urls.append((f'/project/{project.id}', ''))
+    return urls
+
+def export_site(output_dir):
+    """全量导出，返回导出的页面数"""
+    exported = 0
+    for path, query in site_urls():
+        if write_static_page(output_dir, path, query):
+            exported += 1
+    return exported
+
+def export_listing_pages(output_dir, listings, post=None):
+    """
+    导出列表页：post为空时导出全部页（文章增删、发布状态或分类变化，之后各页位置和游标都会移动），
+    否则只导出该文章所在的那一页（包括指向它的各种URL）
+    """
+    urls = [('/', '')]
+    for category_id, tag_id in dict.fromkeys(listings):
+        pages = blog_listing_pages(category_id, tag_id)
+        if post is None:
+            urls += [url for page in pages for url in page]
+        else:
+            urls += pages[min(post_listing_page(post, category_id, tag_id), len(pages)) - 1]
+    for path, query in dict.fromkeys(urls):
+        write_static_page(output_dir, path, query)
+
+def export_post_pages(post, membership_changed=False, previous_slug=None, previous_category_id=None):
+    """增量导出：文章页及其所在的列表页"""
+    output_dir = app.config['STATIC_EXPORT_DIR']
+    if not output_dir:
+        return
+    try:
+        if previous_slug and previous_slug != post.slug:
+            remove_static_page(output_dir, f'/post/{previous_slug}')
+        if post.is_published:
+            write_static_page(output_dir, f'/post/{post.slug}')
+        else:
+            remove_static_page(output_dir, f'/post/{post.slug}')
+
+        listings = [(None, None), (post.category_id, None)] + [(None, tag.id) for tag in post.tags]
+        if previous_category_id != post.category_id:
+            listings.append((previous_category_id, None))
+        export_listing_pages(output_dir, listings, None if membership_changed else post)
+    except Exception as e:
+        print(f"静态导出失败: {e}")
+
+def export_deleted_post_pages(slug, category_id, tag_ids):
+    """文章删除后移除文章页并重新导出它所在的列表"""
+    output_dir = app.config['STATIC_EXPORT_DIR']
+    if not output_dir:
+        return
+    try:
+        remove_static_page(output_dir, f'/post/{slug}')
+        listings = [(None, None), (category_id, None)] + [(None, tag_id) for tag_id in tag_ids]
+        export_listing_pages(output_dir, listings)
+    except Exception as e:
+        print(f"静态导出失败: {e}")
+
+def export_resource_pages(resource):
+    """非文章内容修改后重新导出受影响的页面（文章由export_post_pages处理）"""
+    output_dir = app.config['STATIC_EXPORT_DIR']
+    if not output_dir or resource == 'posts':
+        return
+    try:
+        if resource == 'categories':
+            urls = [('/', '')]
+            for category_id in [None] + [category.id for category in Category.query.all()]:
+                urls += [url for page in blog_listing_pages(category_id) for url in page]
+        elif resource == 'projects':
+            urls = [('/', ''), ('/projects', '')] + [(f'/project/{p.id}', '') for p in Project.query.all()]
+        else:
+            urls = STATIC_EXPORT_PAGES.get(resource, [])
+        for path, query in urls:
+            write_static_page(output_dir, path, query)
+    except Exception as e:
+        print(f"静态导出失败: {e}")
+
+def export_comment_pages(post_ids):
+    """评论新增、审核或删除后重新导出所在的文章页；由提交后的线程调用，自行创建应用上下文"""
+    output_dir = app.config['STATIC_EXPORT_DIR']
+    with app.app_context():
+        try:
+            for post in Post.query.filter(Post.id.in_(post_ids), Post.is_published == True):
+                write_static_page(output_dir, f'/post/{post.slug}')
+        except Exception as e:
+            print(f"静态导出失败: {e}")
+        finally:
+            db.session.remove()
+
+STATIC_EXPORT_PAGES = {
+    'timeline': [('/timeline', '')],
+    'links': [('/', ''), ('/links', '')],
+    'profile': [('/about', '')],
+    'account': [('/about', '')],
+    'settings': [('/about', '')],
+}
+
+# ==================== 命令行工具 ====================
+
+@app.cli.command('render-posts')
+@click.option('--force', is_flag=True, help='忽略内容哈希，全部重新渲染')
+@click.option('--batch-size', default=100, show_default=True, help='每批提交的文章数')
+def render_posts_command(force, batch_size):
+    """为已有文章生成/补齐渲染缓存"""
+    rendered = 0
+    last_id = 0
+    while True:
+        batch = Post.query.filter(Post.id > last_id).order_by(Post.id).limit(batch_size).all()
+        if not batch:
+            break
+        for post in batch:
+            if refresh_post_render(post, force=force):
+                rendered += 1
+        db.session.commit()
+        last_id = batch[-1].id
+    click.echo(f'✅ 已渲染 {rendered} 篇文章')
+
+@app.cli.command('export-site')
+@click.option('--output', default=None, help='输出目录，默认使用 STATIC_EXPORT_DIR 或 static_site')
+def export_site_command(output):
+    """导出所有已发布内容为静态HTML（供nginx直接提供）"""
+    output_dir = output or app.config['STATIC_EXPORT_DIR'] or 'static_site'
+    start = time.time()
+    exported = export_site(output_dir)
+    click.echo(f'✅ 已导出 {exported} 个页面到 {output_dir}，耗时 {time.time() - start:.1f}s')
+
+@app.cli.command('backfill-distances')
+@click.option('--chunk-size', default=5000, show_default=True, help='每批更新的访客数')
+@click.option('--force', is_flag=True, help='博主坐标未变化时也重新计算')
+def backfill_distances_command(chunk_size, force):
+    """AUTHOR_LAT/AUTHOR_LON变化后批量重算所有访客距离"""
+    origin = f"{app.config['AUTHOR_LAT']},{app.config['AUTHOR_LON']}"
+    marker = SiteConfig.query.filter_by(key='visitor_distance_origin').first()
+    if marker and marker.value == origin and not force:
+        click.echo(f'博主坐标未变化（{origin}），无需重算；使用 --force 强制重算')
+        return
+    start = time.time()
+    updated = backfill_visitor_distances(app.config['AUTHOR_LAT'], app.config['AUTHOR_LON'], chunk_size)
+    if marker is None:
+        marker = SiteConfig(key='visitor_distance_origin', description='访客距离计算所用的博主坐标')
+        db.session.add(marker)
+    marker.value = origin
+    db.session.commit()
+    mode = 'numpy' if np is not None else 'math'
+    click.echo(f'✅ 已重算 {updated} 位访客的距离（{mode}），耗时 {time.time() - start:.1f}s')
+
+@app.cli.command('rebuild-search-index')
+def rebuild_search_index_command():
+    """从文章表重建全文索引"""
+    start = time.time()
+    with db.engine.begin() as connection:
+        search_index.setup(connection)
+    indexed = search_index.rebuild()
+    click.echo(f'✅ 已索引 {indexed} 篇文章（{search_index.name}），耗时 {time.time() - start:.1f}s')
+
+@app.cli.command('rebuild-related-posts')
+def rebuild_related_posts_command():
+    """重新计算所有文章的相关文章"""
+    start = time.time()
+    updated = related_posts_engine.update()
+    mode = 'numpy' if np is not None else 'python'
+    click.echo(f'✅ 已计算 {updated} 篇文章的相关文章（{mode}），耗时 {time.time() - start:.1f}s')
+
+@app.cli.command('rebuild-visitor-rollups')
+def rebuild_visitor_rollups_command():
+    """从访客表重建按小时/天的访客汇总（近似值，见rebuild_visitor_rollups）"""
+    start = time.time()
+    written = rebuild_visitor_rollups(app.config['VISITOR_ROLLUP_HOURLY_DAYS'])
+    click.echo(f'✅ 已写入 {written} 行访客汇总，耗时 {time.time() - start:.1f}s')
+
+@app.cli.command('reconcile-counters')
+def reconcile_counters_command():
+    """重新统计计数表，修正与业务表的偏差"""
+    drifted = reconcile_site_counters()
+    for name in drifted:
+        click.echo(f'  已修正 {name}')
+    click.echo(f'✅ 计数校正完成，修正 {len(drifted)} 项')
+
 if __name__ == '__main__':
     print("="*60)
     print("🚀 启动功能丰富的个人博客系统")
@@ -2,7 +2,9 @@
 # -*- coding: utf-8 -*-
 
 from app import create_app, db
-from app.models import User, Post, Category, Tag, Link, Project, Timeline, Comment, SiteConfig
+from app.models import User, Post, Category, Tag, Link, Project, Timeline, Comment, SiteConfig, Visitor
+from app.utils import haversine_distances, rebuild_visitor_rollups
+import click
 import os
 
 app = create_app()
@@ -22,6 +24,58 @@ def make_shell_context():
         'SiteConfig': SiteConfig
     }
 
+@app.cli.command('render-posts')
+@click.option('--force', is_flag=True, help='忽略内容哈希，全部重新渲染')
+def render_posts_command(force):
+    """为已有文章生成/补齐渲染缓存"""
+    rendered = 0
+    last_id = 0
+    while True:
+        batch = Post.query.filter(Post.id > last_id).order_by(Post.id).limit(100).all()
+        if not batch:
+            break
+        for post in batch:
+            if post.refresh_render(force=force):
+                rendered += 1
+        db.session.commit()
+        last_id = batch[-1].id
+    click.echo(f'已渲染 {rendered} 篇文章')
+
+@app.cli.command('backfill-distances')
+@click.option('--chunk-size', default=5000, help='每批更新的访客数')
+def backfill_distances_command(chunk_size):
+    """AUTHOR_LATITUDE/AUTHOR_LONGITUDE变化后批量重算所有访客距离"""
+    origin_lat = app.config['AUTHOR_LATITUDE']
+    origin_lng = app.config['AUTHOR_LONGITUDE']
+    updated = 0
+    last_id = 0
+    while True:
+        rows = db.session.query(Visitor.id, Visitor.latitude, Visitor.longitude)\
+            .filter(Visitor.id > last_id, Visitor.latitude.isnot(None), Visitor.longitude.isnot(None))\
+            .order_by(Visitor.id).limit(chunk_size).all()
+        if not rows:
+            break
+        distances = haversine_distances([r.latitude for r in rows], [r.longitude for r in rows], origin_lat, origin_lng)
+        db.session.execute(db.update(Visitor), [
+            {'id': row.id, 'distance': distance} for row, distance in zip(rows, distances)
+        ])
+        db.session.commit()
+        updated += len(rows)
+        last_id = rows[-1].id
+    click.echo(f'已重算 {updated} 位访客的距离')
+
+@app.cli.command('rebuild-related-posts')
+def rebuild_related_posts_command():
+    """重新计算所有文章的相关文章"""
+    updated = app.extensions['related_posts'].update()
+    click.echo(f'已计算 {updated} 篇文章的相关文章')
+
+@app.cli.command('rebuild-visitor-rollups')
+def rebuild_visitor_rollups_command():
+    """从访客表重建按小时/天的访客汇总（近似值）"""
+    written = rebuild_visitor_rollups(app.config.get('VISITOR_ROLLUP_HOURLY_DAYS', 14))
+    click.echo(f'已写入 {written} 行访客汇总')
+
 def init_database():
     """初始化数据库"""
     with app.app_context():
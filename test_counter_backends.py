@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试浏览量/点赞计数后端
+共享内存后端在gunicorn preload_app（先创建、后fork）下多个worker同时累加不能丢失或重复计数
+
+用法: python test_counter_backends.py  或  pytest test_counter_backends.py
+"""
+
+import os
+import tempfile
+
+_work_dir = tempfile.mkdtemp(prefix='counter_backends_')
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(_work_dir, 'blog.db')
+os.environ['PAGE_CACHE_DIR'] = os.path.join(_work_dir, 'page_cache')
+os.environ['TEMPLATE_CACHE_DIR'] = os.path.join(_work_dir, 'jinja_cache')
+
+import fcntl
+import threading
+
+from blog_core.counters import SharedMemoryCounterBackend, MemoryCounterBackend
+from rich_blog_app import app, db, init_database, Post, PostCounters
+
+WORKERS = 4
+INCREMENTS = 2000
+
+def fork_workers(count, work):
+    """fork出count个子进程执行work(序号)，返回各子进程的退出码"""
+    pids = []
+    for index in range(count):
+        pid = os.fork()
+        if pid == 0:
+            code = 1
+            try:
+                code = work(index) or 0
+            finally:
+                os._exit(code)
+        pids.append(pid)
+    return [os.waitstatus_to_exitcode(os.waitpid(pid, 0)[1]) for pid in pids]
+
+def test_forked_worker_waits_for_parent_lock():
+    """父进程持有文件锁时，fork出的子进程累加必须等待（同一个打开的文件描述上flock不互斥）"""
+    backend = SharedMemoryCounterBackend(os.path.join(_work_dir, 'lock.bin'), slots=64)
+
+    def incr_while_locked(_):
+        worker = threading.Thread(target=backend.incr, args=('view_count', 1), daemon=True)
+        worker.start()
+        worker.join(0.5)
+        return 0 if worker.is_alive() else 1
+
+    # 只持有文件锁，模拟另一个worker正在读写
+    fcntl.flock(backend._file, fcntl.LOCK_EX)
+    try:
+        assert fork_workers(1, incr_while_locked) == [0]
+    finally:
+        fcntl.flock(backend._file, fcntl.LOCK_UN)
+    assert backend.get('view_count', 1) == 0
+
+def test_forked_workers_count_exactly():
+    """preload后fork的多个worker并发累加，总数不丢不重"""
+    backend = SharedMemoryCounterBackend(os.path.join(_work_dir, 'counts.bin'), slots=64)
+    backend.incr('view_count', 1, 5)
+
+    def work(index):
+        for i in range(INCREMENTS):
+            backend.incr('view_count', 1 + i % 3)
+            if i % 500 == 0:
+                # 并发取走增量，模拟各worker的刷写线程
+                counts = backend.collect()
+                with open(os.path.join(_work_dir, f'collected-{os.getpid()}-{i}'), 'w') as f:
+                    f.write(str(sum(counts.values())))
+
+    assert fork_workers(WORKERS, work) == [0] * WORKERS
+    collected = 0
+    for name in os.listdir(_work_dir):
+        if name.startswith('collected-'):
+            with open(os.path.join(_work_dir, name)) as f:
+                collected += int(f.read())
+    assert collected + sum(backend.collect().values()) == WORKERS * INCREMENTS + 5
+
+def test_overflow_falls_back_to_memory():
+    """槽位表满时改用进程内计数，仍能取回全部增量"""
+    backend = SharedMemoryCounterBackend(os.path.join(_work_dir, 'small.bin'), slots=2)
+    for post_id in range(1, 6):
+        backend.incr('view_count', post_id, post_id)
+    assert backend.get('view_count', 5) == 5
+    assert backend.collect() == {('view_count', post_id): post_id for post_id in range(1, 6)}
+    assert backend.pending() == 0
+
+def test_collect_reads_only_pending_slots():
+    """只有增量从0变为非0的槽位记入待写入列表，取走后列表清空，再累加时重新记入"""
+    backend = SharedMemoryCounterBackend(os.path.join(_work_dir, 'pending.bin'), slots=1024)
+    backend.incr('view_count', 3, 2)
+    backend.incr('view_count', 3)
+    backend.incr('like_count', 9)
+    assert len(backend._pending_offsets()) == 2
+    assert backend.pending() == 4
+    assert backend.collect() == {('view_count', 3): 3, ('like_count', 9): 1}
+    assert backend._pending_offsets() == [] and backend.collect() == {}
+    backend.incr('view_count', 3)
+    assert backend.collect() == {('view_count', 3): 1}
+
+def test_old_format_counts_are_carried_over():
+    """旧格式（没有待写入列表）文件里未写库的增量在升级后照常取回"""
+    path = os.path.join(_work_dir, 'old.bin')
+    slots = SharedMemoryCounterBackend.SLOT
+    with open(path, 'wb') as f:
+        f.write(SharedMemoryCounterBackend.OLD_HEADER.pack(SharedMemoryCounterBackend.OLD_MAGIC, 4))
+        f.write(slots.pack(5, 0, 7) + slots.pack(6, 1, 2) + bytes(slots.size * 2))
+    backend = SharedMemoryCounterBackend(path, slots=4)
+    assert backend.collect() == {('view_count', 5): 7, ('like_count', 6): 2}
+    backend.incr('view_count', 5)
+    assert SharedMemoryCounterBackend(path).get('view_count', 5) == 1
+
+def test_memory_backend_restore():
+    backend = MemoryCounterBackend()
+    backend.incr('like_count', 7, 2)
+    counts = backend.collect()
+    backend.restore(counts)
+    assert backend.get('like_count', 7) == 2
+
+class UnavailableBackend(MemoryCounterBackend):
+    """模拟连不上的共享后端（如Redis宕机）"""
+
+    name = 'unavailable'
+    errors = (ConnectionError,)
+
+    def incr(self, field, post_id, n=1):
+        raise ConnectionError('backend down')
+
+    def get(self, field, post_id):
+        raise ConnectionError('backend down')
+
+    def restore(self, counts):
+        raise ConnectionError('backend down')
+
+    def collect(self):
+        raise ConnectionError('backend down')
+
+def test_unavailable_backend_falls_back_to_local_counts():
+    """共享后端不可用时浏览量照常记录，改用进程内计数并写库"""
+    init_database(app)
+    counters = PostCounters(app, UnavailableBackend(), 3600)
+    with app.app_context():
+        post = Post.query.first()
+        post_id, views = post.id, post.view_count or 0
+    counters.increment(post_id)
+    counters.increment(post_id, n=2)
+    assert counters.pending(post_id) == 3
+    counters.flush()
+    with app.app_context():
+        assert db.session.get(Post, post_id).view_count == views + 3
+    assert counters.pending(post_id) == 0
+    assert counters.stats()['backend_errors'] >= 2
+
+if __name__ == '__main__':
+    for test in (test_forked_worker_waits_for_parent_lock, test_forked_workers_count_exactly,
+                 test_overflow_falls_back_to_memory, test_collect_reads_only_pending_slots,
+                 test_old_format_counts_are_carried_over, test_memory_backend_restore,
+                 test_unavailable_backend_falls_back_to_local_counts):
+        test()
+        print(f"✓ {test.__name__}")
@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试博客列表的游标分页：游标编码/解码往返，被篡改或格式不对的游标不被接受
+
+用法: python test_pagination.py  或  pytest test_pagination.py
+"""
+
+import os
+import tempfile
+
+_work_dir = tempfile.mkdtemp(prefix='pagination_')
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(_work_dir, 'blog.db')
+os.environ['PAGE_CACHE_DIR'] = os.path.join(_work_dir, 'page_cache')
+os.environ['TEMPLATE_CACHE_DIR'] = os.path.join(_work_dir, 'jinja_cache')
+
+import base64
+import json
+from datetime import datetime
+from types import SimpleNamespace
+
+from blog_core.pagination import encode_cursor, decode_cursor
+from rich_blog_app import app, db, init_database, keyset_paginate, Post
+
+def raw_cursor(payload):
+    """按游标格式手工编码任意内容"""
+    return base64.urlsafe_b64encode(json.dumps(payload).encode()).decode().rstrip('=')
+
+def test_cursor_round_trip():
+    """编码后再解码得到相同的 (created_at, id, 方向)"""
+    post = SimpleNamespace(created_at=datetime(2024, 5, 1, 10, 30, 15, 123456), id=42)
+    assert decode_cursor(encode_cursor(post)) == (post.created_at, 42, 'next')
+    assert decode_cursor(encode_cursor(post, 'next')) == (post.created_at, 42, 'next')
+    assert decode_cursor(encode_cursor(post, 'prev')) == (post.created_at, 42, 'prev')
+    # URL安全、不带填充，可直接放进查询参数
+    cursor = encode_cursor(post)
+    assert '=' not in cursor and '+' not in cursor and '/' not in cursor
+
+def test_cursor_rejects_tampered_input():
+    """改坏的、截断的或内容不合格式的游标解码为None"""
+    cursor = encode_cursor(SimpleNamespace(created_at=datetime(2024, 5, 1), id=7))
+    tampered = [
+        '',
+        'not a cursor!',
+        cursor[:-3],
+        cursor[:5] + ('A' if cursor[5] != 'A' else 'B') + cursor[6:],
+        raw_cursor(['2024-05-01T00:00:00', 7]),
+        raw_cursor(['2024-05-01T00:00:00', 7, 'x']),
+        raw_cursor(['yesterday', 7, 'n']),
+        raw_cursor(['2024-05-01T00:00:00', 'seven', 'n']),
+        raw_cursor(['2024-05-01T00:00:00', None, 'n']),
+        raw_cursor({'created_at': '2024-05-01T00:00:00', 'id': 7}),
+        raw_cursor('2024-05-01T00:00:00'),
+    ]
+    for value in tampered:
+        assert decode_cursor(value) is None, value
+
+def test_invalid_cursor_starts_from_first_page():
+    """无效游标不报错，从第一页开始"""
+    init_database(app)
+    with app.app_context():
+        for i in range(5):
+            db.session.add(Post(title=f'分页文章{i}', slug=f'pagination-post-{i}', content='内容',
+                                user_id=1, is_published=True))
+        db.session.commit()
+        query = Post.query.filter_by(is_published=True)
+        first = keyset_paginate(query, None, 3)
+        fallback = keyset_paginate(query, 'not a cursor!', 3)
+        assert [post.id for post in fallback.items] == [post.id for post in first.items]
+        assert fallback.prev_cursor is None
+
+        # 游标往返：下一页再上一页回到第一页
+        second = keyset_paginate(query, first.next_cursor, 3)
+        assert not {post.id for post in second.items} & {post.id for post in first.items}
+        back = keyset_paginate(query, second.prev_cursor, 3)
+        assert [post.id for post in back.items] == [post.id for post in first.items]
+
+if __name__ == '__main__':
+    for test in (test_cursor_round_trip, test_cursor_rejects_tampered_input, test_invalid_cursor_starts_from_first_page):
+        test()
+        print(f"✓ {test.__name__}")
@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试各路由的SQL查询预算
+数据量增加后每个路由的语句数必须不变（没有N+1），且不超过预算
+
+用法: python test_query_budget.py  或  pytest test_query_budget.py
+"""
+
+import os
+import tempfile
+
+# 必须在导入应用之前配置：独立的SQLite库，关闭整页缓存
+_work_dir = tempfile.mkdtemp(prefix='query_budget_')
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(_work_dir, 'blog.db')
+os.environ['PAGE_CACHE_ENABLED'] = 'false'
+os.environ['PAGE_CACHE_DIR'] = os.path.join(_work_dir, 'page_cache')
+os.environ['TEMPLATE_CACHE_DIR'] = os.path.join(_work_dir, 'jinja_cache')
+os.environ['SQL_INSTRUMENTATION'] = 'true'
+
+from rich_blog_app import app, db, init_database, encode_cursor, Post, Category, Tag, Comment
+
+# 路由 -> 允许的最大语句数（以管理员身份请求，含加载当前用户的1条）
+QUERY_BUDGETS = {
+    '/': 10,
+    '/blog': 5,
+    '/blog?category={category_id}': 5,
+    '/blog?tag={tag_id}': 5,
+    '/blog?cursor={cursor}': 5,
+    '/post/{slug}': 5,
+    '/admin': 5,
+    '/api/visitor-stats': 4,
+    '/api/admin/posts': 1,
+    '/api/admin/categories': 2,
+}
+
+def query_count(client, path):
+    """请求两次（第一次预热统计快照等缓存），返回第二次的SQL语句数"""
+    client.get(path)
+    response = client.get(path)
+    assert response.status_code == 200, f'{path} 返回 {response.status_code}'
+    timing = response.headers.get('Server-Timing', '')
+    return int(timing.split('desc="')[1].split()[0])
+
+def add_posts(count):
+    """批量增加文章：每篇一个新分类、三个新标签和两条已审核评论"""
+    with app.app_context():
+        start = Post.query.count()
+        for i in range(start, start + count):
+            category = Category(name=f'预算分类{i}')
+            tags = [Tag(name=f'预算标签{i}-{j}') for j in range(3)]
+            post = Post(title=f'预算文章{i}', slug=f'budget-post-{i}', content=f'# 文章{i}\n\n内容',
+                        user_id=1, is_published=True, is_featured=True, category=category, tags=tags)
+            db.session.add(post)
+            db.session.flush()
+            for j in range(2):
+                db.session.add(Comment(content=f'评论{j}', author_name='读者', author_email='reader@example.com',
+                                       post_id=post.id, is_approved=True))
+        db.session.commit()
+
+def measure(client):
+    with app.app_context():
+        post = Post.query.filter_by(is_published=True).order_by(Post.id).first()
+        params = {'slug': post.slug, 'category_id': post.category_id, 'tag_id': post.tags[0].id,
+                  'cursor': encode_cursor(post)}
+    return {route: query_count(client, route.format(**params)) for route in QUERY_BUDGETS}
+
+def make_admin_client():
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['admin_logged_in'] = True
+        session['_user_id'] = '1'
+    return client
+
+def test_query_budgets():
+    """语句数不随文章数增长，且在预算内"""
+    init_database(app)
+    client = make_admin_client()
+
+    before = measure(client)
+    add_posts(30)
+    after = measure(client)
+
+    for route, budget in QUERY_BUDGETS.items():
+        assert after[route] == before[route], f'{route}: {before[route]} -> {after[route]} 条，存在N+1查询'
+        assert after[route] <= budget, f'{route}: {after[route]} 条，超出预算 {budget}'
+
+if __name__ == '__main__':
+    init_database(app)
+    client = make_admin_client()
+    before = measure(client)
+    add_posts(30)
+    after = measure(client)
+
+    print("=" * 60)
+    print(f"{'路由':<32}{'增加前':>8}{'增加后':>8}{'预算':>8}")
+    print("-" * 60)
+    failed = False
+    for route, budget in QUERY_BUDGETS.items():
+        ok = before[route] == after[route] <= budget
+        failed = failed or not ok
+        print(f"{route:<32}{before[route]:>8}{after[route]:>8}{budget:>8}  {'✓' if ok else '✗'}")
+    print("=" * 60)
+    exit(1 if failed else 0)
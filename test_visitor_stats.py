@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试访客统计：访客批量upsert、按时段汇总、HyperLogLog草图
+
+用法: python test_visitor_stats.py  或  pytest test_visitor_stats.py
+"""
+
+import os
+import tempfile
+
+_work_dir = tempfile.mkdtemp(prefix='visitor_stats_')
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(_work_dir, 'blog.db')
+os.environ['PAGE_CACHE_DIR'] = os.path.join(_work_dir, 'page_cache')
+os.environ['TEMPLATE_CACHE_DIR'] = os.path.join(_work_dir, 'jinja_cache')
+
+from datetime import datetime, timedelta
+
+from blog_core import visitors
+from blog_core.visitors import upsert_visitors, visitor_rollup_rows, HyperLogLog, ROLLUP_TOTAL_BUCKET
+from rich_blog_app import app, db, init_database, Visitor
+
+def hit(count, last_visit, user_agent='pytest'):
+    return {'count': count, 'user_agent': user_agent, 'last_visit': last_visit}
+
+def visitor(ip):
+    return Visitor.query.filter_by(ip_address=ip).one()
+
+def check_upsert_visitors(prefix):
+    """两批访问：第一批全是新访客，第二批一个已有、一个新的"""
+    first, later = datetime(2024, 5, 1, 10, 0), datetime(2024, 5, 1, 12, 0)
+    a, b, c = f'{prefix}.0.0.1', f'{prefix}.0.0.2', f'{prefix}.0.0.3'
+    with app.app_context():
+        with db.engine.begin() as connection:
+            assert sorted(upsert_visitors(connection, Visitor.__table__, {a: hit(2, first), b: hit(1, first)})) == [a, b]
+        with db.engine.begin() as connection:
+            assert upsert_visitors(connection, Visitor.__table__, {a: hit(3, later), c: hit(1, later)}) == [c]
+
+        assert visitor(a).visit_count == 5
+        assert visitor(a).first_visit == first
+        assert visitor(a).last_visit == later
+        assert visitor(b).visit_count == 1
+        assert visitor(c).visit_count == 1
+        assert Visitor.query.filter(Visitor.ip_address.in_([a, b, c])).count() == 3
+
+def test_upsert_visitors():
+    """SQLite走 INSERT ... ON CONFLICT DO UPDATE，返回新插入的IP"""
+    init_database(app)
+    check_upsert_visitors('10')
+
+def test_upsert_visitors_without_native_upsert():
+    """不支持upsert的数据库：先查已有的IP，更新已有的、插入新的"""
+    init_database(app)
+    build_upsert = visitors.build_upsert
+    visitors.build_upsert = lambda *args: None
+    try:
+        check_upsert_visitors('11')
+    finally:
+        visitors.build_upsert = build_upsert
+
+def test_visitor_rollup_rows():
+    """同一时段内的重复访问只计一次访客，新访客只在首次访问的时段计入"""
+    day = datetime(2024, 5, 1)
+    batch = [
+        ('1.1.1.1', 'ua', day + timedelta(hours=10, minutes=5)),   # 新访客
+        ('1.1.1.1', 'ua', day + timedelta(hours=10, minutes=40)),
+        ('1.1.1.1', 'ua', day + timedelta(hours=11, minutes=10)),
+        ('2.2.2.2', 'ua', day + timedelta(hours=10, minutes=20)),  # 昨天来过
+        ('3.3.3.3', 'ua', day + timedelta(hours=10, minutes=30)),  # 今天9点来过
+    ]
+    previous_visits = {'2.2.2.2': day - timedelta(hours=3), '3.3.3.3': day + timedelta(hours=9)}
+    locations = {'1.1.1.1': ('中国', '北京'), '2.2.2.2': ('中国', '北京'), '3.3.3.3': ('美国', '纽约')}
+    rows = visitor_rollup_rows(batch, previous_visits, locations, {'1.1.1.1'})
+
+    counts = {(row['period'], row['bucket'], row['city']): (row['hits'], row['visitors'], row['new_visitors'])
+              for row in rows}
+    assert len(counts) == len(rows)
+    assert counts == {
+        ('hour', day + timedelta(hours=10), '北京'): (3, 2, 1),
+        ('hour', day + timedelta(hours=11), '北京'): (1, 1, 0),
+        ('hour', day + timedelta(hours=10), '纽约'): (1, 1, 0),
+        ('day', day, '北京'): (4, 2, 1),
+        ('day', day, '纽约'): (1, 0, 0),
+        ('total', ROLLUP_TOTAL_BUCKET, '北京'): (4, 1, 1),
+        ('total', ROLLUP_TOTAL_BUCKET, '纽约'): (1, 0, 0),
+    }
+
+def sketch(values, precision=12):
+    result = HyperLogLog(precision)
+    for value in values:
+        result.add(value)
+    return result
+
+def test_hyperloglog_count():
+    """小基数用线性计数，接近精确；大基数误差在标准误差的几倍以内"""
+    assert sketch([]).count() == 0
+    assert abs(sketch(f'ip-{i}' for i in range(100)).count() - 100) <= 2
+    assert sketch(['same'] * 1000).count() == 1
+    estimate = sketch(f'ip-{i}' for i in range(50000)).count()
+    assert abs(estimate - 50000) / 50000 < 0.05
+
+def test_hyperloglog_merge():
+    """合并等于并集的草图，重复合并不改变结果"""
+    left = sketch(f'ip-{i}' for i in range(0, 3000))
+    right = sketch(f'ip-{i}' for i in range(2000, 5000))
+    union = sketch(f'ip-{i}' for i in range(0, 5000))
+    merged = HyperLogLog(12, left.registers).merge(right)
+    assert merged.registers == union.registers
+    assert merged.merge(right).merge(left).registers == union.registers
+
+def test_hyperloglog_reduce():
+    """降精度的结果与直接用低精度统计相同；不同精度合并时降到较低的精度"""
+    values = [f'ip-{i}' for i in range(4000)]
+    assert sketch(values, 12).reduce(8).registers == sketch(values, 8).registers
+    assert sketch(values, 12).reduce(12).registers == sketch(values, 12).registers
+
+    merged = sketch(values[:2500], 12).merge(sketch(values[1500:], 10))
+    assert merged.precision == 10
+    assert merged.registers == sketch(values, 10).registers
+
+def test_hyperloglog_serialise():
+    """序列化后还原出相同的精度和寄存器，稀疏草图压缩后很小"""
+    original = sketch(f'ip-{i}' for i in range(20000))
+    restored = HyperLogLog.from_bytes(original.to_bytes())
+    assert restored.precision == original.precision
+    assert restored.registers == original.registers
+    assert restored.count() == original.count()
+    assert len(sketch(['one'], 14).to_bytes()) < 100
+
+if __name__ == '__main__':
+    for test in (test_upsert_visitors, test_upsert_visitors_without_native_upsert, test_visitor_rollup_rows,
+                 test_hyperloglog_count, test_hyperloglog_merge, test_hyperloglog_reduce,
+                 test_hyperloglog_serialise):
+        test()
+        print(f"✓ {test.__name__}")